@@ -0,0 +1,174 @@
+import json
+import os
+import re
+
+from . import imaging, notebooks
+
+# Content-addressed upload store. Every upload is saved once as
+# static/uploads/blobs/<sha256 of the uploaded bytes><ext> and shared by all
+# rows that reference it; upload_blobs(name, size, refcount, uploaded_at)
+# counts those references and is kept in sync by the write handlers.
+BLOB_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "static", "uploads", "blobs"))
+# A blob whose last reference goes away is only deleted if it was not
+# (re)uploaded within this many seconds: the editor uploads a file before the
+# row that references it is saved.
+BLOB_GRACE_SECONDS = int(os.getenv("BLOB_GRACE_SECONDS", "600"))
+
+_NAME_RE = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]{1,10}$")
+_URL_RE = re.compile(r"/(?:api/images|static/uploads)/blobs/([0-9a-f]{64}\.[a-z0-9]{1,10})")
+
+
+def blob_path(name):
+    return os.path.join(BLOB_DIR, name)
+
+
+def blob_url(name):
+    # images go through the images router (derivatives, negotiation); other
+    # files are served by the static mount
+    if name.endswith(".jpg"):
+        return f"/api/images/blobs/{name}"
+    return f"/static/uploads/blobs/{name}"
+
+
+def is_blob_name(name):
+    return bool(_NAME_RE.match(name or ""))
+
+
+def name_from_url(url):
+    if not isinstance(url, str):
+        return None
+    m = _URL_RE.search(url)
+    return m.group(1) if m else None
+
+
+def refs_in(*values):
+    """Blob names referenced by URLs (or HTML containing URLs) in ``values``."""
+    names = set()
+    for value in values:
+        if isinstance(value, list):
+            names.update(refs_in(*value))
+        elif isinstance(value, str):
+            names.update(_URL_RE.findall(value))
+    return names
+
+
+def row_refs(resource, row):
+    """Blob names referenced by a thoughts/works/analytics row (None -> empty)."""
+    if not row:
+        return set()
+    if resource == "thoughts":
+        return refs_in(row.get("featured_img"), row.get("content"))
+    if resource == "works":
+        images = row.get("images")
+        if isinstance(images, str):
+            images = _json_list(images)
+        return refs_in(images)
+    return refs_in(row.get("file_url"))
+
+
+def _json_list(value):
+    try:
+        parsed = json.loads(value)
+    except Exception:
+        return []
+    return parsed if isinstance(parsed, list) else []
+
+
+async def register(cur, name, size):
+    """Record an upload of ``name``; returns True if the blob is on disk.
+
+    Runs once the file is written. From then on a release of the same blob
+    sees a fresh ``uploaded_at`` and leaves the file alone; False means one
+    removed it between the write and this insert.
+    """
+    await cur.execute(
+        "INSERT INTO upload_blobs (name, size, refcount) VALUES (%s, %s, 0) "
+        "ON DUPLICATE KEY UPDATE uploaded_at = CURRENT_TIMESTAMP",
+        (name, size),
+    )
+    return os.path.isfile(blob_path(name))
+
+
+async def store(name, size, write):
+    """Put blob ``name`` on disk with ``await write(path)`` unless it is there, then register it.
+
+    A ``write`` that raises (an image that does not decode) leaves neither a
+    file nor an ``upload_blobs`` row behind.
+    """
+    from .db import get_aconn
+
+    path = blob_path(name)
+    while True:
+        if not os.path.isfile(path):
+            await write(path)
+        async with get_aconn() as conn:
+            async with conn.cursor() as cur:
+                if await register(cur, name, size):
+                    return
+
+
+def delete_blob(name):
+    try:
+        os.remove(blob_path(name))
+    except OSError:
+        pass
+    imaging.remove_variants(blob_path(name))
+    notebooks.remove_cells(blob_path(name))
+
+
+def sync_refs(cur, old_refs, new_refs):
+    """Queue the difference between a row's old and new blob references.
+
+    Counts move by deltas; blobs left without references (and outside the
+    upload grace period) are removed from the table. The statements go out
+    with the cursor's next execute(), and the returned list is filled with
+    the released rows ({"name": ...}) once they ran: the caller deletes the
+    files with delete_released() after the transaction has committed, so a
+    rollback never loses a file. Pass ``new_refs=set()`` when the row is
+    deleted.
+    """
+    old_refs, new_refs = set(old_refs), set(new_refs)
+    added = sorted(new_refs - old_refs)
+    removed = sorted(old_refs - new_refs)
+    released = []
+    if added:
+        placeholders = ", ".join(["%s"] * len(added))
+        cur.queue(f"UPDATE upload_blobs SET refcount = refcount + 1 WHERE name IN ({placeholders})", tuple(added))
+    if not removed:
+        return released
+    placeholders = ", ".join(["%s"] * len(removed))
+    cur.queue(f"UPDATE upload_blobs SET refcount = refcount - 1 WHERE name IN ({placeholders})", tuple(removed))
+    # the rows are locked by the UPDATE, so the DELETE removes exactly the
+    # selected ones and no other writer can release them too
+    cur.queue("SET @blob_cutoff = NOW() - INTERVAL %s SECOND", (BLOB_GRACE_SECONDS,))
+    cur.queue(
+        f"SELECT name FROM upload_blobs WHERE name IN ({placeholders}) AND refcount <= 0 "
+        "AND uploaded_at < @blob_cutoff",
+        tuple(removed),
+        into=released,
+    )
+    cur.queue(
+        f"DELETE FROM upload_blobs WHERE name IN ({placeholders}) AND refcount <= 0 AND uploaded_at < @blob_cutoff",
+        tuple(removed),
+    )
+    return released
+
+
+def delete_released(names):
+    """Delete the files of blobs sync_refs released, after its commit.
+
+    The same content may have been uploaded again since. Each name is
+    re-checked with a locking read: a registered row keeps the file, and a
+    missing one holds off a concurrent register() until the file is gone
+    (which then writes it again, see store()).
+    """
+    from .db import get_conn
+
+    with get_conn() as conn:
+        conn.begin()
+        with conn.cursor() as cur:
+            for name in names:
+                cur.execute("SELECT name FROM upload_blobs WHERE name = %s FOR UPDATE", (name,))
+                if cur.fetchone() is None:
+                    delete_blob(name)
+        conn.commit()
@@ -0,0 +1,393 @@
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import stat
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+
+from .fastjson import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# Read-through cache for public GETs. Entries are keyed by tuples whose first
+# two items are (resource, kind): ("thoughts", "slug", <slug>, <fields>) for
+# detail records and ("thoughts", "list", ...) for list pages.
+READ_CACHE_SIZE = int(os.getenv("READ_CACHE_SIZE", "1024"))
+# seconds; with per-worker caches (READ_CACHE_SHARED=0 or no shared file) this
+# also bounds staleness in other workers, which do not see this one's
+# invalidations
+READ_CACHE_TTL = float(os.getenv("READ_CACHE_TTL", "300"))
+# Keep the read cache in one shared-memory file for all workers on the host
+# (SharedTTLCache) instead of one copy per process; READ_CACHE_SHARED_MB is
+# the space for encoded entries.
+READ_CACHE_SHARED = os.getenv("READ_CACHE_SHARED", "1") == "1"
+READ_CACHE_SHARED_MB = int(os.getenv("READ_CACHE_SHARED_MB", "64"))
+_SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+# one file per user and checkout, so two deployments on a host don't share
+# entries; the file must be owned by us with mode 0600 or it is not used
+READ_CACHE_SHARED_PATH = os.getenv(
+    "READ_CACHE_SHARED_PATH",
+    os.path.join(
+        _SHM_DIR,
+        f"apujo-read-cache-{os.geteuid()}-"
+        + hashlib.sha1(os.path.dirname(os.path.abspath(__file__)).encode()).hexdigest()[:12],
+    ),
+)
+# Resolved path/stat/ETag of files served by the images router; the TTL bounds
+# how long another worker may keep serving metadata of a deleted upload
+FILE_META_CACHE_SIZE = int(os.getenv("FILE_META_CACHE_SIZE", "4096"))
+FILE_META_TTL = float(os.getenv("FILE_META_TTL", "60"))
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        if self.maxsize <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires, value = item
+            if expires < now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, resource, *slugs):
+        """Drop every list page of ``resource`` and the detail entries of ``slugs``."""
+        slugs = {s for s in slugs if s}
+        with self._lock:
+            stale = [
+                k for k in self._data
+                if k[0] == resource and (k[1] == "list" or (k[1] == "slug" and k[2] in slugs))
+            ]
+            for k in stale:
+                del self._data[k]
+            self.invalidations += len(stale)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def discard_if(self, predicate):
+        """Drop the entries whose key satisfies ``predicate``."""
+        with self._lock:
+            for k in [k for k in self._data if predicate(k)]:
+                del self._data[k]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "pid": os.getpid(),
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+class SharedTTLCache:
+    """TTLCache with the same interface, stored in an mmap'd file shared by all workers.
+
+    Layout: a header (layout, ring head, one generation counter per resource),
+    a table of fixed-size slots, and a ring buffer of JSON ``[key, value]``
+    records (datetimes are tagged so they decode as datetimes; tuples come
+    back as lists). The file is refused unless it is ours and mode 0600, and
+    nothing read from it is executed. A key hashes to one slot (a collision simply replaces the older
+    entry); the ring overwrites the oldest records when it wraps.
+
+    Writers serialize on an flock of the file; set() skips the entry instead
+    of waiting when another writer holds it, invalidations wait. Readers take
+    no lock: a slot carries a sequence number that is odd while it is being
+    rewritten, and a record is only trusted if the ring head has not lapped it
+    before and after the copy, and if the key stored with it matches.
+
+    invalidate() bumps the resource's generation; entries stored under an
+    older generation are misses in every worker from then on, so a write is
+    visible host-wide at once. It drops all of the resource's entries, not
+    just the given slugs.
+    """
+
+    _MAGIC = b"APRCACHE"
+    # magic, slots, data_size, ring head, 8 generation counters
+    _HEADER = struct.Struct("<8sQQQ8Q")
+    _HEAD_AT = 24
+    _GEN_AT = 32
+    _HEADER_SIZE = 128
+    # seq, key hash, ring position, length, generation, expiry (wall clock)
+    _SLOT = struct.Struct("<QQQQQd")
+    # generation counter per resource; the rest share one, clear() bumps the last
+    _RESOURCES = ("thoughts", "works", "analytics", "tags")
+    _OTHER = 4
+    _ALL = 7
+
+    def __init__(self, path, maxsize, ttl, data_bytes):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.slots = maxsize * 4
+        self.data_size = data_bytes
+        # the layout is part of the name: a file is never resized under
+        # workers that still map it (e.g. old workers during a reload)
+        self.path = f"{path}-{self.slots}-{data_bytes}"
+        self._data_at = self._HEADER_SIZE + self.slots * self._SLOT.size
+        self._lock = threading.Lock()
+        self._pid = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.contended = 0
+        # generation seen by each get() miss; a set() after an invalidation
+        # that raced with the load is dropped
+        self._missed = {}
+        self._attach()
+
+    def _attach(self):
+        # per process: flock does not exclude processes sharing one open file
+        if self._pid == os.getpid():
+            return
+        size = self._data_at + self.data_size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        try:
+            st = os.fstat(fd)
+            if st.st_uid != os.geteuid() or stat.S_IMODE(st.st_mode) != 0o600:
+                raise OSError(f"{self.path} is not private to this user")
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size == 0:
+                    os.ftruncate(fd, size)
+                    os.pwrite(fd, self._HEADER.pack(self._MAGIC, self.slots, self.data_size, 0, *[0] * 8), 0)
+                header = os.pread(fd, self._HEADER.size, 0)
+                if os.fstat(fd).st_size != size or self._HEADER.unpack(header)[:3] != (self._MAGIC, self.slots, self.data_size):
+                    raise OSError(f"{self.path} has an unexpected layout")
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            self._map = mmap.mmap(fd, size)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+        self._pid = os.getpid()
+
+    def _u64(self, offset):
+        # aligned 8-byte loads/stores, which do not tear on the hosts we run on
+        return struct.unpack_from("<Q", self._map, offset)[0]
+
+    def _generation_at(self, resource):
+        index = self._RESOURCES.index(resource) if resource in self._RESOURCES else self._OTHER
+        return self._GEN_AT + index * 8
+
+    def _generation(self, key):
+        return self._u64(self._generation_at(key[0])) + self._u64(self._GEN_AT + self._ALL * 8)
+
+    @staticmethod
+    def _hash(key):
+        # hash() of str is randomized per process
+        return int.from_bytes(hashlib.blake2b(repr(key).encode(), digest_size=8).digest(), "little")
+
+    def _slot_at(self, h):
+        return self._HEADER_SIZE + (h % self.slots) * self._SLOT.size
+
+    def _intact(self, pos):
+        return self._u64(self._HEAD_AT) <= pos + self.data_size
+
+    def get(self, key):
+        if self.maxsize <= 0:
+            return None
+        self._attach()
+        h = self._hash(key)
+        slot = self._slot_at(h)
+        seq, stored_hash, pos, length, generation, expires = self._SLOT.unpack_from(self._map, slot)
+        current = self._generation(key)
+        value = None
+        if seq % 2 == 0 and stored_hash == h and generation == current and self._intact(pos):
+            if expires < time.time():
+                self.expirations += 1
+            else:
+                offset = self._data_at + pos % self.data_size
+                data = self._map[offset:offset + length]
+                if self._intact(pos) and self._u64(slot) == seq:
+                    stored_key, stored_value = loads(data)
+                    if stored_key == repr(key):
+                        value = _decode(stored_value)
+        if value is None:
+            self.misses += 1
+            if len(self._missed) >= self.slots:
+                self._missed.clear()
+            self._missed[key] = current
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._attach()
+        data = dumps([repr(key), _encode(value)])
+        if len(data) > self.data_size // 8:
+            return
+        h = self._hash(key)
+        slot = self._slot_at(h)
+        # runs on the event loop: skip the entry rather than wait for another
+        # writer, the next miss stores it again
+        if not self._lock.acquire(blocking=False):
+            self.contended += 1
+            return
+        try:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.contended += 1
+                return
+            try:
+                generation = self._generation(key)
+                if self._missed.pop(key, generation) != generation:
+                    # invalidated since the miss: the value may predate the write
+                    return
+                pos = self._u64(self._HEAD_AT)
+                if pos % self.data_size + len(data) > self.data_size:
+                    # records never wrap; skip the tail of the ring
+                    pos += self.data_size - pos % self.data_size
+                # move the head first so readers of what gets overwritten back off
+                struct.pack_into("<Q", self._map, self._HEAD_AT, pos + len(data))
+                offset = self._data_at + pos % self.data_size
+                self._map[offset:offset + len(data)] = data
+                seq = self._u64(slot)
+                if seq % 2:
+                    seq += 1
+                if self._SLOT.unpack_from(self._map, slot)[1] not in (0, h):
+                    self.evictions += 1
+                struct.pack_into("<Q", self._map, slot, seq + 1)
+                self._SLOT.pack_into(self._map, slot, seq + 1, h, pos, len(data), generation, time.time() + self.ttl)
+                struct.pack_into("<Q", self._map, slot, seq + 2)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            self._lock.release()
+
+    def _bump(self, offset):
+        self._attach()
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                struct.pack_into("<Q", self._map, offset, self._u64(offset) + 1)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self.invalidations += 1
+
+    def invalidate(self, resource, *slugs):
+        """Drop every entry of ``resource`` in all workers (``slugs`` included)."""
+        self._bump(self._generation_at(resource))
+
+    def clear(self):
+        self._bump(self._GEN_AT + self._ALL * 8)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "pid": os.getpid(),
+            "shared": True,
+            "path": self.path,
+            "bytes": self._data_at + self.data_size,
+            "slots": self.slots,
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "contended": self.contended,
+        }
+
+
+_DATETIME = "\x00datetime"
+_DATE = "\x00date"
+
+
+def _encode(value):
+    # JSON with datetimes tagged as single-key objects
+    if isinstance(value, datetime):
+        return {_DATETIME: value.isoformat()}
+    if isinstance(value, date):
+        return {_DATE: value.isoformat()}
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if len(value) == 1:
+            if _DATETIME in value:
+                return datetime.fromisoformat(value[_DATETIME])
+            if _DATE in value:
+                return date.fromisoformat(value[_DATE])
+        return {k: _decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+
+def _make_read_cache():
+    if READ_CACHE_SHARED and READ_CACHE_SIZE > 0:
+        try:
+            return SharedTTLCache(READ_CACHE_SHARED_PATH, READ_CACHE_SIZE, READ_CACHE_TTL, READ_CACHE_SHARED_MB << 20)
+        except OSError:
+            logger.warning("Shared read cache unavailable at %s, using a per-worker one", READ_CACHE_SHARED_PATH, exc_info=True)
+    return TTLCache(READ_CACHE_SIZE, READ_CACHE_TTL)
+
+
+read_cache = _make_read_cache()
+file_meta_cache = TTLCache(FILE_META_CACHE_SIZE, FILE_META_TTL)
+# content hashes by (path, mtime_ns, size); only a rewrite changes the key
+file_etags = TTLCache(FILE_META_CACHE_SIZE, 24 * 3600)
@@ -0,0 +1,302 @@
+import gzip
+import mimetypes
+import os
+import threading
+import time
+
+import anyio
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import FileResponse, Response
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip is offered without it
+    brotli = None
+
+# Responses smaller than this are sent as-is; the framing overhead eats the gain
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+# Dynamic responses larger than this are streamed uncompressed instead of buffered
+COMPRESS_MAX_BUFFER = int(os.getenv("COMPRESS_MAX_BUFFER", str(8 * 1024 * 1024)))
+# Dynamic responses from this size up are compressed in a worker thread, so a
+# large body doesn't stall the event loop; smaller ones are cheaper inline
+COMPRESS_THREAD_MIN_SIZE = int(os.getenv("COMPRESS_THREAD_MIN_SIZE", str(64 * 1024)))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+# brotli quality for per-request (dynamic) responses; cached sidecars of
+# immutable uploads are built once at the maximum quality
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "5"))
+# Uploads larger than this get no sidecar and are served uncompressed
+COMPRESS_SIDECAR_MAX_SIZE = int(os.getenv("COMPRESS_SIDECAR_MAX_SIZE", str(32 * 1024 * 1024)))
+# Sidecars of files up to this size use the maximum quality (brotli 11 is
+# ~1 MB/s); larger ones use the dynamic levels above
+COMPRESS_SIDECAR_BEST_SIZE = int(os.getenv("COMPRESS_SIDECAR_BEST_SIZE", str(1024 * 1024)))
+COMPRESS_CACHE_DIR = os.getenv(
+    "COMPRESS_CACHE_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "cache", "compressed")),
+)
+
+_COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "application/x-ipynb+json",
+    "image/svg+xml",
+)
+
+# Notebooks are JSON; without this they go out as application/octet-stream
+mimetypes.add_type("application/x-ipynb+json", ".ipynb")
+
+_SUFFIX = {"br": ".br", "gzip": ".gz"}
+
+_lock = threading.Lock()
+_stats = {
+    enc: {"responses": 0, "bytes_in": 0, "bytes_out": 0, "cpu_seconds": 0.0}
+    for enc in ("br", "gzip")
+}
+_sidecar_stats = {"hits": 0, "writes": 0}
+
+
+def is_compressible(media_type):
+    if not media_type:
+        return False
+    media_type = media_type.split(";")[0].strip().lower()
+    return media_type.startswith("text/") or media_type in _COMPRESSIBLE_TYPES or media_type.endswith("+json")
+
+
+def choose_encoding(accept_encoding):
+    """Pick br or gzip from an Accept-Encoding header, honouring q=0."""
+    if not accept_encoding:
+        return None
+    offered = {}
+    for part in accept_encoding.split(","):
+        bits = part.strip().split(";")
+        name = bits[0].strip().lower()
+        q = 1.0
+        for param in bits[1:]:
+            param = param.strip()
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        offered[name] = q
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best, best_q = None, 0.0
+    for enc in candidates:
+        q = offered.get(enc, offered.get("*", 0.0))
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+def compress(data, encoding, quality=None):
+    start = time.thread_time()
+    if encoding == "br":
+        out = brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY if quality is None else quality)
+    else:
+        out = gzip.compress(data, compresslevel=COMPRESS_GZIP_LEVEL if quality is None else quality, mtime=0)
+    cpu = time.thread_time() - start
+    with _lock:
+        _stats[encoding]["cpu_seconds"] += cpu
+    return out
+
+
+def _record(encoding, bytes_in, bytes_out):
+    with _lock:
+        s = _stats[encoding]
+        s["responses"] += 1
+        s["bytes_in"] += bytes_in
+        s["bytes_out"] += bytes_out
+
+
+def compression_stats():
+    with _lock:
+        out = {enc: dict(s) for enc, s in _stats.items()}
+        out["sidecars"] = dict(_sidecar_stats)
+    for enc in ("br", "gzip"):
+        s = out[enc]
+        s["bytes_saved"] = s["bytes_in"] - s["bytes_out"]
+        s["cpu_seconds_per_response"] = s["cpu_seconds"] / s["responses"] if s["responses"] else 0.0
+    out["pid"] = os.getpid()
+    out["brotli_available"] = brotli is not None
+    return out
+
+
+def _sidecar_path(path, encoding):
+    # mirror the absolute source path under the cache dir
+    rel = os.path.abspath(path).lstrip(os.sep)
+    return os.path.join(COMPRESS_CACHE_DIR, rel + _SUFFIX[encoding])
+
+
+def ensure_sidecar(path, encoding):
+    """Return the path of a cached compressed copy of ``path``, building it if stale.
+
+    Uploaded files never change content under the same name, so the sidecar is
+    built once and reused until the source is replaced. Files over
+    COMPRESS_SIDECAR_BEST_SIZE are compressed at the dynamic quality instead
+    of the maximum; callers keep files over COMPRESS_SIDECAR_MAX_SIZE away.
+    """
+    src_stat = os.stat(path)
+    sidecar = _sidecar_path(path, encoding)
+    try:
+        if os.stat(sidecar).st_mtime >= src_stat.st_mtime:
+            with _lock:
+                _sidecar_stats["hits"] += 1
+            return sidecar
+    except FileNotFoundError:
+        pass
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) <= COMPRESS_SIDECAR_BEST_SIZE:
+        encoded = compress(data, encoding, quality=11 if encoding == "br" else 9)
+    else:
+        encoded = compress(data, encoding)
+    os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+    tmp = f"{sidecar}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(encoded)
+    os.replace(tmp, sidecar)
+    with _lock:
+        _sidecar_stats["writes"] += 1
+    return sidecar
+
+
+def remove_sidecars(path):
+    for encoding in _SUFFIX:
+        try:
+            os.remove(_sidecar_path(path, encoding))
+        except OSError:
+            pass
+
+
+async def precompressed_response(path, media_type, request_headers, headers=None):
+    """FileResponse for the cached compressed form of ``path``, or None.
+
+    None means the client, file type, size or request (ranges) doesn't call for
+    compression and the caller should serve the file unchanged.
+    """
+    if "range" in request_headers or not is_compressible(media_type):
+        return None
+    encoding = choose_encoding(request_headers.get("accept-encoding"))
+    if encoding is None:
+        return None
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return None
+    if size < COMPRESS_MIN_SIZE or size > COMPRESS_SIDECAR_MAX_SIZE:
+        return None
+    sidecar = await anyio.to_thread.run_sync(ensure_sidecar, path, encoding)
+    out_headers = dict(headers or {})
+    out_headers["Content-Encoding"] = encoding
+    out_headers["Vary"] = "Accept-Encoding"
+    etag = out_headers.pop("etag", None) or out_headers.pop("ETag", None)
+    if etag:
+        # a distinct validator per encoding
+        out_headers["ETag"] = etag[:-1] + f'-{encoding}"' if etag.endswith('"') else etag
+        inm = request_headers.get("if-none-match")
+        if inm and out_headers["ETag"] in [t.strip() for t in inm.split(",")]:
+            return Response(status_code=304, headers={"ETag": out_headers["ETag"], "Vary": "Accept-Encoding"})
+    for name in ("content-length", "Content-Length", "accept-ranges", "Accept-Ranges"):
+        out_headers.pop(name, None)
+    response = FileResponse(sidecar, media_type=media_type, headers=out_headers)
+    # sidecars are plain byte blobs; don't advertise ranges over the encoded form
+    if "accept-ranges" in response.headers:
+        del response.headers["accept-ranges"]
+    _record(encoding, size, os.path.getsize(sidecar))
+    return response
+
+
+class CompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves cached gzip/brotli sidecars of compressible files."""
+
+    async def get_response(self, path, scope):
+        response = await super().get_response(path, scope)
+        if isinstance(response, FileResponse) and response.status_code == 200:
+            encoded = await precompressed_response(
+                response.path, response.media_type, Headers(scope=scope), dict(response.headers)
+            )
+            if encoded is not None:
+                return encoded
+        return response
+
+
+class CompressionMiddleware:
+    """Compress dynamic responses (API JSON) with br or gzip.
+
+    Only responses with a known Content-Length between COMPRESS_MIN_SIZE and
+    COMPRESS_MAX_BUFFER and a compressible type are touched; streaming
+    responses, ranges and already-encoded bodies pass through unchanged.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        req_headers = Headers(scope=scope)
+        encoding = choose_encoding(req_headers.get("accept-encoding"))
+        if encoding is None or "range" in req_headers:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        chunks = []
+        passthrough = False
+
+        async def wrapped_send(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                length = headers.get("content-length")
+                if (
+                    message["status"] != 200
+                    or "content-encoding" in headers
+                    or not is_compressible(headers.get("content-type"))
+                    or length is None
+                    or not (COMPRESS_MIN_SIZE <= int(length) <= COMPRESS_MAX_BUFFER)
+                ):
+                    passthrough = True
+                    await send(message)
+                    return
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                # e.g. http.response.pathsend: the body goes out as-is, and
+                # only after its start message
+                passthrough = True
+                if start_message is not None:
+                    await send(start_message)
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            body = b"".join(chunks)
+            if len(body) >= COMPRESS_THREAD_MIN_SIZE:
+                encoded = await anyio.to_thread.run_sync(compress, body, encoding)
+            else:
+                encoded = compress(body, encoding)
+            headers = MutableHeaders(raw=start_message["headers"])
+            if len(encoded) >= len(body):
+                await send(start_message)
+                await send({"type": "http.response.body", "body": body})
+                return
+            _record(encoding, len(body), len(encoded))
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(encoded))
+            vary = headers.get("vary")
+            headers["Vary"] = f"{vary}, Accept-Encoding" if vary else "Accept-Encoding"
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                # the encoded body is a different byte sequence: only weakly equal
+                headers["ETag"] = "W/" + etag
+            await send(start_message)
+            await send({"type": "http.response.body", "body": encoded})
+
+        await self.app(scope, receive, wrapped_send)
@@ -0,0 +1,92 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Request, Response
+
+# Public GETs may be stored by browsers/CDNs but must be revalidated, which is
+# cheap now that every response carries an ETag and Last-Modified.
+CACHE_CONTROL = "no-cache"
+# Uploaded files never change content under the same URL
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+# Per-resource change counter (content_versions), bumped in the transaction
+# of every create/update/delete by repository.touch().
+LIST_VERSION_SQL = "SELECT version, changed_at FROM content_versions WHERE resource = %s"
+
+
+def detail_validators(resource: str, row_id, version, updated_at, fields=None):
+    """ETag/Last-Modified for one record (fields changes the representation).
+
+    ``version`` is the row's update counter: updated_at only has seconds, so
+    two edits within one second would otherwise share an ETag.
+    """
+    return make_etag(resource, row_id, version, fields), updated_at
+
+
+def list_validators(resource: str, key, version):
+    """Validators for a list page from its resource's content_versions row.
+
+    Every write moves the counter and changed_at, deletes included, so both
+    If-None-Match and If-Modified-Since see them. ``version`` may be None
+    before the first write.
+    """
+    version = version or {}
+    return make_etag(resource, key, version.get("version", 0)), version.get("changed_at")
+
+
+def http_date(dt: datetime) -> str:
+    # DATETIME columns are naive; the server stores UTC
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return format_datetime(dt.astimezone(timezone.utc), usegmt=True)
+
+
+def is_conditional(request: Request) -> bool:
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
+
+
+def not_modified(request: Request, etag: str, last_modified, by_date: bool = True) -> bool:
+    """Whether the request's validators still match.
+
+    Details pass ``by_date=False``: their Last-Modified is the row's
+    second-resolution updated_at, which cannot tell two edits within one
+    second apart, so only the versioned ETag is trusted.
+    """
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2)
+        tags = [t.strip() for t in inm.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    ims = request.headers.get("if-modified-since")
+    if ims and last_modified is not None and by_date:
+        try:
+            since = parsedate_to_datetime(ims)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        lm = last_modified if last_modified.tzinfo else last_modified.replace(tzinfo=timezone.utc)
+        return lm.replace(microsecond=0) <= since
+    return False
+
+
+def _headers(etag, last_modified):
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def set_validators(response: Response, etag: str, last_modified) -> None:
+    for k, v in _headers(etag, last_modified).items():
+        response.headers[k] = v
+
+
+def not_modified_response(etag: str, last_modified) -> Response:
+    return Response(status_code=304, headers=_headers(etag, last_modified))
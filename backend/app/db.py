@@ -1,8 +1,23 @@
 import os
 import json
-from contextlib import contextmanager
+import time
+import logging
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+import anyio
 import pymysql
+from pymysql.constants import CLIENT, SERVER_STATUS
 from dotenv import load_dotenv
+from . import metrics, slowlog
+
+try:
+    import aiomysql
+except ImportError:  # optional: async handlers then run on the threaded pymysql pool
+    aiomysql = None
+
+logger = logging.getLogger(__name__)
 
 # Load env from repo backend/.env.dev by default
 load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env.dev"))
@@ -13,23 +28,460 @@ DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PORT = int(os.getenv("DB_PORT", "3306"))
 DB_NAME = os.getenv("DB_NAME")
 
+# Connection pool settings. The pool lives in each worker process, so the total
+# number of MySQL connections is roughly DB_POOL_SIZE * number of workers.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+# seconds to wait for a free connection before giving up (503 to the client)
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# max lifetime of a connection in seconds; keep below MySQL's wait_timeout
+DB_POOL_MAX_LIFETIME = int(os.getenv("DB_POOL_MAX_LIFETIME", "3600"))
+# ping connections that sat idle for longer than this many seconds on checkout
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "30"))
 
-@contextmanager
-def get_conn():
-    conn = pymysql.connect(
+# Async read path (get_aconn). With DB_ASYNC=1 and aiomysql installed, async
+# handlers use a native asyncio pool; with DB_ASYNC=0 they borrow connections
+# from the pymysql pool above and run queries in worker threads.
+DB_ASYNC = os.getenv("DB_ASYNC", "1") == "1" and aiomysql is not None
+DB_ASYNC_POOL_SIZE = int(os.getenv("DB_ASYNC_POOL_SIZE", "10"))
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection became free within DB_POOL_TIMEOUT."""
+
+
+class _TimedCursor(pymysql.cursors.DictCursor):
+    # Times every statement for /metrics and the slow-query log (executemany()
+    # runs through execute() too, one statement per batch).
+    _queued = None
+
+    def queue(self, query, args=None, into=None):
+        """Send ``query`` in front of the next execute(), in the same round trip.
+
+        Rows of the queued statement are appended to ``into`` (a list) once it
+        ran; an error in any of the statements is raised by that execute().
+        """
+        if self._queued is None:
+            self._queued = []
+        self._queued.append((self.mogrify(query, args), into))
+
+    def execute(self, query, args=None):
+        queued, self._queued = self._queued, None
+        if queued:
+            query, args = ";\n".join([q for q, _ in queued] + [self.mogrify(query, args)]), None
+        start = time.perf_counter()
+        result = super().execute(query, args)
+        for _, into in queued or ():
+            if into is not None:
+                into.extend(self.fetchall())
+            self.nextset()
+        if queued:
+            result = self.rowcount
+        elapsed = time.perf_counter() - start
+        metrics.db_query.observe(elapsed, "pymysql")
+        if elapsed >= slowlog.SLOW_QUERY_SECONDS:
+            fid = slowlog.record(query, elapsed)
+            if fid is not None and not queued:
+                self._explain(fid, query, args)
+        return result
+
+    def _explain(self, fid, query, args):
+        # the result set above is already buffered, so the connection is free
+        try:
+            with self.connection.cursor(pymysql.cursors.DictCursor) as cur:
+                cur.execute("EXPLAIN " + query, args)
+                slowlog.set_explain(fid, cur.fetchall())
+        except Exception:
+            logger.debug("EXPLAIN failed for slow query %s", fid, exc_info=True)
+
+
+if aiomysql is not None:
+
+    class _TimedAsyncCursor(aiomysql.DictCursor):
+        async def execute(self, query, args=None):
+            start = time.perf_counter()
+            result = await super().execute(query, args)
+            elapsed = time.perf_counter() - start
+            metrics.db_query.observe(elapsed, "aiomysql")
+            if elapsed >= slowlog.SLOW_QUERY_SECONDS:
+                fid = slowlog.record(query, elapsed)
+                if fid is not None:
+                    await self._explain(fid, query, args)
+            return result
+
+        async def _explain(self, fid, query, args):
+            try:
+                async with self.connection.cursor(aiomysql.DictCursor) as cur:
+                    await cur.execute("EXPLAIN " + query, args)
+                    slowlog.set_explain(fid, await cur.fetchall())
+            except Exception:
+                logger.debug("EXPLAIN failed for slow query %s", fid, exc_info=True)
+
+
+def _connect():
+    return pymysql.connect(
         host=DB_HOST,
         user=DB_USER,
         password=DB_PASS,
         database=DB_NAME,
         port=DB_PORT,
         charset="utf8mb4",
-        cursorclass=pymysql.cursors.DictCursor,
+        cursorclass=_TimedCursor,
         autocommit=True,
+        # _TimedCursor.queue() sends several statements in one round trip
+        client_flag=CLIENT.MULTI_STATEMENTS,
     )
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+    """Bounded pool of pymysql connections shared by the threads of one process.
+
+    Connections are checked for age and liveness on checkout: connections older
+    than ``max_lifetime`` are replaced, and connections that were idle for more
+    than ``ping_after`` seconds are pinged before being handed out.
+    """
+
+    def __init__(self, size, timeout, max_lifetime, ping_after, connect=_connect):
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self._connect = connect
+        self._cond = threading.Condition()
+        # idle entries are [conn, created_at, last_used]
+        self._idle = deque()
+        self._open = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "timeouts": 0,
+            "created": 0,
+            "recycled": 0,
+            "ping_failures": 0,
+            "discarded": 0,
+        }
+
+    def _acquire_slot(self):
+        # returns an idle entry, or None when the caller may open a new connection
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    entry = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"no database connection available after {self.timeout:.1f}s")
+                waited = True
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._in_use += 1
+            self._stats["checkouts"] += 1
+            if waited:
+                elapsed = time.monotonic() - start
+                self._stats["waits"] += 1
+                self._stats["wait_time_total"] += elapsed
+                self._stats["wait_time_max"] = max(self._stats["wait_time_max"], elapsed)
+        return entry
+
+    def _new_entry(self):
+        conn = self._connect()
+        now = time.monotonic()
+        with self._cond:
+            self._stats["created"] += 1
+        return [conn, now, now]
+
+    def _validate(self, entry):
+        conn, created_at, last_used = entry
+        now = time.monotonic()
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            _close_quietly(conn)
+            with self._cond:
+                self._stats["recycled"] += 1
+            return self._new_entry()
+        if now - last_used > self.ping_after:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                _close_quietly(conn)
+                with self._cond:
+                    self._stats["ping_failures"] += 1
+                return self._new_entry()
+        return entry
+
+    def checkout(self):
+        entry = self._acquire_slot()
+        try:
+            entry = self._new_entry() if entry is None else self._validate(entry)
+        except Exception:
+            # could not (re)connect: give the slot back so others are not starved
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return entry
+
+    def checkin(self, entry, discard=False):
+        if discard:
+            _close_quietly(entry[0])
+        else:
+            entry[2] = time.monotonic()
+        with self._cond:
+            self._in_use -= 1
+            if discard:
+                self._open -= 1
+                self._stats["discarded"] += 1
+            else:
+                self._idle.append(entry)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            while self._idle:
+                conn = self._idle.pop()[0]
+                self._open -= 1
+                _close_quietly(conn)
+
+    def stats(self):
+        with self._cond:
+            out = dict(self._stats)
+            out.update(
+                {
+                    "pid": os.getpid(),
+                    "size": self.size,
+                    "open": self._open,
+                    "in_use": self._in_use,
+                    "idle": len(self._idle),
+                    "waiting": self._waiting,
+                }
+            )
+        checkouts = out["checkouts"] or 1
+        out["wait_time_avg"] = out["wait_time_total"] / checkouts
+        return out
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    # Pools are per process: gunicorn forks workers after import, and sockets
+    # inherited from the parent must never be shared between processes.
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ConnectionPool(DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_MAX_LIFETIME, DB_POOL_PING_AFTER)
+                _pool_pid = pid
+    return _pool
+
+
+def close_pool():
+    # idle connections only; one still checked out is closed by its process exit
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.close()
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+@contextmanager
+def get_conn():
+    pool = get_pool()
+    with metrics.db_acquire.time("pymysql"):
+        entry = pool.checkout()
+    conn = entry[0]
+    discard = False
     try:
         yield conn
+    except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+        # connection-level failure: never hand this connection out again
+        discard = True
+        raise
+    except BaseException:
+        # leave no half-finished transaction behind for the next borrower
+        try:
+            if conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                conn.rollback()
+        except Exception:
+            discard = True
+        raise
     finally:
+        if not discard and not conn.open:
+            discard = True
+        pool.checkin(entry, discard=discard)
+
+
+_apool = None
+_apool_lock = None
+
+
+async def _get_async_pool():
+    global _apool, _apool_lock
+    if _apool is None:
+        if _apool_lock is None:
+            _apool_lock = asyncio.Lock()
+        async with _apool_lock:
+            if _apool is None:
+                _apool = await aiomysql.create_pool(
+                    minsize=1,
+                    maxsize=DB_ASYNC_POOL_SIZE,
+                    pool_recycle=DB_POOL_MAX_LIFETIME,
+                    host=DB_HOST,
+                    user=DB_USER,
+                    password=DB_PASS,
+                    db=DB_NAME,
+                    port=DB_PORT,
+                    charset="utf8mb4",
+                    cursorclass=_TimedAsyncCursor,
+                    autocommit=True,
+                )
+    return _apool
+
+
+def _release_when_acquired(apool, fut):
+    # the caller gave up on ``fut``: a connection it still hands out goes back
+    def release(done):
+        if not done.cancelled() and done.exception() is None:
+            apool.release(done.result())
+
+    fut.add_done_callback(release)
+    fut.cancel()
+
+
+async def _acquire(apool, timeout):
+    # aiomysql's acquire() has no timeout, and asyncio.wait_for() loses a
+    # connection acquired just as the timeout fires
+    fut = asyncio.ensure_future(apool.acquire())
+    try:
+        done, _ = await asyncio.wait({fut}, timeout=timeout)
+    except BaseException:
+        _release_when_acquired(apool, fut)
+        raise
+    if not done:
+        _release_when_acquired(apool, fut)
+        raise PoolTimeout(f"no database connection available after {timeout:.1f}s")
+    return fut.result()
+
+
+async def close_async_pool():
+    global _apool
+    if _apool is not None:
+        _apool.close()
+        await _apool.wait_closed()
+        _apool = None
+
+
+def async_pool_stats():
+    if not DB_ASYNC:
+        return {"mode": "threaded"}
+    if _apool is None:
+        return {"mode": "aiomysql", "size": DB_ASYNC_POOL_SIZE, "open": 0, "idle": 0, "in_use": 0}
+    return {
+        "mode": "aiomysql",
+        "size": _apool.maxsize,
+        "open": _apool.size,
+        "idle": _apool.freesize,
+        "in_use": _apool.size - _apool.freesize,
+    }
+
+
+class _ThreadedCursor:
+    # Mimics the aiomysql cursor API on top of a buffered pymysql cursor. Only
+    # execute() talks to the server; fetches read rows already on the client.
+    def __init__(self, conn):
+        self._cur = conn.cursor()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self._cur.close()
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cur.lastrowid
+
+    async def execute(self, query, args=None):
+        return await anyio.to_thread.run_sync(self._cur.execute, query, args)
+
+    async def fetchone(self):
+        return self._cur.fetchone()
+
+    async def fetchall(self):
+        return self._cur.fetchall()
+
+
+class _ThreadedConn:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self):
+        return _ThreadedCursor(self._conn)
+
+
+@asynccontextmanager
+async def get_aconn():
+    """Async counterpart of get_conn() for read handlers.
+
+    Usage mirrors aiomysql: ``async with get_aconn() as conn: async with
+    conn.cursor() as cur: await cur.execute(...)``.
+    """
+    if DB_ASYNC:
+        apool = await _get_async_pool()
+        start = time.perf_counter()
         try:
+            conn = await _acquire(apool, DB_POOL_TIMEOUT)
+        finally:
+            metrics.db_acquire.observe(time.perf_counter() - start, "aiomysql")
+        try:
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
             conn.close()
-        except Exception:
-            pass
+            raise
+        finally:
+            apool.release(conn)
+        return
+
+    pool = get_pool()
+    start = time.perf_counter()
+    try:
+        entry = await anyio.to_thread.run_sync(pool.checkout)
+    finally:
+        metrics.db_acquire.observe(time.perf_counter() - start, "pymysql")
+    discard = False
+    try:
+        yield _ThreadedConn(entry[0])
+    except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+        discard = True
+        raise
+    finally:
+        pool.checkin(entry, discard=discard or not entry[0].open)
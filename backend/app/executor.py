@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# CPU-bound image work (PIL decode/resize/encode) runs in a process pool so it
+# neither blocks the event loop nor holds the GIL of the serving process.
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(min(2, os.cpu_count() or 1))))
+# jobs running + waiting per serving process; past this, uploads get a 503
+IMAGE_QUEUE_SIZE = int(os.getenv("IMAGE_QUEUE_SIZE", "8"))
+# seconds a request waits for its job before answering 504
+IMAGE_JOB_TIMEOUT = float(os.getenv("IMAGE_JOB_TIMEOUT", "60"))
+
+
+class ExecutorBusy(Exception):
+    """Raised when IMAGE_QUEUE_SIZE jobs are already queued or running."""
+
+
+class ExecutorTimeout(Exception):
+    """Raised when a job did not finish within its timeout."""
+
+
+class BoundedProcessExecutor:
+    """A process pool with a bounded backlog and per-job timeouts.
+
+    A job holds its slot until the worker process actually finishes it, even
+    if the caller stopped waiting on a timeout, so a burst of slow images can
+    never pile up more than ``queue_size`` jobs behind the pool.
+    """
+
+    def __init__(self, workers, queue_size, timeout):
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.timeout = timeout
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "timeouts": 0}
+
+    def _get_pool(self):
+        # one pool per serving process (gunicorn forks workers after import);
+        # spawn keeps the children free of the parent's sockets and threads
+        pid = os.getpid()
+        with self._lock:
+            if self._pool is None or self._pid != pid:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+                self._pid = pid
+            return self._pool
+
+    def _release(self, future, job, start):
+        failed = future.cancelled() or future.exception() is not None
+        with self._lock:
+            self._in_flight -= 1
+            self._stats["failed" if failed else "completed"] += 1
+        # queue wait included: that is what an upload waits for
+        metrics.image_jobs.observe(time.perf_counter() - start, job, "failed" if failed else "ok")
+
+    async def run(self, fn, *args, timeout=None):
+        with self._lock:
+            if self._in_flight >= self.queue_size:
+                self._stats["rejected"] += 1
+                raise ExecutorBusy(f"{self._in_flight} image jobs already queued")
+            self._in_flight += 1
+            self._stats["submitted"] += 1
+        start = time.perf_counter()
+        try:
+            future = self._get_pool().submit(fn, *args)
+        except Exception:
+            with self._lock:
+                self._in_flight -= 1
+                self._stats["failed"] += 1
+            raise
+        future.add_done_callback(lambda f: self._release(f, fn.__name__, start))
+        try:
+            # shield: a timed-out job keeps running (and keeps its slot)
+            return await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(future)), timeout or self.timeout
+            )
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise ExecutorTimeout(f"image job did not finish within {timeout or self.timeout:.0f}s")
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._stats)
+            out.update(
+                {
+                    "pid": os.getpid(),
+                    "workers": self.workers,
+                    "queue_size": self.queue_size,
+                    "in_flight": self._in_flight,
+                }
+            )
+        return out
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+image_executor = BoundedProcessExecutor(IMAGE_WORKERS, IMAGE_QUEUE_SIZE, IMAGE_JOB_TIMEOUT)
@@ -0,0 +1,83 @@
+import json
+import os
+from datetime import date, datetime
+from typing import Optional
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib encoder
+    orjson = None
+
+# Opt-in: public GETs return rows straight from the database as JSON, skipping
+# the per-row response_model validation. Rows are produced by our own SELECTs
+# and row mappers, so the validation only repeats work already done.
+FAST_JSON = os.getenv("FAST_JSON", "0") == "1"
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return jsonable_encoder(value)
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(value):
+    if orjson is not None:
+        return orjson.loads(value)
+    return json.loads(value)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def _carried_headers(response: Optional[Response]):
+    if response is None:
+        return None
+    return {k: v for k, v in response.headers.items() if k.lower() != "content-length"}
+
+
+def json_response(content, response: Optional[Response] = None) -> FastJSONResponse:
+    """Encode ``content`` directly, carrying over headers set on the injected Response."""
+    return FastJSONResponse(content, headers=_carried_headers(response))
+
+
+def raw_json_response(body: bytes, response: Optional[Response] = None) -> Response:
+    """Like json_response() for a body that is already encoded JSON."""
+    return Response(body, media_type="application/json", headers=_carried_headers(response))
+
+
+def make_row_mapper(json_columns=(), bool_columns=()):
+    """Build a function that normalizes a DB row in place.
+
+    JSON columns arrive as strings from pymysql/aiomysql and are decoded once
+    (invalid JSON becomes None); TINYINT flags become bools. Columns missing
+    from a sparse SELECT are left alone.
+    """
+    json_columns = tuple(json_columns)
+    bool_columns = tuple(bool_columns)
+
+    def map_row(row: dict) -> dict:
+        for col in json_columns:
+            value = row.get(col)
+            if value and isinstance(value, (str, bytes)):
+                try:
+                    row[col] = loads(value)
+                except Exception:
+                    row[col] = None
+        for col in bool_columns:
+            if col in row:
+                row[col] = bool(row[col])
+        return row
+
+    return map_row
@@ -0,0 +1,179 @@
+import io
+import os
+import shutil
+
+from PIL import Image, features
+
+# Largest stored width for an uploaded image; bigger uploads are scaled down
+MAX_IMAGE_WIDTH = 2000
+# Width buckets for responsive derivatives (srcset candidates)
+IMAGE_WIDTHS = sorted(
+    int(w) for w in os.getenv("IMAGE_WIDTHS", "320,640,960,1280,2000").split(",") if w.strip()
+)
+
+# Derivative formats in order of preference; AVIF/WebP only when this Pillow
+# build can encode them
+_FORMATS = [
+    ("avif", "image/avif", "AVIF", {"quality": 50, "speed": 6}),
+    ("webp", "image/webp", "WEBP", {"quality": 75, "method": 4}),
+    ("jpg", "image/jpeg", "JPEG", {"quality": 78, "optimize": True, "progressive": True}),
+]
+FORMATS = [f for f in _FORMATS if f[0] == "jpg" or features.check(f[0])]
+_BY_EXT = {f[0]: f for f in FORMATS}
+
+# Derivatives live next to the original: <dir>/_variants/<stem>/<width>.<ext>
+VARIANTS_DIR = "_variants"
+
+
+class InvalidImage(Exception):
+    """Raised when an upload does not decode as an image."""
+
+
+def save_original(source, out_path):
+    """Normalize an uploaded image (bytes or a file path) to an RGB JPEG at most MAX_IMAGE_WIDTH wide."""
+    try:
+        img = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+        img.load()
+    except (OSError, Image.DecompressionBombError) as e:
+        # UnidentifiedImageError and truncated data are OSErrors; writing the
+        # JPEG below is not covered, a full disk is not a bad upload
+        raise InvalidImage(str(e)) from e
+    if img.mode in ("RGBA", "P"):
+        img = img.convert("RGB")
+    if img.width > MAX_IMAGE_WIDTH:
+        ratio = MAX_IMAGE_WIDTH / float(img.width)
+        new_h = int(float(img.height) * ratio)
+        img = img.resize((MAX_IMAGE_WIDTH, new_h), Image.LANCZOS)
+    tmp = f"{out_path}.{os.getpid()}.tmp"
+    img.save(tmp, format="JPEG", quality=78)
+    os.replace(tmp, out_path)
+    return img.size
+
+
+def variants_dir(path):
+    head, name = os.path.split(path)
+    return os.path.join(head, VARIANTS_DIR, os.path.splitext(name)[0])
+
+
+def _widths_for(original_width):
+    widths = [w for w in IMAGE_WIDTHS if w < original_width]
+    widths.append(min(original_width, MAX_IMAGE_WIDTH))
+    return widths
+
+
+def generate_variants(path):
+    """Write every missing width/format derivative of ``path``; returns (width, height).
+
+    Existing files are kept, so calling this again for an image that is
+    already processed only costs a directory listing. Pool processes may
+    race on the same image: each writes its own temp file and renames it
+    into place, and the encodings are identical, so the last rename wins
+    harmlessly.
+    """
+    out_dir = variants_dir(path)
+    with Image.open(path) as img:
+        img.load()
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        size = img.size
+        os.makedirs(out_dir, exist_ok=True)
+        for width in _widths_for(img.width):
+            resized = None
+            for ext, _, pil_format, options in FORMATS:
+                target = os.path.join(out_dir, f"{width}.{ext}")
+                if os.path.exists(target):
+                    continue
+                if resized is None:
+                    height = max(1, round(img.height * width / img.width))
+                    resized = img if width == img.width else img.resize((width, height), Image.LANCZOS)
+                tmp = f"{target}.{os.getpid()}.tmp"
+                resized.save(tmp, format=pil_format, **options)
+                os.replace(tmp, target)
+    return size
+
+
+def process_upload(source, out_path):
+    """Whole upload pipeline for one image; runs in the image process pool."""
+    size = save_original(source, out_path)
+    generate_variants(out_path)
+    return size
+
+
+def remove_variants(path):
+    # serving process only; the pool children never import the caches
+    from .cache import file_meta_cache
+
+    shutil.rmtree(variants_dir(path), ignore_errors=True)
+    # the upload is going away: forget what the images router cached about it
+    # (its keys are ("images", <category>, <filename>, ...))
+    category, filename = os.path.basename(os.path.dirname(path)), os.path.basename(path)
+    file_meta_cache.discard_if(lambda key: key[:3] == ("images", category, filename))
+
+
+def available_widths(path):
+    try:
+        names = os.listdir(variants_dir(path))
+    except FileNotFoundError:
+        return []
+    return sorted({int(n.split(".")[0]) for n in names if n.split(".")[0].isdigit() and not n.endswith(".tmp")})
+
+
+def accepted_formats(accept):
+    """The AVIF/WebP extensions an ``Accept`` header allows (JPEG always is)."""
+    return tuple(ext for ext, mime, _, _ in FORMATS if ext != "jpg" and _accepts(accept, mime))
+
+
+def _accepts(accept, mime):
+    if not accept:
+        return False
+    for part in accept.split(","):
+        bits = part.strip().split(";")
+        if bits[0].strip().lower() == mime:
+            return not any(b.strip() in ("q=0", "q=0.0") for b in bits[1:])
+    return False
+
+
+def pick_variant(path, width=None, accept=None, fmt=None):
+    """Path and media type of the best derivative for a request, or None.
+
+    ``width`` picks the smallest bucket at least that wide (the largest one if
+    none is); ``fmt`` forces a format, otherwise the first of AVIF/WebP that the
+    ``Accept`` header lists is used, falling back to JPEG.
+    """
+    widths = available_widths(path)
+    if not widths:
+        return None
+    if width:
+        chosen = next((w for w in widths if w >= width), widths[-1])
+    else:
+        chosen = widths[-1]
+    if fmt:
+        candidates = [_BY_EXT[fmt]] if fmt in _BY_EXT else []
+    else:
+        candidates = [f for f in FORMATS if f[0] == "jpg" or _accepts(accept, f[1])]
+    for ext, mime, _, _ in candidates:
+        target = os.path.join(variants_dir(path), f"{chosen}.{ext}")
+        if os.path.isfile(target):
+            return target, mime
+    return None
+
+
+def manifest(url, path, size=None):
+    """srcset-ready description of an uploaded image served from ``url``."""
+    widths = available_widths(path)
+    if size is None:
+        with Image.open(path) as img:
+            size = img.size
+    return {
+        "url": url,
+        "width": size[0],
+        "height": size[1],
+        "widths": widths,
+        "sources": [
+            {
+                "type": mime,
+                "srcset": ", ".join(f"{url}?w={w}&format={ext} {w}w" for w in widths),
+            }
+            for ext, mime, _, _ in FORMATS
+        ],
+    }
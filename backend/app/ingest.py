@@ -0,0 +1,152 @@
+import hashlib
+import os
+import tempfile
+
+import anyio
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+
+from . import metrics
+
+# Uploads are copied to disk in chunks of this size, so the memory an upload
+# needs does not grow with the file (Starlette itself spools file parts to a
+# temporary file past 1 MB while parsing the form).
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+_MB = 1024 * 1024
+MAX_UPLOAD_BYTES = {
+    "thoughts": int(float(os.getenv("UPLOAD_MAX_MB_THOUGHTS", "20")) * _MB),
+    "works": int(float(os.getenv("UPLOAD_MAX_MB_WORKS", "20")) * _MB),
+    "analytics": int(float(os.getenv("UPLOAD_MAX_MB_ANALYTICS", "100")) * _MB),
+}
+# room for multipart boundaries and the other form fields
+_FORM_OVERHEAD = 256 * 1024
+
+
+def max_upload_bytes(category):
+    return MAX_UPLOAD_BYTES.get(category, MAX_UPLOAD_BYTES["thoughts"])
+
+
+def _too_large(limit):
+    return HTTPException(status_code=413, detail=f"Upload exceeds the {limit / _MB:g} MB limit")
+
+
+async def receive_upload(file, dest_dir, max_bytes, category="other"):
+    """Copy an UploadFile into a temporary file inside ``dest_dir``.
+
+    Returns ``(tmp_path, sha256_hex, size)``. The temporary file sits on the
+    same filesystem as its destination so it can be moved into place with
+    os.replace(); it is removed again if the upload is too large or fails.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dest_dir, prefix=".upload-", suffix=".part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                metrics.upload_bytes.inc(category, amount=len(chunk))
+                if size > max_bytes:
+                    metrics.uploads.inc(category, "too_large")
+                    raise _too_large(max_bytes)
+                digest.update(chunk)
+                await anyio.to_thread.run_sync(out.write, chunk)
+    except BaseException:
+        discard(tmp_path)
+        raise
+    metrics.uploads.inc(category, "received")
+    return tmp_path, digest.hexdigest(), size
+
+
+def commit(tmp_path, final_path):
+    # atomic on the same filesystem: readers see the old name or the whole file
+    os.replace(tmp_path, final_path)
+
+
+def discard(tmp_path):
+    try:
+        os.remove(tmp_path)
+    except OSError:
+        pass
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class UploadLimitMiddleware:
+    """Reject upload requests whose body is larger than the route's limit.
+
+    A declared Content-Length over the limit is refused before any of the
+    body is read; chunked bodies are cut off as soon as they cross it.
+    """
+
+    def __init__(self, app, limits=None):
+        self.app = app
+        self.limits = limits or {
+            "/api/uploads": max(MAX_UPLOAD_BYTES["thoughts"], MAX_UPLOAD_BYTES["works"]),
+            "/api/analytics": MAX_UPLOAD_BYTES["analytics"],
+        }
+
+    def _limit_for(self, scope):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT"):
+            return None
+        for prefix, limit in self.limits.items():
+            if scope["path"].startswith(prefix):
+                return limit + _FORM_OVERHEAD
+        return None
+
+    async def __call__(self, scope, receive, send):
+        limit = self._limit_for(scope)
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > limit:
+                await self._reject(scope, receive, send, limit)
+                return
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            # body parsing may turn our exception into its own error response;
+            # once the limit was crossed, that response is replaced by the 413
+            if exceeded:
+                return
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded or started:
+                raise
+        if exceeded and not started:
+            await self._reject(scope, receive, send, limit)
+
+    async def _reject(self, scope, receive, send, limit):
+        metrics.uploads.inc(scope["path"].split("/")[2], "too_large")
+        response = JSONResponse(
+            status_code=413,
+            content={"detail": f"Upload exceeds the {(limit - _FORM_OVERHEAD) / _MB:g} MB limit"},
+            headers={"Connection": "close"},
+        )
+        await response(scope, receive, send)
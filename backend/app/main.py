@@ -1,13 +1,41 @@
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 import os
+import asyncio
 import logging
-from .routers import thoughts, works, auth, uploads, images, analytics
+import anyio
+from .db import PoolTimeout, close_async_pool, close_pool
+from .executor import ExecutorBusy, ExecutorTimeout, image_executor
+from .repository import Conflict, NotFound
+from .compression import CompressionMiddleware, CompressedStaticFiles
+from .ingest import UploadLimitMiddleware
+from .metrics import MetricsMiddleware
+from . import search, orphans, metrics, snapshots
+from .routers import thoughts, works, auth, uploads, images, analytics, admin
+from .routers import search as search_router, tags as tags_router
 
 
 app = FastAPI(title="A-Pujo Backend")
 
 logger = logging.getLogger(__name__)
+
+# Background loops started at startup. The event loop only keeps weak
+# references to tasks, so they are held here until shutdown cancels them.
+_background_tasks = set()
+
+
+def _task_done(task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background task %s stopped", task.get_name(), exc_info=task.exception())
+
+
+def start_background(coro, name):
+    task = asyncio.get_running_loop().create_task(coro, name=name)
+    _background_tasks.add(task)
+    task.add_done_callback(_task_done)
+    return task
+
 from fastapi.middleware.cors import CORSMiddleware
 
 # Allow CORS for local frontend during development
@@ -19,7 +47,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # let the frontend read pagination cursors from list responses
+    expose_headers=["X-Next-Cursor"],
 )
+# gzip/brotli for API responses; uploads under /static use cached sidecars
+app.add_middleware(CompressionMiddleware)
+# refuse oversized upload bodies before they are read (see app/ingest.py)
+app.add_middleware(UploadLimitMiddleware)
+# outermost: times the whole request, including the middlewares above
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(thoughts.router)
 app.include_router(works.router)
@@ -27,6 +63,38 @@ app.include_router(auth.router)
 app.include_router(uploads.router)
 app.include_router(images.router)
 app.include_router(analytics.router)
+app.include_router(admin.router)
+app.include_router(search_router.router)
+app.include_router(tags_router.router)
+
+
+@app.exception_handler(PoolTimeout)
+def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    # All pooled DB connections are busy; ask the client to retry shortly
+    logger.warning("DB pool exhausted: %s", exc)
+    return JSONResponse(status_code=503, content={"detail": "Database busy, please retry"}, headers={"Retry-After": "1"})
+
+@app.exception_handler(ExecutorBusy)
+def executor_busy_handler(request: Request, exc: ExecutorBusy):
+    # Too many image jobs queued in this worker; shed load instead of queueing
+    logger.warning("Image executor busy: %s", exc)
+    return JSONResponse(status_code=503, content={"detail": "Server busy processing images, please retry"}, headers={"Retry-After": "5"})
+
+
+@app.exception_handler(ExecutorTimeout)
+def executor_timeout_handler(request: Request, exc: ExecutorTimeout):
+    logger.warning("Image job timed out: %s", exc)
+    return JSONResponse(status_code=504, content={"detail": "Image processing timed out"})
+
+
+@app.exception_handler(NotFound)
+def not_found_handler(request: Request, exc: NotFound):
+    return JSONResponse(status_code=404, content={"detail": str(exc)})
+
+
+@app.exception_handler(Conflict)
+def conflict_handler(request: Request, exc: Conflict):
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
 
 # Serve backend static files (uploads)
 # Allow overriding the static root (useful in shared hosting where project
@@ -41,7 +109,7 @@ APP_ROOT_DIR = os.getenv(
 static_dir = os.path.join(APP_ROOT_DIR, "static")
 
 if os.path.isdir(static_dir):
-    app.mount("/static", StaticFiles(directory=static_dir), name="static")
+    app.mount("/static", CompressedStaticFiles(directory=static_dir), name="static")
 
 
 @app.on_event("startup")
@@ -53,9 +121,11 @@ def ensure_upload_dirs():
         thoughts_dir = os.path.join(base, "thoughts")
         works_dir = os.path.join(base, "works")
         analytics_dir = os.path.join(base, "analytics")
+        blobs_dir = os.path.join(base, "blobs")
         os.makedirs(thoughts_dir, exist_ok=True)
         os.makedirs(works_dir, exist_ok=True)
         os.makedirs(analytics_dir, exist_ok=True)
+        os.makedirs(blobs_dir, exist_ok=True)
     except Exception:
         logger.exception("Failed to ensure upload directories")
 
@@ -70,6 +140,73 @@ def ensure_admin():
         logger.exception("Failed to ensure admin user at startup")
 
 
+@app.on_event("startup")
+async def build_search_index():
+    # Fill the in-process search index; the write handlers keep it current
+    try:
+        await anyio.to_thread.run_sync(search.rebuild_index)
+    except Exception:
+        logger.exception("Failed to build search index at startup")
+    if isinstance(search.search_index, search.InvertedIndex) and search.SEARCH_REBUILD_INTERVAL > 0:
+        start_background(search.rebuild_periodically(), "search-rebuild")
+
+
+@app.on_event("startup")
+async def start_upload_gc():
+    # every worker schedules the collector; the file lock lets one run at a time
+    if orphans.UPLOAD_GC_INTERVAL > 0:
+        start_background(orphans.collect_periodically(), "upload-gc")
+
+
+@app.on_event("startup")
+async def start_snapshot_builder():
+    # builds missing snapshots now, then follows the write handlers' stale marks
+    if snapshots.SNAPSHOTS:
+        start_background(snapshots.build_periodically(), "snapshot-builder")
+
+
+@app.on_event("startup")
+async def start_metrics_flush():
+    if metrics.METRICS_FLUSH_INTERVAL > 0:
+        start_background(metrics.flush_periodically(), "metrics-flush")
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    # first, so no loop is mid-write while the pools below close
+    tasks = list(_background_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@app.on_event("shutdown")
+def flush_metrics():
+    # leave this worker's final counts for the archive of exited workers
+    try:
+        metrics.flush()
+    except Exception:
+        logger.exception("Failed to flush metrics")
+
+
+@app.on_event("shutdown")
+async def close_db_pools():
+    close_pool()
+    await close_async_pool()
+
+
+@app.on_event("shutdown")
+def stop_image_executor():
+    image_executor.shutdown()
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    # Prometheus scrape target, summed over all workers (see app/metrics.py)
+    body = await anyio.to_thread.run_sync(metrics.render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
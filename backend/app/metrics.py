@@ -0,0 +1,299 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Prometheus text-format metrics, aggregated across worker processes.
+#
+# Recording is lock-free: every thread writes to its own shard of plain dicts,
+# so the hot path is a dict update with no contention. Each worker writes a
+# merged snapshot to METRICS_DIR/<pid>.json every METRICS_FLUSH_INTERVAL
+# seconds; /metrics (served by any worker) sums the snapshots of all workers.
+# Counters of workers that exited are folded into an archive file so totals
+# stay monotonic; their gauges are dropped. Clear METRICS_DIR before starting
+# the server to reset all series.
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "cache", "metrics")))
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+# seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_ARCHIVE = "_exited.json"
+
+_registry = {}
+_shards = []
+_shards_guard = threading.Lock()
+_local = threading.local()
+
+
+def _shard():
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = _local.shard = {"counter": {}, "gauge": {}, "histogram": {}}
+        with _shards_guard:
+            _shards.append(shard)
+    return shard
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        _registry[name] = self
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        values = _shard()["counter"]
+        key = (self.name, labels)
+        values[key] = values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount=1):
+        # a gauge is the sum of its per-thread shards, so inc/dec may happen
+        # on different threads
+        values = _shard()["gauge"]
+        key = (self.name, labels)
+        values[key] = values.get(key, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        values = _shard()["histogram"]
+        key = (self.name, labels)
+        data = values.get(key)
+        if data is None:
+            # per-bucket counts (the last one is +Inf), then the sum
+            data = values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        data[bisect_left(self.buckets, value)] += 1
+        data[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+
+# -- metrics recorded by the app -------------------------------------------
+
+http_requests = Counter("http_requests_total", "HTTP requests by route template and status", ("method", "route", "status"))
+http_duration = Histogram("http_request_duration_seconds", "HTTP request latency by route template", ("method", "route"))
+http_in_flight = Gauge("http_requests_in_flight", "HTTP requests being served")
+db_acquire = Histogram("db_connection_acquire_seconds", "Time waiting for a pooled database connection", ("driver",))
+db_query = Histogram("db_query_duration_seconds", "Database statement execution time", ("driver",))
+image_jobs = Histogram("image_job_duration_seconds", "Image/notebook processing time in the process pool", ("job", "outcome"))
+upload_bytes = Counter("upload_bytes_total", "Bytes received in uploads", ("category",))
+uploads = Counter("uploads_total", "Uploads by outcome", ("category", "outcome"))
+
+
+# -- aggregation ---------------------------------------------------------------
+
+def snapshot():
+    """This process's values, merged over all thread shards."""
+    out = {"counter": {}, "gauge": {}, "histogram": {}}
+    with _shards_guard:
+        shards = list(_shards)
+    for shard in shards:
+        for kind in ("counter", "gauge"):
+            merged = out[kind]
+            # list(): other threads may add keys while we read
+            for key, value in list(shard[kind].items()):
+                merged[key] = merged.get(key, 0) + value
+        merged = out["histogram"]
+        for key, data in list(shard["histogram"].items()):
+            current = merged.get(key)
+            merged[key] = list(data) if current is None else [a + b for a, b in zip(current, data)]
+    return out
+
+
+def _encode(snap):
+    return {kind: [[name, list(labels), value] for (name, labels), value in values.items()] for kind, values in snap.items()}
+
+
+def _decode(data):
+    return {kind: {(name, tuple(labels)): value for name, labels, value in data.get(kind, [])} for kind in ("counter", "gauge", "histogram")}
+
+
+def _write_json(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def flush():
+    """Publish this worker's snapshot for the other workers' /metrics."""
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    _write_json(os.path.join(METRICS_DIR, f"{os.getpid()}.json"), _encode(snapshot()))
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _add(total, snap, kinds=("counter", "gauge", "histogram")):
+    for kind in kinds:
+        merged = total[kind]
+        for key, value in snap[kind].items():
+            if kind == "histogram":
+                current = merged.get(key)
+                merged[key] = list(value) if current is None else [a + b for a, b in zip(current, value)]
+            else:
+                merged[key] = merged.get(key, 0) + value
+
+
+def collect():
+    """Sum of the snapshots of every worker (this one read live)."""
+    flush()
+    total = {"counter": {}, "gauge": {}, "histogram": {}}
+    with open(os.path.join(METRICS_DIR, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive_path = os.path.join(METRICS_DIR, _ARCHIVE)
+        archive = _decode(_read_json(archive_path) or {})
+        archived = False
+        for name in os.listdir(METRICS_DIR):
+            stem, ext = os.path.splitext(name)
+            if ext != ".json" or not stem.isdigit():
+                continue
+            path = os.path.join(METRICS_DIR, name)
+            if int(stem) == os.getpid():
+                _add(total, snapshot())
+                continue
+            data = _read_json(path)
+            if data is None:
+                continue
+            if _alive(int(stem)):
+                _add(total, _decode(data))
+            else:
+                _add(archive, _decode(data), kinds=("counter", "histogram"))
+                os.remove(path)
+                archived = True
+        if archived:
+            _write_json(archive_path, _encode(archive))
+    _add(total, archive, kinds=("counter", "histogram"))
+    return total
+
+
+def _labels(metric, values, extra=()):
+    pairs = list(zip(metric.labels, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(total=None):
+    """Prometheus text exposition format (version 0.0.4)."""
+    total = collect() if total is None else total
+    lines = []
+    for name, metric in sorted(_registry.items()):
+        series = sorted((labels, value) for (n, labels), value in total[metric.kind].items() if n == name)
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        if metric.kind != "histogram":
+            if not series and not metric.labels:
+                series = [((), 0)]
+            lines.extend(f"{name}{_labels(metric, labels)} {_number(value)}" for labels, value in series)
+            continue
+        for labels, data in series:
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (float("inf"),), data):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(metric, labels, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(metric, labels)} {_number(data[-1])}")
+            lines.append(f"{name}_count{_labels(metric, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+async def flush_periodically():
+    """Background task: publish this worker's snapshot every METRICS_FLUSH_INTERVAL."""
+    import anyio
+
+    while True:
+        await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            await anyio.to_thread.run_sync(flush)
+        except Exception:
+            logger.exception("Metrics flush failed")
+
+
+class MetricsMiddleware:
+    """Count and time every HTTP request by its route template.
+
+    The template (``/api/thoughts/{slug}``) is read from the matched route
+    after the request was handled, so label cardinality stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec()
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "<unmatched>"
+            method = scope["method"]
+            http_duration.observe(time.perf_counter() - start, method, template)
+            http_requests.inc(method, template, str(status))
@@ -0,0 +1,235 @@
+import base64
+import copy
+import hashlib
+import json
+import os
+import shutil
+from array import array
+
+# Uploaded .ipynb files are parsed once into a compact per-cell store next to
+# the file: <dir>/_cells/<name>/{cells.ndjson, cells.idx, slim.ipynb, meta.json}.
+# cells.ndjson holds one JSON cell per line, cells.idx the byte offset of each
+# line (plus the end offset), so a page of cells is one seek + one read no
+# matter how large the notebook is. meta.json is written last and marks the
+# store as complete.
+CELLS_DIR = "_cells"
+# Notebooks are fetched a page of cells at a time; pages are capped at this
+MAX_CELLS_PAGE = 100
+
+# Large embedded outputs (base64 images, HTML/SVG plots) are moved out of the
+# notebook into content-addressed files served by the images router, and
+# replaced by references; slim.ipynb is the notebook with those references.
+ASSET_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "static", "uploads", "analytics"))
+ASSET_URL = "/api/images/analytics/"
+ASSET_PREFIX = "nb-"
+NOTEBOOK_ASSET_MIN_BYTES = int(os.getenv("NOTEBOOK_ASSET_MIN_BYTES", "2048"))
+# slim.ipynb stores asset URLs behind this token; it is replaced with the
+# API's base URL when served, so the notebook renders from any origin
+API_URL_TOKEN = "{{api}}"
+
+_BINARY_ASSETS = {"image/png": ".png", "image/jpeg": ".jpg", "image/gif": ".gif"}
+_TEXT_ASSETS = {"image/svg+xml": ".svg", "text/html": ".html"}
+
+_OUTPUT_KEYS = {
+    "stream": ("name", "text"),
+    "execute_result": ("execution_count", "data", "metadata"),
+    "display_data": ("data", "metadata"),
+    "error": ("ename", "evalue", "traceback"),
+}
+
+
+def cells_dir(path):
+    head, name = os.path.split(path)
+    return os.path.join(head, CELLS_DIR, os.path.splitext(name)[0])
+
+
+def _text(value):
+    # nbformat allows multiline strings as lists of lines
+    if isinstance(value, list):
+        return "".join(str(v) for v in value)
+    return value if isinstance(value, str) else ""
+
+
+def _write_asset(content, ext):
+    name = f"{ASSET_PREFIX}{hashlib.sha256(content).hexdigest()}{ext}"
+    target = os.path.join(ASSET_DIR, name)
+    if not os.path.exists(target):
+        os.makedirs(ASSET_DIR, exist_ok=True)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(content)
+        os.replace(tmp, target)
+    return name
+
+
+def _extract(data, assets):
+    """Split a mime bundle into (compact data, asset URLs, slim bundle).
+
+    Outputs of at least NOTEBOOK_ASSET_MIN_BYTES in a known image/HTML/SVG
+    type become files; big JSON bundles (plotly, vega) are dropped when the
+    bundle has another rendering of the same output.
+    """
+    compact, urls, slim = {}, {}, {}
+    for mime, value in data.items():
+        if mime.endswith("json"):
+            # JSON mime bundles stay structured
+            compact[mime] = slim[mime] = value
+            continue
+        text = _text(value)
+        if len(text) >= NOTEBOOK_ASSET_MIN_BYTES and (mime in _BINARY_ASSETS or mime in _TEXT_ASSETS):
+            try:
+                if mime in _BINARY_ASSETS:
+                    content = base64.b64decode(text)
+                    name = _write_asset(content, _BINARY_ASSETS[mime])
+                else:
+                    name = _write_asset(text.encode("utf-8"), _TEXT_ASSETS[mime])
+            except (ValueError, OSError):
+                compact[mime] = slim[mime] = text
+                continue
+            assets.add(name)
+            urls[mime] = ASSET_URL + name
+            continue
+        compact[mime] = text
+        slim[mime] = value
+    if urls:
+        for mime in [m for m in compact if m.endswith("json")]:
+            if len(json.dumps(compact[mime])) >= NOTEBOOK_ASSET_MIN_BYTES:
+                del compact[mime], slim[mime]
+        src = API_URL_TOKEN + (urls.get("text/html") or next(iter(urls.values())))
+        if "text/html" in urls:
+            slim["text/html"] = (
+                f'<iframe src="{src}" sandbox="allow-scripts" loading="lazy" '
+                'style="width:100%;height:480px;border:0"></iframe>'
+            )
+        else:
+            slim["text/html"] = f'<img src="{src}" loading="lazy" alt="output">'
+    return compact, urls, slim
+
+
+def _output(out, assets):
+    """(compact output for the cell store, output for slim.ipynb)."""
+    kind = out.get("output_type")
+    compact = {"output_type": kind}
+    slim = copy.copy(out)
+    for key in _OUTPUT_KEYS.get(kind, ()):
+        if key not in out:
+            continue
+        value = out[key]
+        if key == "text":
+            value = _text(value)
+        elif key == "data" and isinstance(value, dict):
+            value, urls, slim["data"] = _extract(value, assets)
+            if urls:
+                compact["assets"] = urls
+        elif key == "metadata" and not value:
+            continue
+        compact[key] = value
+    return compact, slim
+
+
+def compact_cell(index, cell, assets):
+    out = {
+        "index": index,
+        "cell_type": cell.get("cell_type", "code"),
+        "source": _text(cell.get("source")),
+    }
+    slim = cell
+    if out["cell_type"] == "code":
+        out["execution_count"] = cell.get("execution_count")
+        pairs = [_output(o, assets) for o in cell.get("outputs") or [] if isinstance(o, dict)]
+        out["outputs"] = [p[0] for p in pairs]
+        slim = dict(cell, outputs=[p[1] for p in pairs])
+    if cell.get("metadata"):
+        out["metadata"] = cell["metadata"]
+    return out, slim
+
+
+def build_cells(path):
+    """Parse the notebook at ``path`` into its cell store; returns the meta dict.
+
+    CPU-bound for large notebooks, so callers run it in the process pool.
+    """
+    with open(path, "rb") as f:
+        nb = json.load(f)
+    if not isinstance(nb, dict) or not isinstance(nb.get("cells"), list):
+        raise ValueError("not a Jupyter notebook")
+
+    out_dir = cells_dir(path)
+    os.makedirs(out_dir, exist_ok=True)
+    suffix = f".{os.getpid()}.tmp"
+    offsets = array("Q")
+    assets = set()
+    slim_cells = []
+    with open(os.path.join(out_dir, "cells.ndjson" + suffix), "wb") as f:
+        for i, cell in enumerate(c for c in nb["cells"] if isinstance(c, dict)):
+            compact, slim = compact_cell(i, cell, assets)
+            slim_cells.append(slim)
+            offsets.append(f.tell())
+            f.write(json.dumps(compact, ensure_ascii=False, separators=(",", ":")).encode())
+            f.write(b"\n")
+        offsets.append(f.tell())
+    with open(os.path.join(out_dir, "cells.idx" + suffix), "wb") as f:
+        offsets.tofile(f)
+    with open(os.path.join(out_dir, "slim.ipynb" + suffix), "wb") as f:
+        f.write(json.dumps(dict(nb, cells=slim_cells), ensure_ascii=False, separators=(",", ":")).encode())
+        slim_bytes = f.tell()
+
+    metadata = nb.get("metadata") or {}
+    meta = {
+        "nbformat": nb.get("nbformat"),
+        "nbformat_minor": nb.get("nbformat_minor"),
+        "language": (metadata.get("language_info") or {}).get("name")
+        or (metadata.get("kernelspec") or {}).get("language"),
+        "kernelspec": metadata.get("kernelspec"),
+        "total": len(offsets) - 1,
+        "original_bytes": os.path.getsize(path),
+        "slim_bytes": slim_bytes,
+        "assets": sorted(assets),
+    }
+    for name in ("cells.ndjson", "cells.idx", "slim.ipynb"):
+        os.replace(os.path.join(out_dir, name + suffix), os.path.join(out_dir, name))
+    with open(os.path.join(out_dir, "meta.json" + suffix), "w") as f:
+        json.dump(meta, f)
+    os.replace(os.path.join(out_dir, "meta.json" + suffix), os.path.join(out_dir, "meta.json"))
+    return meta
+
+
+def has_cells(path):
+    out_dir = cells_dir(path)
+    # stores built before assets were extracted have no slim.ipynb: rebuild
+    return os.path.isfile(os.path.join(out_dir, "meta.json")) and os.path.isfile(os.path.join(out_dir, "slim.ipynb"))
+
+
+def read_cells(path, offset, limit):
+    """(meta, cells) for cells[offset:offset + limit] of a built store.
+
+    Only the requested byte range of cells.ndjson is read.
+    """
+    out_dir = cells_dir(path)
+    with open(os.path.join(out_dir, "meta.json")) as f:
+        meta = json.load(f)
+    total = meta["total"]
+    start = min(max(offset, 0), total)
+    stop = min(start + max(limit, 0), total)
+    if start == stop:
+        return meta, []
+    offsets = array("Q")
+    with open(os.path.join(out_dir, "cells.idx"), "rb") as f:
+        f.seek(start * offsets.itemsize)
+        offsets.fromfile(f, stop - start + 1)
+    with open(os.path.join(out_dir, "cells.ndjson"), "rb") as f:
+        f.seek(offsets[0])
+        chunk = f.read(offsets[-1] - offsets[0])
+    return meta, [json.loads(line) for line in chunk.splitlines() if line]
+
+
+def read_slim(path, api_base):
+    """slim.ipynb of a built store with asset URLs made absolute under ``api_base``."""
+    with open(os.path.join(cells_dir(path), "slim.ipynb"), "rb") as f:
+        return f.read().replace(API_URL_TOKEN.encode(), api_base.rstrip("/").encode())
+
+
+def remove_cells(path):
+    # assets are content-addressed and may be shared with other notebooks;
+    # unreferenced ones are left to the orphan sweep
+    shutil.rmtree(cells_dir(path), ignore_errors=True)
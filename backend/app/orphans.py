@@ -0,0 +1,361 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import re
+import shutil
+import time
+
+from . import blobs, compression, imaging, notebooks
+from .cache import file_meta_cache
+
+logger = logging.getLogger(__name__)
+
+# Orphaned-upload collector. Files under static/uploads/ that no thought, work
+# or analytic references (abandoned editor uploads, leftovers of failed
+# deletes, notebook assets and derivatives of removed files) are deleted once
+# they are older than the grace period. Runs in one worker at a time (file
+# lock) every UPLOAD_GC_INTERVAL seconds (0 disables), or from the admin API.
+UPLOAD_GC_INTERVAL = float(os.getenv("UPLOAD_GC_INTERVAL", "21600"))
+UPLOAD_GC_GRACE_SECONDS = int(os.getenv("UPLOAD_GC_GRACE_SECONDS", "86400"))
+# report what would be removed without touching anything
+UPLOAD_GC_DRY_RUN = os.getenv("UPLOAD_GC_DRY_RUN", "0") == "1"
+
+UPLOADS_BASE = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "static", "uploads"))
+STATE_DIR = os.getenv("UPLOAD_GC_STATE_DIR", os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "cache")))
+_INDEX_FILE = "upload_refs.json"
+_REPORT_FILE = "upload_gc_report.json"
+_LOCK_FILE = "upload_gc.lock"
+# seconds re-read before the index cursor on each refresh
+_CURSOR_OVERLAP = 300
+# ids per query when reading rows that are new to the index
+_NEW_ROWS_CHUNK = 1000
+# removed paths listed in a report (the totals always cover everything)
+_REPORT_PATHS = 200
+
+CATEGORIES = ("thoughts", "works", "analytics", "blobs")
+# the only files the collector may delete: <sha256>.<ext> blobs, legacy
+# <unix time>-<n>.<ext> uploads, and temp files of interrupted writes
+# (.upload-*.part from ingest, <name>.<pid>.tmp from the image encoder).
+# Anything else (.gitkeep, files put there by hand) is left alone.
+_UPLOAD_NAME_RE = re.compile(
+    r"^(?:[0-9a-f]{64}|\d+-\d+)\.[A-Za-z0-9]{1,10}(?:\.\d+\.tmp)?$|^\.upload-\w+\.part(?:\.\d+\.link)?$"
+)
+_REF_RE = re.compile(r"/(?:api/images|static/uploads)/(thoughts|works|analytics|blobs)/([A-Za-z0-9._-]+)")
+
+# columns that can hold upload URLs, per table
+_REF_COLUMNS = {
+    "thoughts": ("featured_img", "content"),
+    "works": ("images",),
+    "analytics": ("file_url",),
+}
+
+
+class SweepBusy(Exception):
+    """Another worker is running the collector."""
+
+
+def refs_in(*values):
+    """Upload paths ("<category>/<name>") referenced by URLs in ``values``."""
+    found = set()
+    for value in values:
+        if isinstance(value, str):
+            found.update(f"{c}/{n}" for c, n in _REF_RE.findall(value))
+    return found
+
+
+class RefIndex:
+    """Which upload paths each row references, refreshed incrementally.
+
+    A refresh re-reads rows the index does not have yet (by id: bulk imports
+    keep their source timestamps, so updated_at can't find them) and rows
+    whose ``updated_at`` moved since the last refresh (idx_*_updated); rows
+    gone from the primary key are dropped. The cursor is the database clock
+    at the start of the refresh, never a row's own timestamp. The index is
+    persisted between runs, so only the first run scans every row.
+    """
+
+    def __init__(self, refs=None, cursors=None):
+        self.refs = refs or {}
+        self.cursors = cursors or {}
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls()
+        return cls({k: set(v) for k, v in data.get("refs", {}).items()}, data.get("cursors", {}))
+
+    def save(self, path):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"refs": {k: sorted(v) for k, v in self.refs.items()}, "cursors": self.cursors}, f)
+        os.replace(tmp, path)
+
+    def refresh(self, cur):
+        """Bring the index up to date; returns the number of rows re-read."""
+        changed = 0
+        cur.execute("SELECT NOW() AS db_now")
+        now = str(cur.fetchone()["db_now"])
+        for table, columns in _REF_COLUMNS.items():
+            since = self.cursors.get(table)
+            select = f"SELECT id, {', '.join(columns)} FROM {table}"
+            cur.execute(f"SELECT id FROM {table}")
+            live = {r["id"] for r in cur.fetchall()}
+            rows = []
+            if since is None:
+                cur.execute(select)
+                rows += cur.fetchall()
+            else:
+                # overlap the last pass: transactions that committed late carry
+                # an updated_at from before the cursor
+                cur.execute(f"{select} WHERE updated_at >= %s - INTERVAL %s SECOND", (since, _CURSOR_OVERLAP))
+                rows += cur.fetchall()
+                seen = {r["id"] for r in rows}
+                new = sorted(i for i in live if i not in seen and f"{table}:{i}" not in self.refs)
+                for start in range(0, len(new), _NEW_ROWS_CHUNK):
+                    chunk = new[start:start + _NEW_ROWS_CHUNK]
+                    cur.execute(f"{select} WHERE id IN ({', '.join(['%s'] * len(chunk))})", tuple(chunk))
+                    rows += cur.fetchall()
+            for row in rows:
+                self.refs[f"{table}:{row['id']}"] = refs_in(*(row.get(c) for c in columns))
+                changed += 1
+            self.cursors[table] = now
+            # rows committed after the id scan are live too
+            live = {f"{table}:{i}" for i in live} | {f"{table}:{r['id']}" for r in rows}
+            for key in [k for k in self.refs if k.startswith(f"{table}:") and k not in live]:
+                del self.refs[key]
+        return changed
+
+    def referenced(self):
+        out = set()
+        for paths in self.refs.values():
+            out.update(paths)
+        return out
+
+
+def _tree_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class _Sweep:
+    def __init__(self, dry_run, grace, now):
+        self.dry_run = dry_run
+        self.cutoff = now - grace
+        self.removed = []
+        self.removed_count = 0
+        self.reclaimed = 0
+        self.kept_recent = 0
+        self.dead = set()
+
+    def old(self, path):
+        try:
+            return os.stat(path).st_mtime < self.cutoff
+        except OSError:
+            return False
+
+    def drop(self, path, reason):
+        size = _tree_size(path)
+        if len(self.removed) < _REPORT_PATHS:
+            self.removed.append({"path": os.path.relpath(path, UPLOADS_BASE), "bytes": size, "reason": reason})
+        self.removed_count += 1
+        self.reclaimed += size
+        self.dead.add(path)
+        if not self.dry_run:
+            _remove(path)
+
+    def live_stems(self, directory):
+        """Stems of the files in ``directory`` that survive this pass."""
+        stems = set()
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path) and path not in self.dead:
+                stems.add(os.path.splitext(name)[0])
+        return stems
+
+
+def _collect(cur, dry_run, grace):
+    started = time.time()
+    sweep = _Sweep(dry_run, grace, started)
+    index_path = os.path.join(STATE_DIR, _INDEX_FILE)
+    index = RefIndex.load(index_path)
+    rows_read = index.refresh(cur)
+    referenced = index.referenced()
+
+    # blob rows still counted as referenced, or registered within the grace
+    # period (uploaded but not yet saved into a row), are kept whatever the
+    # index says
+    cur.execute(
+        "SELECT name FROM upload_blobs WHERE refcount > 0 OR uploaded_at >= NOW() - INTERVAL %s SECOND",
+        (grace,),
+    )
+    protected_blobs = {r["name"] for r in cur.fetchall()}
+
+    scanned = 0
+    for category in CATEGORIES:
+        directory = os.path.join(UPLOADS_BASE, category)
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not os.path.isfile(path) or not _UPLOAD_NAME_RE.match(name):
+                continue
+            scanned += 1
+            if f"{category}/{name}" in referenced or (category == "blobs" and name in protected_blobs):
+                continue
+            if not sweep.old(path):
+                sweep.kept_recent += 1
+                continue
+            # includes abandoned .upload-*.part temp files
+            sweep.drop(path, "unreferenced")
+            if category == "blobs" and blobs.is_blob_name(name) and not dry_run:
+                cur.execute(
+                    "DELETE FROM upload_blobs WHERE name = %s AND refcount <= 0 "
+                    "AND uploaded_at < NOW() - INTERVAL %s SECOND",
+                    (name, grace),
+                )
+
+    # notebook assets are referenced through the cell stores of live notebooks
+    live_assets = set()
+    for category in ("analytics", "blobs"):
+        cells_root = os.path.join(UPLOADS_BASE, category, notebooks.CELLS_DIR)
+        if not os.path.isdir(cells_root):
+            continue
+        stems = sweep.live_stems(os.path.dirname(cells_root))
+        for stem in os.listdir(cells_root):
+            if stem not in stems:
+                continue
+            try:
+                with open(os.path.join(cells_root, stem, "meta.json")) as f:
+                    live_assets.update(json.load(f).get("assets") or [])
+            except (OSError, ValueError):
+                # store still being built: its assets are younger than the grace period
+                pass
+    asset_dir = notebooks.ASSET_DIR
+    if os.path.isdir(asset_dir):
+        for name in sorted(os.listdir(asset_dir)):
+            if not name.startswith(notebooks.ASSET_PREFIX) or name in live_assets:
+                continue
+            path = os.path.join(asset_dir, name)
+            if sweep.old(path):
+                sweep.drop(path, "unreferenced notebook asset")
+            else:
+                sweep.kept_recent += 1
+
+    # derivatives and cell stores whose source file is gone
+    for category in CATEGORIES:
+        directory = os.path.join(UPLOADS_BASE, category)
+        if not os.path.isdir(directory):
+            continue
+        stems = sweep.live_stems(directory)
+        for sub, reason in ((imaging.VARIANTS_DIR, "derivatives of removed file"), (notebooks.CELLS_DIR, "cell store of removed file")):
+            root = os.path.join(directory, sub)
+            if not os.path.isdir(root):
+                continue
+            for stem in sorted(os.listdir(root)):
+                if stem not in stems:
+                    sweep.drop(os.path.join(root, stem), reason)
+
+    # compressed sidecars mirror the source path under COMPRESS_CACHE_DIR
+    sidecars = 0
+    mirror = os.path.join(compression.COMPRESS_CACHE_DIR, UPLOADS_BASE.lstrip(os.sep))
+    for root, _, files in os.walk(mirror):
+        for name in files:
+            sidecar = os.path.join(root, name)
+            source = os.path.splitext(os.path.join(UPLOADS_BASE, os.path.relpath(sidecar, mirror)))[0]
+            if source in sweep.dead or not os.path.exists(source):
+                sidecars += 1
+                sweep.reclaimed += os.path.getsize(sidecar)
+                if not dry_run:
+                    _remove(sidecar)
+
+    index.save(index_path)
+    if sweep.dead and not dry_run:
+        file_meta_cache.clear()
+    return {
+        "dry_run": dry_run,
+        "started_at": started,
+        "duration_ms": round((time.time() - started) * 1000, 1),
+        "grace_seconds": grace,
+        "rows_reindexed": rows_read,
+        "referenced": len(referenced),
+        "files_scanned": scanned,
+        "kept_recent": sweep.kept_recent,
+        "removed_count": sweep.removed_count,
+        "sidecars_removed": sidecars,
+        "reclaimed_bytes": sweep.reclaimed,
+        "removed": sweep.removed,
+    }
+
+
+def collect(dry_run=None, grace=None):
+    """Run one collection pass; returns the report. Raises SweepBusy if one is running."""
+    from .db import get_conn
+
+    dry_run = UPLOAD_GC_DRY_RUN if dry_run is None else dry_run
+    grace = UPLOAD_GC_GRACE_SECONDS if grace is None else grace
+    os.makedirs(STATE_DIR, exist_ok=True)
+    with open(os.path.join(STATE_DIR, _LOCK_FILE), "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise SweepBusy()
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                report = _collect(cur, dry_run, grace)
+        tmp = os.path.join(STATE_DIR, f"{_REPORT_FILE}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(report, f)
+        os.replace(tmp, os.path.join(STATE_DIR, _REPORT_FILE))
+    if report["removed_count"]:
+        logger.info(
+            "Upload GC%s: %d removed, %d bytes reclaimed",
+            " (dry run)" if dry_run else "",
+            report["removed_count"],
+            report["reclaimed_bytes"],
+        )
+    return report
+
+
+def last_report():
+    try:
+        with open(os.path.join(STATE_DIR, _REPORT_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+async def collect_periodically():
+    """Background task: run the collector every UPLOAD_GC_INTERVAL seconds."""
+    import anyio
+
+    while True:
+        await asyncio.sleep(UPLOAD_GC_INTERVAL)
+        try:
+            await anyio.to_thread.run_sync(collect)
+        except SweepBusy:
+            pass
+        except Exception:
+            logger.exception("Upload GC failed")
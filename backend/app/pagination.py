@@ -0,0 +1,60 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException
+
+# Upper bound for ?limit= on list endpoints
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), int(row_id)], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def clamp_limit(limit: int) -> int:
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+
+def page_query(select_sql: str, where: list, params: list, skip: int, limit: int, cursor: Optional[str], alias: str = ""):
+    """Append ordering and pagination to a list query.
+
+    With ``cursor`` the page continues strictly after the encoded
+    ``(created_at, id)`` (keyset mode, backed by the ``(…, created_at, id)``
+    indexes); otherwise ``skip``/``limit`` are used as before. One extra row is
+    fetched so the caller can tell whether a next page exists.
+    """
+    where = list(where)
+    params = list(params)
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        where.append(f"({alias}created_at < %s OR ({alias}created_at = %s AND {alias}id < %s))")
+        params.extend([created_at, created_at, row_id])
+    sql = select_sql
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {alias}created_at DESC, {alias}id DESC LIMIT %s"
+    params.append(limit + 1)
+    if not cursor and skip:
+        sql += " OFFSET %s"
+        params.append(max(0, int(skip)))
+    return sql, params
+
+
+def finish_page(rows: list, limit: int):
+    """Trim the look-ahead row; returns ``(rows, next_cursor or None)``."""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        return rows, encode_cursor(last["created_at"], last["id"])
+    return rows, None
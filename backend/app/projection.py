@@ -0,0 +1,99 @@
+from typing import Optional
+from fastapi import HTTPException, Response
+from .fastjson import json_response
+
+# Selectable columns per resource. Values are the SQL expressions used in the
+# SELECT list; keys are the names clients pass in ?fields= and get back.
+COLUMNS = {
+    "thoughts": {
+        "id": "id",
+        "slug": "slug",
+        "title": "title",
+        "excerpt": "excerpt",
+        "featured_img": "featured_img",
+        "content": "content",
+        "published": "published",
+        "published_at": "published_at",
+        "tags": "tags",
+        "created_at": "created_at",
+        "updated_at": "updated_at",
+    },
+    "works": {
+        "id": "id",
+        "slug": "slug",
+        "title": "title",
+        # short plain prefix of the description for cards; never the full LONGTEXT
+        "excerpt": "LEFT(description, 280) AS excerpt",
+        "description": "description",
+        "year": "year",
+        "url": "url",
+        "repo": "repo",
+        "images": "images",
+        "tech": "tech",
+        "published": "published",
+        "created_at": "created_at",
+        "updated_at": "updated_at",
+    },
+    "analytics": {
+        "id": "id",
+        "slug": "slug",
+        "title": "title",
+        "excerpt": "excerpt",
+        "file_url": "file_url",
+        "file_type": "file_type",
+        "published": "published",
+        "published_at": "published_at",
+        "tags": "tags",
+        "created_at": "created_at",
+        "updated_at": "updated_at",
+    },
+}
+
+# Columns returned by list endpoints when no ?fields= is given (no body columns)
+SUMMARY_FIELDS = {
+    "thoughts": ("id", "slug", "title", "excerpt", "featured_img", "published", "published_at", "tags", "created_at", "updated_at"),
+    "works": ("id", "slug", "title", "excerpt", "year", "url", "repo", "images", "tech", "published", "created_at", "updated_at"),
+    "analytics": ("id", "slug", "title", "excerpt", "file_url", "file_type", "published", "published_at", "tags", "created_at", "updated_at"),
+}
+
+# Columns returned by detail endpoints when no ?fields= is given
+DETAIL_FIELDS = {
+    "thoughts": ("id", "slug", "title", "excerpt", "featured_img", "content", "published", "published_at", "tags", "created_at", "updated_at"),
+    "works": ("id", "slug", "title", "description", "year", "url", "repo", "images", "tech", "published", "created_at", "updated_at"),
+    "analytics": SUMMARY_FIELDS["analytics"],
+}
+
+
+def parse_fields(resource: str, fields: Optional[str]):
+    """Return the requested field names for ?fields=a,b,c, or None when absent."""
+    if fields is None:
+        return None
+    allowed = COLUMNS[resource]
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in names if f not in allowed]
+    if unknown or not names:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown) or '(none given)'}; allowed: {', '.join(allowed)}",
+        )
+    # de-duplicate while keeping the client's order
+    return list(dict.fromkeys(names))
+
+
+def select_list(resource: str, names, required=("id", "slug")) -> str:
+    """SQL select list for ``names`` plus the columns handlers rely on."""
+    cols = COLUMNS[resource]
+    wanted = list(dict.fromkeys(list(required) + list(names)))
+    return ", ".join(cols[n] for n in wanted)
+
+
+def project(rows, names):
+    """Drop helper columns that were selected but not requested."""
+    keep = set(names)
+    return [{k: v for k, v in r.items() if k in keep} for r in rows]
+
+
+def projected_response(content, response: Optional[Response] = None):
+    # Sparse rows don't satisfy the endpoint's response_model, so they are
+    # encoded directly. Headers set on the injected Response are carried over.
+    return json_response(content, response)
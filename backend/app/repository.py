@@ -0,0 +1,211 @@
+import logging
+from contextlib import contextmanager
+
+import pymysql
+
+from . import blobs
+from .cache import read_cache
+from .db import get_conn
+from .tags import TAG_COLUMN, sync_tags
+
+logger = logging.getLogger(__name__)
+
+# Write path for thoughts, works and analytics. Each write is one explicit
+# transaction in at most two round trips; the statements of a round trip go
+# out together as one multi-statement query (cursor.queue()):
+#
+#   create:        START TRANSACTION; INSERT; index statements; COMMIT
+#   update/delete: START TRANSACTION; SELECT ... FOR UPDATE (the old row),
+#                  then UPDATE/DELETE; index statements; COMMIT
+#
+# Timestamps (created_at, updated_at, published_at) are set with NOW() in the
+# INSERT/UPDATE itself; the new values come back from a primary-key SELECT in
+# the same round trip, so the row is never read back separately. The index
+# statements are the tag-index and blob-refcount changes (only when tags or
+# upload references changed) and the bump of the resource's content_versions
+# counter (the list validators); update also bumps the row's own version
+# (the detail ETag).
+
+# content_versions bump of one resource
+TOUCH_SQL = (
+    "INSERT INTO content_versions (resource, version, changed_at) VALUES (%s, 1, NOW(6)) "
+    "ON DUPLICATE KEY UPDATE version = version + 1, changed_at = NOW(6)"
+)
+
+
+class NotFound(Exception):
+    pass
+
+
+class Conflict(Exception):
+    pass
+
+
+@contextmanager
+def transaction():
+    """A cursor inside START TRANSACTION ... COMMIT; get_conn() rolls back on errors.
+
+    START TRANSACTION is queued in front of the first statement, and the
+    statements queued last go out with the COMMIT, so neither costs a round
+    trip of its own. A duplicate key at that point raises Conflict.
+
+    Callbacks registered with after_commit() run once the commit succeeded
+    (and not at all after a rollback). The write stands whatever they do, so
+    their errors are logged rather than raised; files they fail to delete
+    are left to the upload collector.
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.after_commit = []
+            cur.queue("START TRANSACTION")
+            yield cur
+            try:
+                cur.execute("COMMIT")
+            except pymysql.err.IntegrityError:
+                raise Conflict("Resource conflict: possibly duplicate slug")
+    for callback in cur.after_commit:
+        try:
+            callback()
+        except Exception:
+            logger.exception("After-commit callback failed")
+
+
+def after_commit(cur, callback):
+    """Run ``callback`` after the transaction of ``cur`` commits.
+
+    Cache invalidation belongs here: done inside the transaction, a
+    concurrent reader could re-cache the old state under the new generation.
+    A cursor outside transaction() is in autocommit mode, so it runs now.
+    """
+    pending = getattr(cur, "after_commit", None)
+    if pending is None:
+        callback()
+    else:
+        pending.append(callback)
+
+
+def _invalidate_tags():
+    read_cache.invalidate("tags")
+
+
+def touch(cur, resource):
+    """Bump the change counter behind the list validators of ``resource`` now."""
+    cur.execute(TOUCH_SQL, (resource,))
+
+
+class Repository:
+    def __init__(self, table, columns, label, published_at=True):
+        self.table = table
+        # columns of the returned row (id, created_at, updated_at included)
+        self.columns = columns
+        self.label = label
+        self.published_at = published_at
+        self.tag_column = TAG_COLUMN[table]
+        # columns the database fills in on a write
+        self._stamped = ["updated_at"] + (["published_at"] if published_at else [])
+
+    def _lock(self, cur, slug):
+        cur.execute(f"SELECT {', '.join(self.columns)} FROM {self.table} WHERE slug = %s LIMIT 1 FOR UPDATE", (slug,))
+        row = cur.fetchone()
+        if not row:
+            raise NotFound(f"{self.label} not found")
+        return row
+
+    def _assignments(self, fields):
+        # column -> (SQL expression, params); (re)publishing stamps the time,
+        # unpublishing clears it
+        values = {name: ("%s", (value,)) for name, value in fields.items()}
+        values["updated_at"] = ("NOW()", ())
+        if self.published_at and "published" in fields:
+            values["published_at"] = ("IF(%s, NOW(), NULL)", (1 if fields["published"] else 0,))
+        return values
+
+    def _queue_indexes(self, cur, item_id, old, new):
+        tags_changed = sync_tags(
+            cur,
+            self.table,
+            item_id,
+            old.get(self.tag_column) if old else [],
+            new.get(self.tag_column) if new else [],
+            old.get("published") if old else False,
+            new.get("published") if new else False,
+        )
+        if tags_changed:
+            after_commit(cur, _invalidate_tags)
+        released = blobs.sync_refs(cur, blobs.row_refs(self.table, old), blobs.row_refs(self.table, new))
+
+        def delete_released():
+            if released:
+                blobs.delete_released([r["name"] for r in released])
+
+        after_commit(cur, delete_released)
+        cur.queue(TOUCH_SQL, (self.table,))
+
+    def create(self, cur, fields):
+        """Insert a row from ``fields`` (column -> value); returns the new row.
+
+        Everything is queued: the INSERT goes out with the COMMIT.
+        """
+        fields = dict(fields, published=fields.get("published", 0))
+        values = self._assignments(fields)
+        values["created_at"] = ("NOW()", ())
+        names = list(values)
+        cur.queue(
+            f"INSERT INTO {self.table} ({', '.join(names)}) VALUES ({', '.join(values[n][0] for n in names)})",
+            tuple(p for n in names for p in values[n][1]),
+        )
+        row = {c: fields.get(c) for c in self.columns}
+        self._queue_indexes(cur, None, None, row)
+        stamped = []
+        cur.queue(
+            f"SELECT {', '.join(['id', 'created_at'] + self._stamped)} FROM {self.table} WHERE id = LAST_INSERT_ID()",
+            into=stamped,
+        )
+        after_commit(cur, lambda: row.update(stamped[0]))
+        return row
+
+    def update(self, cur, slug, fields):
+        """Apply ``fields`` to the row at ``slug``; returns ``(old_row, new_row)``.
+
+        The UPDATE is queued and goes out with the COMMIT.
+        """
+        old = self._lock(cur, slug)
+        values = self._assignments(fields)
+        names = list(values)
+        cur.queue(
+            f"UPDATE {self.table} SET {', '.join(f'{n} = {values[n][0]}' for n in names)}, version = version + 1 "
+            "WHERE id = %s",
+            (*(p for n in names for p in values[n][1]), old["id"]),
+        )
+        new = dict(old)
+        new.update((c, fields[c]) for c in self.columns if c in fields)
+        self._queue_indexes(cur, old["id"], old, new)
+        stamped = []
+        cur.queue(f"SELECT {', '.join(self._stamped)} FROM {self.table} WHERE id = %s", (old["id"],), into=stamped)
+        after_commit(cur, lambda: new.update(stamped[0]))
+        return old, new
+
+    def delete(self, cur, slug):
+        """Delete the row at ``slug``; returns it. The DELETE goes out with the COMMIT."""
+        old = self._lock(cur, slug)
+        cur.queue(f"DELETE FROM {self.table} WHERE id = %s", (old["id"],))
+        self._queue_indexes(cur, old["id"], old, None)
+        return old
+
+
+thoughts = Repository(
+    "thoughts",
+    ["id", "slug", "title", "excerpt", "featured_img", "content", "published", "published_at", "tags", "created_at", "updated_at"],
+    "Thought",
+)
+works = Repository(
+    "works",
+    ["id", "slug", "title", "description", "year", "url", "repo", "images", "tech", "published", "created_at", "updated_at"],
+    "Work",
+    published_at=False,
+)
+analytics = Repository(
+    "analytics",
+    ["id", "slug", "title", "excerpt", "file_url", "file_type", "published", "published_at", "tags", "created_at", "updated_at"],
+    "Analytic",
+)
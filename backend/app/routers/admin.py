@@ -0,0 +1,110 @@
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request
+from fastapi.responses import StreamingResponse
+import anyio
+from ..db import pool_stats, async_pool_stats
+from ..cache import read_cache
+from ..compression import compression_stats
+from ..executor import image_executor
+from .. import orphans, slowlog, snapshots, transfer
+from .auth import get_current_user
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+
+@router.get("/pool")
+def get_pool_stats(current_user: str = Depends(get_current_user)):
+    # Stats are per worker process; each gunicorn worker owns its own pool.
+    return {"sync": pool_stats(), "async": async_pool_stats()}
+
+
+@router.get("/cache")
+def get_cache_stats(current_user: str = Depends(get_current_user)):
+    return read_cache.stats()
+
+
+@router.get("/compression")
+def get_compression_stats(current_user: str = Depends(get_current_user)):
+    return compression_stats()
+
+
+@router.get("/executor")
+def get_executor_stats(current_user: str = Depends(get_current_user)):
+    return image_executor.stats()
+
+
+@router.get("/snapshots")
+def get_snapshot_stats(current_user: str = Depends(get_current_user)):
+    # the snapshot files this worker currently serves
+    return snapshots.stats()
+
+
+@router.get("/slow-queries")
+def get_slow_queries(
+    limit: int = Query(20, ge=1, le=200),
+    sort: str = Query("total_ms", pattern="^(total_ms|max_ms|avg_ms|count|last_seen)$"),
+    current_user: str = Depends(get_current_user),
+):
+    # per worker process, like /pool; plan_flags shows e.g. "filesort" when a
+    # list query stopped using its index
+    return {**slowlog.settings(), "queries": slowlog.top(limit, sort)}
+
+
+@router.delete("/slow-queries", status_code=204)
+def reset_slow_queries(current_user: str = Depends(get_current_user)):
+    slowlog.reset()
+
+
+@router.get("/uploads/gc")
+def get_upload_gc_report(current_user: str = Depends(get_current_user)):
+    # report of the last collector run, from whichever worker ran it
+    return {"last_run": orphans.last_report()}
+
+
+@router.post("/uploads/gc")
+async def run_upload_gc(dry_run: bool = True, current_user: str = Depends(get_current_user)):
+    try:
+        return await anyio.to_thread.run_sync(orphans.collect, dry_run)
+    except orphans.SweepBusy:
+        raise HTTPException(status_code=409, detail="Upload GC is already running")
+
+
+_RESOURCE = Path(..., pattern="^(thoughts|works|analytics)$")
+
+
+@router.get("/export/{resource}")
+def export_content(resource: str = _RESOURCE, current_user: str = Depends(get_current_user)):
+    # one JSON row per line, streamed from a server-side cursor
+    return StreamingResponse(
+        transfer.export_rows(resource),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{resource}.ndjson"'},
+    )
+
+
+@router.post("/import/{resource}")
+async def import_content(request: Request, resource: str = _RESOURCE, current_user: str = Depends(get_current_user)):
+    # NDJSON body in the export format; each batch of lines is inserted in its
+    # own transaction while the rest of the body is still arriving
+    report = transfer.ImportReport(resource)
+    batch = []
+    number = 0
+    buffer = b""
+
+    async def flush():
+        if batch:
+            await anyio.to_thread.run_sync(transfer.import_batch, resource, list(batch), report)
+            batch.clear()
+
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            number += 1
+            if line.strip():
+                batch.append((number, line))
+            if len(batch) >= transfer.IMPORT_BATCH_ROWS:
+                await flush()
+    if buffer.strip():
+        batch.append((number + 1, buffer))
+    await flush()
+    return report.as_dict()
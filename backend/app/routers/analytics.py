@@ -1,102 +1,329 @@
-from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, File, Request, Form
+from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, File, Request, Response, Form, Query
 from typing import List, Optional
 import json
-from .. import schemas
-from ..db import get_conn
+from .. import schemas, blobs, imaging, ingest, notebooks, repository, snapshots
+from ..db import get_aconn
+from ..pagination import clamp_limit, page_query, finish_page
+from ..projection import parse_fields, select_list, project, SUMMARY_FIELDS, DETAIL_FIELDS
+from ..cache import read_cache
+from ..search import search_index
+from ..tags import tag_filter
+from ..fastjson import FAST_JSON, json_response, make_row_mapper
+from ..executor import image_executor
+from ..conditional import (
+    make_etag,
+    detail_validators,
+    list_validators,
+    LIST_VERSION_SQL,
+    is_conditional,
+    not_modified,
+    not_modified_response,
+    set_validators,
+)
 from .auth import get_current_user
 from ..validators import validate_slug, validate_title
-import pymysql
+import anyio
+import logging
 import os
-import time
-import random
-from PIL import Image
-import io
+import re
 
 router = APIRouter(prefix="/api/analytics", tags=["analytics"])
 
+logger = logging.getLogger(__name__)
+
 _UPLOADS_BASE = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "static", "uploads", "analytics"))
 
 os.makedirs(_UPLOADS_BASE, exist_ok=True)
 
 
-def _save_upload(file: UploadFile):
+async def _save_upload(file: UploadFile):
     filename = file.filename or "upload"
     ext = os.path.splitext(filename)[1].lower()
-    safe_name = f"{int(time.time())}-{random.randint(1000,9999)}{ext}"
-    out_path = os.path.join(_UPLOADS_BASE, safe_name)
-    contents = None
-    # If it's an image we can normalize to jpg like other uploads
-    if ext in (".jpg", ".jpeg", ".png"):
-        contents = file.file.read()
+    ext = "." + (re.sub(r"[^a-z0-9]", "", ext)[:10] or "bin")
+    # Stream to a temporary file in the blob store, then move it into place
+    tmp_path, digest, size = await ingest.receive_upload(
+        file, blobs.BLOB_DIR, ingest.max_upload_bytes("analytics"), "analytics"
+    )
+
+    async def write_image(path):
+        await image_executor.run(imaging.process_upload, tmp_path, path)
+
+    async def write_raw(path):
+        # link rather than move: store() writes again if the file was released
+        link = f"{tmp_path}.{os.getpid()}.link"
+        os.link(tmp_path, link)
+        ingest.commit(link, path)
+
+    try:
+        # If it's an image we can normalize to jpg like other uploads
+        if ext in (".jpg", ".jpeg", ".png"):
+            name = f"{digest}.jpg"
+            try:
+                await blobs.store(name, size, write_image)
+                return name, blobs.blob_url(name), "image/jpeg"
+            except imaging.InvalidImage:
+                # <sha>.jpg names are decoded JPEGs served by the images
+                # router; the raw bytes get their own name
+                if ext == ".jpg":
+                    ext = ".jpeg"
+        # otherwise keep the raw file (written once per distinct content)
+        name = f"{digest}{ext}"
+        await blobs.store(name, size, write_raw)
+    finally:
+        ingest.discard(tmp_path)
+    if ext == ".ipynb" and not notebooks.has_cells(blobs.blob_path(name)):
+        # parse once into the per-cell store read by GET /{slug}/cells; if this
+        # fails (busy pool, malformed notebook) the first read builds it
         try:
-            img = Image.open(io.BytesIO(contents))
-            if img.mode in ("RGBA", "P"):
-                img = img.convert("RGB")
-            max_w = 2000
-            if img.width > max_w:
-                ratio = max_w / float(img.width)
-                new_h = int(float(img.height) * ratio)
-                img = img.resize((max_w, new_h), Image.LANCZOS)
-            img.save(out_path, format="JPEG", quality=78)
-            return safe_name, f"/api/images/analytics/{safe_name}", "image/jpeg"
+            await image_executor.run(notebooks.build_cells, blobs.blob_path(name))
         except Exception:
-            pass
-    # otherwise write raw file
-    with open(out_path, "wb") as f:
-        f.write(file.file.read())
+            logger.warning("Could not pre-build notebook cells for %s", name, exc_info=True)
     # guess type from extension
     mime = "application/octet-stream"
     if ext == ".pdf":
         mime = "application/pdf"
     elif ext == ".ipynb":
         mime = "application/json"
-    return safe_name, f"/static/uploads/analytics/{safe_name}", mime
+    return name, blobs.blob_url(name), mime
 
 
-@router.get("/", response_model=List[dict])
-def list_analytics(skip: int = 0, limit: int = 10):
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT id, slug, title, excerpt, file_url, file_type, published, published_at, tags, created_at, updated_at FROM analytics ORDER BY created_at DESC LIMIT %s OFFSET %s",
-                (limit, skip),
-            )
-            rows = cur.fetchall()
-
-    for r in rows:
-        if r.get("tags") and isinstance(r["tags"], str):
-            try:
-                r["tags"] = json.loads(r["tags"])
-            except Exception:
-                r["tags"] = None
-        r["published"] = bool(r.get("published"))
-
-    return rows
+_normalize = make_row_mapper(json_columns=("tags",), bool_columns=("published",))
 
 
-@router.get("/{slug}")
-def get_analytic(slug: str):
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT id, slug, title, excerpt, file_url, file_type, published, published_at, tags, created_at, updated_at FROM analytics WHERE slug = %s LIMIT 1",
+def _list_filters(published, tag):
+    where, params = [], []
+    if published is not None:
+        where.append("published = %s")
+        params.append(1 if published else 0)
+    if tag:
+        clause, clause_params = tag_filter("analytics", tag)
+        where.append(clause)
+        params.extend(clause_params)
+    return where, params
+
+
+async def _load_list(key, skip, limit, cursor, published, tag, names):
+    columns = select_list("analytics", names or SUMMARY_FIELDS["analytics"], required=("id", "slug", "created_at"))
+    where, params = _list_filters(published, tag)
+    sql, page_params = page_query(f"SELECT {columns} FROM analytics", where, params, skip, limit, cursor)
+
+    async with get_aconn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(LIST_VERSION_SQL, ("analytics",))
+            version = await cur.fetchone()
+            await cur.execute(sql, tuple(page_params))
+            rows = await cur.fetchall()
+
+    rows, next_cursor = finish_page(list(rows), limit)
+    rows = [_normalize(r) for r in rows]
+    if names is not None:
+        rows = project(rows, names)
+    etag, last_modified = list_validators("analytics", key, version)
+    return rows, next_cursor, etag, last_modified
+
+
+async def _load_list_version(key):
+    # one primary-key lookup; the page itself is not queried
+    async with get_aconn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(LIST_VERSION_SQL, ("analytics",))
+            version = await cur.fetchone()
+    return list_validators("analytics", key, version)
+
+
+async def _load_detail(slug, names, fields):
+    columns = select_list("analytics", names or DETAIL_FIELDS["analytics"], required=("id", "slug", "updated_at"))
+    async with get_aconn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                f"SELECT {columns}, version FROM analytics WHERE slug = %s LIMIT 1",
                 (slug,),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
 
     if not row:
-        raise HTTPException(status_code=404, detail="Analytic not found")
+        return None
+    etag, last_modified = detail_validators("analytics", row["id"], row.pop("version"), row["updated_at"], fields)
+    row = _normalize(row)
+    if names is not None:
+        row = project([row], names)[0]
+    return row, etag, last_modified
+
+
+async def _load_detail_version(slug, fields):
+    # only the validator columns, so a conditional GET never reads the body
+    async with get_aconn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT id, version, updated_at FROM analytics WHERE slug = %s LIMIT 1", (slug,))
+            row = await cur.fetchone()
+    if not row:
+        return None
+    return detail_validators("analytics", row["id"], row["version"], row["updated_at"], fields)
+
+
+@router.get("/", response_model=List[dict])
+async def list_analytics(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    published: Optional[bool] = None,
+    tag: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    # ?cursor= (from the X-Next-Cursor header of the previous page) selects keyset
+    # pagination; skip/limit keep working for older clients.
+    limit = clamp_limit(limit)
+    names = parse_fields("analytics", fields)
+    key = ("analytics", "list", skip if not cursor else 0, limit, cursor, published, tag, fields)
+    if published:
+        # published pages are cut from the static snapshot when there is one
+        cached = snapshots.list_response("analytics", key, request, response, skip, limit, cursor, tag, names)
+        if cached is not None:
+            return cached
+    page = read_cache.get(key)
+    if page is None:
+        if is_conditional(request):
+            etag, last_modified = await _load_list_version(key)
+            if not_modified(request, etag, last_modified):
+                return not_modified_response(etag, last_modified)
+        page = await _load_list(key, skip, limit, cursor, published, tag, names)
+        read_cache.set(key, page)
+    rows, next_cursor, etag, last_modified = page
+    if not_modified(request, etag, last_modified):
+        return not_modified_response(etag, last_modified)
+    set_validators(response, etag, last_modified)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    if FAST_JSON:
+        return json_response(rows, response)
+    return rows
+
 
-    if row.get("tags") and isinstance(row["tags"], str):
+def _file_path(file_url):
+    # blob URLs (current uploads) or /static/uploads/analytics/<name> (older ones)
+    name = blobs.name_from_url(file_url)
+    if name:
+        return blobs.blob_path(name)
+    return os.path.join(_UPLOADS_BASE, os.path.basename(file_url or ""))
+
+
+async def _notebook_item(slug):
+    key = ("analytics", "slug", slug, "__file__")
+    item = read_cache.get(key)
+    if item is None:
+        async with get_aconn() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT file_url, file_type FROM analytics WHERE slug = %s LIMIT 1", (slug,))
+                item = await cur.fetchone()
+        if not item:
+            raise HTTPException(status_code=404, detail="Analytic not found")
+        read_cache.set(key, item)
+    if not (item.get("file_url") or "").endswith(".ipynb"):
+        raise HTTPException(status_code=404, detail="Analytic is not a notebook")
+    return item
+
+
+async def _notebook_store(item):
+    # path of the notebook, with its cell store built (lazily for old uploads)
+    path = _file_path(item["file_url"])
+    if not notebooks.has_cells(path):
+        if not os.path.isfile(path):
+            raise HTTPException(status_code=404, detail="Notebook file not found")
         try:
-            row["tags"] = json.loads(row["tags"])
-        except Exception:
-            row["tags"] = None
-    row["published"] = bool(row.get("published"))
+            await image_executor.run(notebooks.build_cells, path)
+        except ValueError:
+            raise HTTPException(status_code=422, detail="File is not a valid notebook")
+    return path
+
+
+@router.get("/{slug}/cells")
+async def get_analytic_cells(
+    slug: str,
+    request: Request,
+    response: Response,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=notebooks.MAX_CELLS_PAGE),
+):
+    # Lazy-loading view of a notebook: one page of pre-parsed cells, read with
+    # a single seek regardless of the notebook's size
+    item = await _notebook_item(slug)
+
+    # a notebook's cells never change under the same file URL
+    etag = make_etag("analytics-cells", item["file_url"], offset, limit)
+    if not_modified(request, etag, None):
+        return not_modified_response(etag, None)
+
+    path = await _notebook_store(item)
+    meta, cells = await anyio.to_thread.run_sync(notebooks.read_cells, path, offset, limit)
+
+    end = offset + len(cells)
+    body = {
+        "slug": slug,
+        "offset": offset,
+        "limit": limit,
+        "total": meta["total"],
+        "next_offset": end if end < meta["total"] else None,
+        "language": meta.get("language"),
+        "nbformat": meta.get("nbformat"),
+        "cells": cells,
+    }
+    set_validators(response, etag, None)
+    return json_response(body, response)
+
+
+@router.get("/{slug}/notebook")
+async def get_analytic_notebook(slug: str, request: Request):
+    # The notebook with large outputs replaced by links to asset files (served
+    # and cached separately by /api/images/analytics/...)
+    item = await _notebook_item(slug)
+    api_base = str(request.base_url)
+    etag = make_etag("analytics-notebook", item["file_url"], api_base)
+    if not_modified(request, etag, None):
+        return not_modified_response(etag, None)
+    path = await _notebook_store(item)
+    content = await anyio.to_thread.run_sync(notebooks.read_slim, path, api_base)
+    response = Response(content, media_type="application/x-ipynb+json")
+    set_validators(response, etag, None)
+    return response
 
+
+@router.get("/{slug}")
+async def get_analytic(slug: str, request: Request, response: Response, fields: Optional[str] = None):
+    names = parse_fields("analytics", fields)
+    key = ("analytics", "slug", slug, fields)
+    cached = snapshots.detail_response("analytics", slug, request, response, fields, names)
+    if cached is not None:
+        return cached
+    entry = read_cache.get(key)
+    if entry is None:
+        if is_conditional(request):
+            version = await _load_detail_version(slug, fields)
+            if version is None:
+                raise HTTPException(status_code=404, detail="Analytic not found")
+            if not_modified(request, *version, by_date=False):
+                return not_modified_response(*version)
+        entry = await _load_detail(slug, names, fields)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="Analytic not found")
+        read_cache.set(key, entry)
+    row, etag, last_modified = entry
+    if not_modified(request, etag, last_modified, by_date=False):
+        return not_modified_response(etag, last_modified)
+    set_validators(response, etag, last_modified)
+
+    if FAST_JSON:
+        return json_response(row, response)
     return row
 
 
+def _create_row(fields):
+    with repository.transaction() as cur:
+        return repository.analytics.create(cur, fields)
+
+
 @router.post("/", status_code=status.HTTP_201_CREATED)
 async def create_analytic(request: Request, current_user: str = Depends(get_current_user)):
     # Parse multipart form-data manually to be resilient to different client Content-Type handling
@@ -148,46 +375,50 @@ async def create_analytic(request: Request, current_user: str = Depends(get_curr
     upload_file = file
 
     # save file
-    fname, url, mime = _save_upload(upload_file)
+    fname, url, mime = await _save_upload(upload_file)
 
     # parse tags
     tags_json = None
     if tags:
         try:
-            tags_json = json.loads(tags)
+            tags_json = json.dumps(json.loads(tags))
         except Exception:
             tags_json = [t.strip() for t in str(tags).split(",") if t.strip()]
             tags_json = json.dumps(tags_json)
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            try:
-                cur.execute(
-                    "INSERT INTO analytics (slug, title, excerpt, file_url, file_type, published, tags) VALUES (%s,%s,%s,%s,%s,%s,%s)",
-                    (slug, title, excerpt, url, mime, 1 if pub_flag else 0, tags_json),
-                )
-            except pymysql.err.IntegrityError:
-                raise HTTPException(status_code=409, detail="Resource conflict: possibly duplicate slug")
-
-            new_id = cur.lastrowid
-            if pub_flag:
-                cur.execute("UPDATE analytics SET published_at = NOW() WHERE id = %s", (new_id,))
-            cur.execute(
-                "SELECT id, slug, title, excerpt, file_url, file_type, published, published_at, tags, created_at, updated_at FROM analytics WHERE id = %s",
-                (new_id,),
-            )
-            row = cur.fetchone()
+    fields = {
+        "slug": slug,
+        "title": title,
+        "excerpt": excerpt,
+        "file_url": url,
+        "file_type": mime,
+        "published": 1 if pub_flag else 0,
+        "tags": tags_json,
+    }
+    row = await anyio.to_thread.run_sync(_create_row, fields)
 
-    if row.get("tags") and isinstance(row["tags"], str):
-        try:
-            row["tags"] = json.loads(row["tags"])
-        except Exception:
-            row["tags"] = None
-    row["published"] = bool(row.get("published"))
+    _normalize(row)
+
+    read_cache.invalidate("analytics", row["slug"])
+    snapshots.mark_stale("analytics")
+    search_index.upsert("analytics", row)
 
     return row
 
 
+def _remove_legacy_file(file_url):
+    # remove a pre-blob upload from static/uploads/analytics
+    try:
+        fname = (file_url or "").split("/")[-1]
+        p = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "static", "uploads", "analytics", fname))
+        if os.path.isfile(p):
+            os.remove(p)
+        imaging.remove_variants(p)
+        notebooks.remove_cells(p)
+    except Exception:
+        pass
+
+
 @router.put("/{slug}")
 def update_analytic(
     slug: str,
@@ -218,12 +449,11 @@ def update_analytic(
         update_fields["published"] = 1 if pub_flag else 0
 
     # handle file replacement
-    old_file = None
     new_url = None
     new_mime = None
     if file is not None:
-        # save new file
-        fname, url, mime = _save_upload(file)
+        # save new file (image work runs on the event loop's process pool)
+        fname, url, mime = anyio.from_thread.run(_save_upload, file)
         new_url = url
         new_mime = mime
         update_fields["file_url"] = new_url
@@ -232,60 +462,34 @@ def update_analytic(
     if not update_fields:
         raise HTTPException(status_code=400, detail="No fields to update")
 
-    set_clause = ", ".join([f"{k} = %s" for k in update_fields.keys()])
-    params = list(update_fields.values())
-    params.append(slug)
+    with repository.transaction() as cur:
+        existing, row = repository.analytics.update(cur, slug, update_fields)
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, file_url FROM analytics WHERE slug = %s LIMIT 1", (slug,))
-            existing = cur.fetchone()
-            if not existing:
-                raise HTTPException(status_code=404, detail="Analytic not found")
-            if new_url:
-                old_file = existing.get("file_url")
-
-            cur.execute(f"UPDATE analytics SET {set_clause} WHERE slug = %s", tuple(params))
-            if old_file and old_file != new_url:
-                try:
-                    # remove old file from static/uploads/analytics
-                    parts = old_file.split("/")
-                    fname = parts[-1]
-                    p = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "static", "uploads", "analytics", fname))
-                    if os.path.isfile(p):
-                        os.remove(p)
-                except Exception:
-                    pass
-
-            cur.execute("SELECT id, slug, title, excerpt, file_url, file_type, published, published_at, tags, created_at, updated_at FROM analytics WHERE id = %s", (existing["id"],))
-            row = cur.fetchone()
-
-    if row.get("tags") and isinstance(row["tags"], str):
-        try:
-            row["tags"] = json.loads(row["tags"])
-        except Exception:
-            row["tags"] = None
-    row["published"] = bool(row.get("published"))
+    # remove the replaced file once the new one is committed
+    old_file = existing.get("file_url") if new_url else None
+    if old_file and old_file != new_url and not blobs.name_from_url(old_file):
+        _remove_legacy_file(old_file)
+
+    _normalize(row)
+
+    read_cache.invalidate("analytics", slug, row["slug"])
+    snapshots.mark_stale("analytics")
+    search_index.upsert("analytics", row)
 
     return row
 
 
 @router.delete("/{slug}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_analytic(slug: str, current_user: str = Depends(get_current_user)):
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, file_url FROM analytics WHERE slug = %s LIMIT 1", (slug,))
-            existing = cur.fetchone()
-            if not existing:
-                raise HTTPException(status_code=404, detail="Analytic not found")
-            try:
-                parts = (existing.get("file_url") or "").split("/")
-                fname = parts[-1]
-                p = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "static", "uploads", "analytics", fname))
-                if os.path.isfile(p):
-                    os.remove(p)
-            except Exception:
-                pass
-            cur.execute("DELETE FROM analytics WHERE id = %s", (existing["id"],))
+    with repository.transaction() as cur:
+        existing = repository.analytics.delete(cur, slug)
+
+    # shared blobs were released through the repository's sync_refs
+    if not blobs.name_from_url(existing.get("file_url")):
+        _remove_legacy_file(existing.get("file_url"))
+
+    read_cache.invalidate("analytics", slug)
+    snapshots.mark_stale("analytics")
+    search_index.remove("analytics", existing["id"])
 
     return None
@@ -1,34 +1,172 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, JSONResponse
+from datetime import datetime, timezone
+from typing import Optional
+import hashlib
 import os
+import stat
 import mimetypes
+import anyio
+from .. import blobs, imaging, notebooks
+from ..cache import file_meta_cache, file_etags
+from ..conditional import CACHE_CONTROL, IMMUTABLE_CACHE_CONTROL, not_modified
+from ..executor import image_executor
+from ..compression import precompressed_response
 
 router = APIRouter(prefix="/api/images", tags=["images"])
 
+_CATEGORIES = ("thoughts", "works", "analytics", "blobs")
+# HTML/SVG notebook outputs are served from the API's origin: run them as an
+# opaque-origin document (scripts allowed for plotly/altair, but no access to
+# this origin's cookies or storage)
+_ACTIVE_CONTENT_HEADERS = {
+    "Content-Security-Policy": "sandbox allow-scripts",
+    "X-Content-Type-Options": "nosniff",
+}
+
 
 def _uploads_base():
     return os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "static", "uploads"))
 
 
-@router.get("/{category}/{filename}")
-def serve_image(category: str, filename: str):
-    base = _uploads_base()
-    if category not in ("thoughts", "works", "analytics"):
+def _content_etag(path, st):
+    # strong validator from the bytes themselves; blob names already are one
+    name = os.path.basename(path)
+    if blobs.is_blob_name(name) and not name.endswith(".jpg"):
+        return f'"{name.split(".")[0]}"'
+    key = (path, st.st_mtime_ns, st.st_size)
+    etag = file_etags.get(key)
+    if etag is None:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        etag = f'"{digest.hexdigest()[:40]}"'
+        file_etags.set(key, etag)
+    return etag
+
+
+def _content_addressed(filename):
+    # blobs and notebook assets are named by a hash of their bytes; legacy
+    # time-based upload names are not, and may be reused
+    if filename.startswith(notebooks.ASSET_PREFIX):
+        return blobs.is_blob_name(filename[len(notebooks.ASSET_PREFIX):])
+    return blobs.is_blob_name(filename)
+
+
+def _stat_file(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return st, _content_etag(path, st)
+
+
+async def _resolve(category, filename, w=None, fmt=None, accept=None, variants=True):
+    """(key, (path, media_type, stat, etag, negotiated, immutable)) for a request.
+
+    The metadata is cached per worker, so hot files are answered from memory
+    without touching filesystem metadata.
+    """
+    if category not in _CATEGORIES:
         raise HTTPException(status_code=404, detail="Image not found")
-    path = os.path.join(base, category, filename)
-    if not os.path.isfile(path):
+    key = ("images", category, filename, w, fmt, imaging.accepted_formats(accept), variants)
+    meta = file_meta_cache.get(key)
+    if meta is not None:
+        return key, meta
+
+    path = os.path.join(_uploads_base(), category, filename)
+    found = await anyio.to_thread.run_sync(_stat_file, path)
+    if found is None:
         raise HTTPException(status_code=404, detail="Image not found")
     media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
-    return FileResponse(path, media_type=media_type)
+    negotiated = False
+    fallback = False
+    if variants and media_type == "image/jpeg" and not filename.startswith(notebooks.ASSET_PREFIX):
+        if not imaging.available_widths(path):
+            # uploaded before derivatives existed: build them once (if the
+            # image pool is busy, the original is served and we retry later)
+            try:
+                await image_executor.run(imaging.generate_variants, path)
+            except Exception:
+                fallback = True
+        variant = imaging.pick_variant(path, w, accept, fmt)
+        if variant is not None:
+            variant_found = await anyio.to_thread.run_sync(_stat_file, variant[0])
+            if variant_found is not None:
+                path, media_type, found = variant[0], variant[1], variant_found
+                negotiated = fmt is None
+    meta = (path, media_type, found[0], found[1], negotiated, _content_addressed(filename) and not fallback)
+    if not fallback:
+        # the original stands in for a derivative only until it can be built
+        file_meta_cache.set(key, meta)
+    return key, meta
+
+
+def _headers(meta):
+    path, media_type, st, etag, negotiated, immutable = meta
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else CACHE_CONTROL}
+    if negotiated:
+        headers["Vary"] = "Accept"
+    if media_type in ("text/html", "image/svg+xml"):
+        headers.update(_ACTIVE_CONTENT_HEADERS)
+    return headers
+
+
+class _UploadResponse(FileResponse):
+    """FileResponse for cached metadata: 404 if the file went away since.
+
+    Another worker may have deleted the upload; its invalidation only
+    clears that worker's file_meta_cache.
+    """
+
+    def __init__(self, key, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.key = key
+
+    async def __call__(self, scope, receive, send):
+        try:
+            os.close(os.open(self.path, os.O_RDONLY))
+        except FileNotFoundError:
+            file_meta_cache.discard(self.key)
+            await JSONResponse({"detail": "Image not found"}, status_code=404)(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+def _serve(request, key, meta, extra_headers=None):
+    path, media_type, st, etag, negotiated, immutable = meta
+    headers = _headers(meta)
+    if extra_headers:
+        headers.update(extra_headers)
+    last_modified = datetime.fromtimestamp(st.st_mtime, tz=timezone.utc)
+    if not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    # FileResponse answers Range/If-Range itself, and hands the file to the
+    # server as http.response.pathsend (zero-copy) when the server offers it
+    return _UploadResponse(key, path, media_type=media_type, headers=headers, stat_result=st)
+
+
+@router.get("/{category}/{filename}")
+async def serve_image(
+    category: str,
+    filename: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=imaging.MAX_IMAGE_WIDTH),
+    format: Optional[str] = Query(None, pattern="^(avif|webp|jpg)$"),
+):
+    key, meta = await _resolve(category, filename, w, format, request.headers.get("accept"))
+    encoded = await precompressed_response(meta[0], meta[1], request.headers, _headers(meta))
+    if encoded is not None:
+        return encoded
+    return _serve(request, key, meta)
 
 
 @router.get("/{category}/{filename}/blob")
-def serve_image_blob(category: str, filename: str):
-    base = _uploads_base()
-    if category not in ("thoughts", "works", "analytics"):
-        raise HTTPException(status_code=404, detail="Image not found")
-    path = os.path.join(base, category, filename)
-    if not os.path.isfile(path):
-        raise HTTPException(status_code=404, detail="Image not found")
+async def serve_image_blob(category: str, filename: str, request: Request):
+    key, meta = await _resolve(category, filename, variants=False)
     # force download as binary blob
-    return FileResponse(path, media_type="application/octet-stream", headers={"Content-Disposition": f"attachment; filename=\"{filename}\""})
+    meta = (meta[0], "application/octet-stream", meta[2], meta[3], False, meta[5])
+    return _serve(request, key, meta, {"Content-Disposition": f"attachment; filename=\"{filename}\""})
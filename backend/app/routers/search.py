@@ -0,0 +1,24 @@
+from fastapi import APIRouter, HTTPException
+from typing import Optional
+from .. import schemas
+from ..search import search_index, KINDS
+
+router = APIRouter(prefix="/api/search", tags=["search"])
+
+
+@router.get("/", response_model=schemas.SearchResponse)
+async def search(q: str, type: Optional[str] = None, limit: int = 10):
+    # ?type=thoughts,works narrows the content types searched
+    kinds = KINDS
+    if type:
+        kinds = tuple(k.strip() for k in type.split(",") if k.strip())
+        unknown = [k for k in kinds if k not in KINDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown type: {', '.join(unknown)}")
+    q = q.strip()
+    if not q:
+        raise HTTPException(status_code=422, detail="q must be a non-empty string")
+    limit = max(1, min(limit, 50))
+
+    results = await search_index.search(q, kinds=kinds, limit=limit)
+    return {"query": q, "results": results}
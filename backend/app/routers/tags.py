@@ -0,0 +1,33 @@
+from fastapi import APIRouter, HTTPException
+from typing import List, Optional
+from .. import schemas
+from ..db import get_aconn
+from ..cache import read_cache
+from ..tags import TAG_COLUMN
+
+router = APIRouter(prefix="/api/tags", tags=["tags"])
+
+
+@router.get("/", response_model=List[schemas.TagCount])
+async def list_tags(resource: Optional[str] = None, published: bool = True):
+    # Counts come from tag_counts, which the write handlers adjust incrementally.
+    # ?published=false counts drafts too.
+    if resource is not None and resource not in TAG_COLUMN:
+        raise HTTPException(status_code=400, detail=f"Unknown resource: {resource}")
+    key = ("tags", "list", resource, published)
+    rows = read_cache.get(key)
+    if rows is None:
+        count_col = "published_count" if published else "item_count"
+        sql = f"SELECT resource, tag, {count_col} AS count FROM tag_counts WHERE {count_col} > 0"
+        params = []
+        if resource is not None:
+            sql += " AND resource = %s"
+            params.append(resource)
+        sql += " ORDER BY count DESC, tag"
+        async with get_aconn() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(sql, tuple(params))
+                rows = await cur.fetchall()
+        rows = list(rows)
+        read_cache.set(key, rows)
+    return rows
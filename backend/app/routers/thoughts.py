@@ -1,15 +1,29 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, Request, Response, status
 from datetime import datetime
 import re
-from typing import List
+from typing import List, Optional
 import json
 import html
-from .. import schemas
-from ..db import get_conn
+from .. import schemas, blobs, imaging, repository, snapshots
+from ..db import get_aconn
+from ..pagination import clamp_limit, page_query, finish_page
+from ..projection import parse_fields, select_list, project, projected_response, SUMMARY_FIELDS, DETAIL_FIELDS
+from ..cache import read_cache
+from ..search import search_index
+from ..tags import tag_filter
+from ..fastjson import FAST_JSON, json_response, make_row_mapper
+from ..conditional import (
+    detail_validators,
+    list_validators,
+    LIST_VERSION_SQL,
+    is_conditional,
+    not_modified,
+    not_modified_response,
+    set_validators,
+)
 from .auth import get_current_user
 from fastapi import Depends
 from ..validators import validate_slug, validate_title, validate_content
-import pymysql
 import os
 
 _UPLOADS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "static", "uploads", "thoughts"))
@@ -18,6 +32,9 @@ _UPLOADS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..
 def _delete_uploaded_file_from_path(path: str):
     if not path:
         return
+    # content-addressed uploads are shared; blobs.sync_refs frees them
+    if blobs.name_from_url(path):
+        return
     # path is expected to be like /api/images/<category>/<filename>
     try:
         parts = path.split("/")
@@ -32,6 +49,7 @@ def _delete_uploaded_file_from_path(path: str):
         p = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "static", "uploads", category, fname))
         if os.path.isfile(p):
             os.remove(p)
+        imaging.remove_variants(p)
     except Exception:
         pass
 
@@ -50,48 +68,152 @@ def _slugify_title(title: str) -> str:
     return s
 
 
-@router.get("/", response_model=List[schemas.ThoughtOut])
-def list_thoughts(skip: int = 0, limit: int = 10):
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT id, slug, title, excerpt, featured_img, content, published, published_at, tags, created_at, updated_at FROM thoughts ORDER BY created_at DESC LIMIT %s OFFSET %s",
-                (limit, skip),
-            )
-            rows = cur.fetchall()
-
-    # normalize rows
-    for r in rows:
-        if r.get("tags") and isinstance(r["tags"], str):
-            try:
-                r["tags"] = json.loads(r["tags"])
-            except Exception:
-                r["tags"] = None
-        r["published"] = bool(r.get("published"))
-
-    return rows
-
-
-@router.get("/{slug}", response_model=schemas.ThoughtOut)
-def get_thought(slug: str):
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT id, slug, title, excerpt, featured_img, content, published, published_at, tags, created_at, updated_at FROM thoughts WHERE slug = %s LIMIT 1",
+_normalize = make_row_mapper(json_columns=("tags",), bool_columns=("published",))
+
+
+def _list_filters(published, tag):
+    where, params = [], []
+    if published is not None:
+        where.append("published = %s")
+        params.append(1 if published else 0)
+    if tag:
+        clause, clause_params = tag_filter("thoughts", tag)
+        where.append(clause)
+        params.extend(clause_params)
+    return where, params
+
+
+async def _load_list(key, skip, limit, cursor, published, tag, names):
+    columns = select_list("thoughts", names or SUMMARY_FIELDS["thoughts"], required=("id", "slug", "created_at"))
+    where, params = _list_filters(published, tag)
+    sql, page_params = page_query(f"SELECT {columns} FROM thoughts", where, params, skip, limit, cursor)
+
+    async with get_aconn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(LIST_VERSION_SQL, ("thoughts",))
+            version = await cur.fetchone()
+            await cur.execute(sql, tuple(page_params))
+            rows = await cur.fetchall()
+
+    rows, next_cursor = finish_page(list(rows), limit)
+    rows = [_normalize(r) for r in rows]
+    if names is not None:
+        rows = project(rows, names)
+    etag, last_modified = list_validators("thoughts", key, version)
+    return rows, next_cursor, etag, last_modified
+
+
+async def _load_list_version(key):
+    # one primary-key lookup; the page itself is not queried
+    async with get_aconn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(LIST_VERSION_SQL, ("thoughts",))
+            version = await cur.fetchone()
+    return list_validators("thoughts", key, version)
+
+
+async def _load_detail(slug, names, fields):
+    columns = select_list("thoughts", names or DETAIL_FIELDS["thoughts"], required=("id", "slug", "updated_at"))
+    async with get_aconn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                f"SELECT {columns}, version FROM thoughts WHERE slug = %s LIMIT 1",
                 (slug,),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
 
     if not row:
-        raise HTTPException(status_code=404, detail="Thought not found")
+        return None
+    etag, last_modified = detail_validators("thoughts", row["id"], row.pop("version"), row["updated_at"], fields)
+    row = _normalize(row)
+    if names is not None:
+        row = project([row], names)[0]
+    return row, etag, last_modified
+
+
+async def _load_detail_version(slug, fields):
+    # only the validator columns, so a conditional GET never reads the body
+    async with get_aconn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT id, version, updated_at FROM thoughts WHERE slug = %s LIMIT 1", (slug,))
+            row = await cur.fetchone()
+    if not row:
+        return None
+    return detail_validators("thoughts", row["id"], row["version"], row["updated_at"], fields)
+
+
+@router.get("/", response_model=List[schemas.ThoughtSummary])
+async def list_thoughts(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    published: Optional[bool] = None,
+    tag: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    # ?cursor= (from the X-Next-Cursor header of the previous page) selects keyset
+    # pagination; skip/limit keep working for older clients.
+    # Lists return summaries without `content`; ?fields= picks columns explicitly.
+    limit = clamp_limit(limit)
+    names = parse_fields("thoughts", fields)
+    key = ("thoughts", "list", skip if not cursor else 0, limit, cursor, published, tag, fields)
+    if published:
+        # published pages are cut from the static snapshot when there is one
+        cached = snapshots.list_response("thoughts", key, request, response, skip, limit, cursor, tag, names)
+        if cached is not None:
+            return cached
+    page = read_cache.get(key)
+    if page is None:
+        if is_conditional(request):
+            etag, last_modified = await _load_list_version(key)
+            if not_modified(request, etag, last_modified):
+                return not_modified_response(etag, last_modified)
+        page = await _load_list(key, skip, limit, cursor, published, tag, names)
+        read_cache.set(key, page)
+    rows, next_cursor, etag, last_modified = page
+    if not_modified(request, etag, last_modified):
+        return not_modified_response(etag, last_modified)
+    set_validators(response, etag, last_modified)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    if names is not None:
+        return projected_response(rows, response)
+    if FAST_JSON:
+        return json_response(rows, response)
+    return rows
 
-    if row.get("tags") and isinstance(row["tags"], str):
-        try:
-            row["tags"] = json.loads(row["tags"])
-        except Exception:
-            row["tags"] = None
-    row["published"] = bool(row.get("published"))
 
+@router.get("/{slug}", response_model=schemas.ThoughtOut)
+async def get_thought(slug: str, request: Request, response: Response, fields: Optional[str] = None):
+    names = parse_fields("thoughts", fields)
+    key = ("thoughts", "slug", slug, fields)
+    cached = snapshots.detail_response("thoughts", slug, request, response, fields, names)
+    if cached is not None:
+        return cached
+    entry = read_cache.get(key)
+    if entry is None:
+        if is_conditional(request):
+            version = await _load_detail_version(slug, fields)
+            if version is None:
+                raise HTTPException(status_code=404, detail="Thought not found")
+            if not_modified(request, *version, by_date=False):
+                return not_modified_response(*version)
+        entry = await _load_detail(slug, names, fields)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="Thought not found")
+        read_cache.set(key, entry)
+    row, etag, last_modified = entry
+    if not_modified(request, etag, last_modified, by_date=False):
+        return not_modified_response(etag, last_modified)
+    set_validators(response, etag, last_modified)
+
+    if names is not None:
+        return projected_response(row, response)
+    if FAST_JSON:
+        return json_response(row, response)
     return row
 
 
@@ -112,41 +234,25 @@ def create_thought(payload: schemas.ThoughtCreate, current_user: str = Depends(g
     tags_json = json.dumps(payload.tags) if payload.tags is not None else None
     featured = getattr(payload, "featured_img", None)
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            try:
-                cur.execute(
-                    "INSERT INTO thoughts (slug, title, excerpt, featured_img, content, published, published_at, tags) VALUES (%s,%s,%s,%s,%s,%s,%s,%s)",
-                        (
-                            payload.slug,
-                            payload.title,
-                            payload.excerpt,
-                            featured,
-                            encoded_content,
-                            1 if payload.published else 0,
-                            None,
-                            tags_json,
-                        ),
-                )
-            except pymysql.err.IntegrityError as ie:
-                # likely duplicate slug or constraint violation
-                raise HTTPException(status_code=409, detail="Resource conflict: possibly duplicate slug")
-
-            new_id = cur.lastrowid
-            if payload.published:
-                cur.execute("UPDATE thoughts SET published_at = NOW() WHERE id = %s", (new_id,))
-            cur.execute(
-                "SELECT id, slug, title, excerpt, featured_img, content, published, published_at, tags, created_at, updated_at FROM thoughts WHERE id = %s",
-                (new_id,),
-            )
-            row = cur.fetchone()
-
-    if row.get("tags") and isinstance(row["tags"], str):
-        try:
-            row["tags"] = json.loads(row["tags"])
-        except Exception:
-            row["tags"] = None
-    row["published"] = bool(row.get("published"))
+    with repository.transaction() as cur:
+        row = repository.thoughts.create(
+            cur,
+            {
+                "slug": payload.slug,
+                "title": payload.title,
+                "excerpt": payload.excerpt,
+                "featured_img": featured,
+                "content": encoded_content,
+                "published": 1 if payload.published else 0,
+                "tags": tags_json,
+            },
+        )
+
+    _normalize(row)
+
+    read_cache.invalidate("thoughts", row["slug"])
+    snapshots.mark_stale("thoughts")
+    search_index.upsert("thoughts", row)
 
     return row
 
@@ -176,66 +282,38 @@ def update_thought(slug: str, payload: schemas.ThoughtCreate | schemas.ThoughtUp
     if not update_fields:
         raise HTTPException(status_code=400, detail="No fields to update")
 
-    set_clause = ", ".join([f"{k} = %s" for k in update_fields.keys()])
-    params = list(update_fields.values())
-    params.append(slug)
+    with repository.transaction() as cur:
+        existing, row = repository.thoughts.update(cur, slug, update_fields)
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id FROM thoughts WHERE slug = %s LIMIT 1", (slug,))
-            existing = cur.fetchone()
-            if not existing:
-                raise HTTPException(status_code=404, detail="Thought not found")
-            # if featured_img is included in update, fetch old value first so we can delete the old file
-            old_featured = None
-            if "featured_img" in update_fields:
-                cur.execute("SELECT featured_img FROM thoughts WHERE slug = %s LIMIT 1", (slug,))
-                tmp = cur.fetchone()
-                old_featured = tmp.get("featured_img") if tmp else None
-
-            cur.execute(f"UPDATE thoughts SET {set_clause} WHERE slug = %s", tuple(params))
-            # delete old featured image if replaced
-            if "featured_img" in update_fields and old_featured and old_featured != update_fields["featured_img"]:
-                _delete_uploaded_file_from_path(old_featured)
-
-            # Handle published_at if published flag present
-            if "published" in update_fields:
-                if update_fields["published"]:
-                    cur.execute("UPDATE thoughts SET published_at = NOW() WHERE id = %s", (existing["id"],))
-                else:
-                    cur.execute("UPDATE thoughts SET published_at = NULL WHERE id = %s", (existing["id"],))
-
-            cur.execute(
-                "SELECT id, slug, title, excerpt, content, published, published_at, tags, created_at, updated_at FROM thoughts WHERE id = %s",
-                (existing["id"],),
-            )
-            row = cur.fetchone()
+    # delete old featured image if replaced, once the new one is committed
+    old_featured = existing.get("featured_img")
+    if "featured_img" in update_fields and old_featured and old_featured != update_fields["featured_img"]:
+        _delete_uploaded_file_from_path(old_featured)
+
+    _normalize(row)
 
-    if row.get("tags") and isinstance(row["tags"], str):
-        try:
-            row["tags"] = json.loads(row["tags"])
-        except Exception:
-            row["tags"] = None
-    row["published"] = bool(row.get("published"))
+    read_cache.invalidate("thoughts", slug, row["slug"])
+    snapshots.mark_stale("thoughts")
+    search_index.upsert("thoughts", row)
 
     return row
 
 
 @router.delete("/{slug}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_thought(slug: str, current_user: str = Depends(get_current_user)):
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, featured_img FROM thoughts WHERE slug = %s LIMIT 1", (slug,))
-            existing = cur.fetchone()
-            if not existing:
-                raise HTTPException(status_code=404, detail="Thought not found")
-            # delete featured image file if present
-            try:
-                fimg = existing.get("featured_img")
-                if fimg:
-                    _delete_uploaded_file_from_path(fimg)
-            except Exception:
-                pass
-            cur.execute("DELETE FROM thoughts WHERE id = %s", (existing["id"],))
+    with repository.transaction() as cur:
+        existing = repository.thoughts.delete(cur, slug)
+
+    # delete featured image file if present
+    try:
+        fimg = existing.get("featured_img")
+        if fimg:
+            _delete_uploaded_file_from_path(fimg)
+    except Exception:
+        pass
+
+    read_cache.invalidate("thoughts", slug)
+    snapshots.mark_stale("thoughts")
+    search_index.remove("thoughts", existing["id"])
 
     return None
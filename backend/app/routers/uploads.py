@@ -1,9 +1,6 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Request
-import os
-from PIL import Image
-import io
-import time
-import random
+from .. import blobs, imaging, ingest
+from ..executor import image_executor
 
 router = APIRouter(prefix="/api/uploads", tags=["uploads"])
 
@@ -16,32 +13,30 @@ async def upload_image(request: Request, file: UploadFile = File(...)):
     if category not in ("thoughts", "works"):
         category = "thoughts"
 
-    # Save uploads into backend/static/uploads/<category>
-    base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "static", "uploads", category))
-    os.makedirs(base_dir, exist_ok=True)
+    # Stream the upload to a temporary file (size-limited, hashed on the way)
+    tmp_path, digest, size = await ingest.receive_upload(
+        file, blobs.BLOB_DIR, ingest.max_upload_bytes(category), category
+    )
+    # Stored once per distinct upload, whatever the category: blobs/<sha256>.jpg
+    name = f"{digest}.jpg"
+    out_path = blobs.blob_path(name)
 
-    filename = file.filename or "upload"
-    # always save as .jpg for consistency
-    safe_name = f"{int(time.time())}-{random.randint(1000,9999)}.jpg"
-    out_path = os.path.join(base_dir, safe_name)
+    async def write(path):
+        # Save compressed JPEG (RGB, max width 2000) plus width-bucketed
+        # WebP/AVIF/JPEG derivatives, in the image process pool
+        try:
+            await image_executor.run(imaging.process_upload, tmp_path, path)
+        except imaging.InvalidImage as e:
+            raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
 
     try:
-        contents = await file.read()
-        img = Image.open(io.BytesIO(contents))
-        # Convert to RGB for JPEGs
-        if img.mode in ("RGBA", "P"):
-            img = img.convert("RGB")
-        # Optionally resize large images to max width 2000
-        max_w = 2000
-        if img.width > max_w:
-            ratio = max_w / float(img.width)
-            new_h = int(float(img.height) * ratio)
-            img = img.resize((max_w, new_h), Image.LANCZOS)
-        # Save compressed JPEG
-        img.save(out_path, format="JPEG", quality=78)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+        # registered only once the JPEG exists, so an invalid image leaves no row
+        await blobs.store(name, size, write)
+    finally:
+        ingest.discard(tmp_path)
 
     # Return API image path so DB stores a stable API URL that maps to the images router
-    rel_path = f"/api/images/{category}/{safe_name}"
-    return {"url": rel_path}
+    # "url" stays the canonical image; the rest is a srcset manifest
+    result = imaging.manifest(blobs.blob_url(name), out_path)
+    result["sha256"] = digest
+    return result
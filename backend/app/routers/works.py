@@ -1,12 +1,26 @@
-from fastapi import APIRouter, HTTPException, status
-from typing import List
+from fastapi import APIRouter, HTTPException, Request, Response, status
+from typing import List, Optional
 import json
-from .. import schemas
-from ..db import get_conn
+from .. import schemas, blobs, imaging, repository, snapshots
+from ..db import get_aconn
+from ..pagination import clamp_limit, page_query, finish_page
+from ..projection import parse_fields, select_list, project, projected_response, SUMMARY_FIELDS, DETAIL_FIELDS
+from ..cache import read_cache
+from ..search import search_index
+from ..tags import tag_filter
+from ..fastjson import FAST_JSON, json_response, make_row_mapper
+from ..conditional import (
+    detail_validators,
+    list_validators,
+    LIST_VERSION_SQL,
+    is_conditional,
+    not_modified,
+    not_modified_response,
+    set_validators,
+)
 from ..validators import validate_slug, validate_title
 from .auth import get_current_user
 from fastapi import Depends
-import pymysql
 import os
 _UPLOADS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "static", "uploads", "thoughts"))
 
@@ -14,6 +28,9 @@ _UPLOADS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..
 def _delete_uploaded_file_from_path(path: str):
     if not path:
         return
+    # content-addressed uploads are shared; blobs.sync_refs frees them
+    if blobs.name_from_url(path):
+        return
     try:
         parts = path.split("/")
         if len(parts) >= 5:
@@ -25,63 +42,159 @@ def _delete_uploaded_file_from_path(path: str):
         p = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "static", "uploads", category, fname))
         if os.path.isfile(p):
             os.remove(p)
+        imaging.remove_variants(p)
     except Exception:
         pass
 
 router = APIRouter(prefix="/api/works", tags=["works"])
 
 
-@router.get("/", response_model=List[schemas.WorkOut])
-def list_works(skip: int = 0, limit: int = 10):
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT id, slug, title, description, year, url, repo, images, tech, published, created_at, updated_at FROM works ORDER BY created_at DESC LIMIT %s OFFSET %s",
-                (limit, skip),
-            )
-            rows = cur.fetchall()
-
-    for r in rows:
-        if r.get("tech") and isinstance(r["tech"], str):
-            try:
-                r["tech"] = json.loads(r["tech"])
-            except Exception:
-                r["tech"] = None
-        if r.get("images") and isinstance(r["images"], str):
-            try:
-                r["images"] = json.loads(r["images"])
-            except Exception:
-                r["images"] = None
-        r["published"] = bool(r.get("published"))
+_normalize = make_row_mapper(json_columns=("tech", "images"), bool_columns=("published",))
 
-    return rows
 
+def _list_filters(published, tag):
+    where, params = [], []
+    if published is not None:
+        where.append("published = %s")
+        params.append(1 if published else 0)
+    if tag:
+        clause, clause_params = tag_filter("works", tag)
+        where.append(clause)
+        params.extend(clause_params)
+    return where, params
 
-@router.get("/{slug}", response_model=schemas.WorkOut)
-def get_work(slug: str):
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT id, slug, title, description, year, url, repo, images, tech, published, created_at, updated_at FROM works WHERE slug = %s LIMIT 1",
+
+async def _load_list(key, skip, limit, cursor, published, tag, names):
+    columns = select_list("works", names or SUMMARY_FIELDS["works"], required=("id", "slug", "created_at"))
+    where, params = _list_filters(published, tag)
+    sql, page_params = page_query(f"SELECT {columns} FROM works", where, params, skip, limit, cursor)
+
+    async with get_aconn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(LIST_VERSION_SQL, ("works",))
+            version = await cur.fetchone()
+            await cur.execute(sql, tuple(page_params))
+            rows = await cur.fetchall()
+
+    rows, next_cursor = finish_page(list(rows), limit)
+    rows = [_normalize(r) for r in rows]
+    if names is not None:
+        rows = project(rows, names)
+    etag, last_modified = list_validators("works", key, version)
+    return rows, next_cursor, etag, last_modified
+
+
+async def _load_list_version(key):
+    # one primary-key lookup; the page itself is not queried
+    async with get_aconn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(LIST_VERSION_SQL, ("works",))
+            version = await cur.fetchone()
+    return list_validators("works", key, version)
+
+
+async def _load_detail(slug, names, fields):
+    columns = select_list("works", names or DETAIL_FIELDS["works"], required=("id", "slug", "updated_at"))
+    async with get_aconn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                f"SELECT {columns}, version FROM works WHERE slug = %s LIMIT 1",
                 (slug,),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
 
     if not row:
-        raise HTTPException(status_code=404, detail="Work not found")
+        return None
+    etag, last_modified = detail_validators("works", row["id"], row.pop("version"), row["updated_at"], fields)
+    row = _normalize(row)
+    if names is not None:
+        row = project([row], names)[0]
+    return row, etag, last_modified
+
+
+async def _load_detail_version(slug, fields):
+    # only the validator columns, so a conditional GET never reads the body
+    async with get_aconn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT id, version, updated_at FROM works WHERE slug = %s LIMIT 1", (slug,))
+            row = await cur.fetchone()
+    if not row:
+        return None
+    return detail_validators("works", row["id"], row["version"], row["updated_at"], fields)
+
+
+@router.get("/", response_model=List[schemas.WorkSummary])
+async def list_works(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    published: Optional[bool] = None,
+    tag: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    # ?cursor= (from the X-Next-Cursor header of the previous page) selects keyset
+    # pagination; skip/limit keep working for older clients.
+    # Lists return an `excerpt` instead of the full `description`; ?fields= picks columns explicitly.
+    limit = clamp_limit(limit)
+    names = parse_fields("works", fields)
+    key = ("works", "list", skip if not cursor else 0, limit, cursor, published, tag, fields)
+    if published:
+        # published pages are cut from the static snapshot when there is one
+        cached = snapshots.list_response("works", key, request, response, skip, limit, cursor, tag, names)
+        if cached is not None:
+            return cached
+    page = read_cache.get(key)
+    if page is None:
+        if is_conditional(request):
+            etag, last_modified = await _load_list_version(key)
+            if not_modified(request, etag, last_modified):
+                return not_modified_response(etag, last_modified)
+        page = await _load_list(key, skip, limit, cursor, published, tag, names)
+        read_cache.set(key, page)
+    rows, next_cursor, etag, last_modified = page
+    if not_modified(request, etag, last_modified):
+        return not_modified_response(etag, last_modified)
+    set_validators(response, etag, last_modified)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    if names is not None:
+        return projected_response(rows, response)
+    if FAST_JSON:
+        return json_response(rows, response)
+    return rows
 
-    if row.get("tech") and isinstance(row["tech"], str):
-        try:
-            row["tech"] = json.loads(row["tech"])
-        except Exception:
-            row["tech"] = None
-    if row.get("images") and isinstance(row["images"], str):
-        try:
-            row["images"] = json.loads(row["images"])
-        except Exception:
-            row["images"] = None
-    row["published"] = bool(row.get("published"))
 
+@router.get("/{slug}", response_model=schemas.WorkOut)
+async def get_work(slug: str, request: Request, response: Response, fields: Optional[str] = None):
+    names = parse_fields("works", fields)
+    key = ("works", "slug", slug, fields)
+    cached = snapshots.detail_response("works", slug, request, response, fields, names)
+    if cached is not None:
+        return cached
+    entry = read_cache.get(key)
+    if entry is None:
+        if is_conditional(request):
+            version = await _load_detail_version(slug, fields)
+            if version is None:
+                raise HTTPException(status_code=404, detail="Work not found")
+            if not_modified(request, *version, by_date=False):
+                return not_modified_response(*version)
+        entry = await _load_detail(slug, names, fields)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="Work not found")
+        read_cache.set(key, entry)
+    row, etag, last_modified = entry
+    if not_modified(request, etag, last_modified, by_date=False):
+        return not_modified_response(etag, last_modified)
+    set_validators(response, etag, last_modified)
+
+    if names is not None:
+        return projected_response(row, response)
+    if FAST_JSON:
+        return json_response(row, response)
     return row
 
 
@@ -93,44 +206,27 @@ def create_work(payload: schemas.WorkCreate, current_user: str = Depends(get_cur
     tech_json = json.dumps(payload.tech) if payload.tech is not None else None
     images_json = json.dumps(payload.images) if payload.images is not None else None
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            try:
-                cur.execute(
-                    "INSERT INTO works (slug, title, description, year, url, repo, images, tech, published) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)",
-                    (
-                        payload.slug,
-                        payload.title,
-                        payload.description,
-                        payload.year,
-                        payload.url,
-                        payload.repo,
-                        images_json,
-                        tech_json,
-                        1 if payload.published else 0,
-                    ),
-                )
-            except pymysql.err.IntegrityError:
-                raise HTTPException(status_code=409, detail="Resource conflict: possibly duplicate slug")
-
-            new_id = cur.lastrowid
-            cur.execute(
-                "SELECT id, slug, title, description, year, url, repo, images, tech, published, created_at, updated_at FROM works WHERE id = %s",
-                (new_id,),
-            )
-            row = cur.fetchone()
+    with repository.transaction() as cur:
+        row = repository.works.create(
+            cur,
+            {
+                "slug": payload.slug,
+                "title": payload.title,
+                "description": payload.description,
+                "year": payload.year,
+                "url": payload.url,
+                "repo": payload.repo,
+                "images": images_json,
+                "tech": tech_json,
+                "published": 1 if payload.published else 0,
+            },
+        )
 
-    if row.get("tech") and isinstance(row["tech"], str):
-        try:
-            row["tech"] = json.loads(row["tech"])
-        except Exception:
-            row["tech"] = None
-    if row.get("images") and isinstance(row["images"], str):
-        try:
-            row["images"] = json.loads(row["images"])
-        except Exception:
-            row["images"] = None
-    row["published"] = bool(row.get("published"))
+    _normalize(row)
+
+    read_cache.invalidate("works", row["slug"])
+    snapshots.mark_stale("works")
+    search_index.upsert("works", row)
 
     return row
 
@@ -160,75 +256,50 @@ def update_work(slug: str, payload: schemas.WorkUpdate, current_user: str = Depe
     if not update_fields:
         raise HTTPException(status_code=400, detail="No fields to update")
 
-    set_clause = ", ".join([f"{k} = %s" for k in update_fields.keys()])
-    params = list(update_fields.values())
-    params.append(slug)
-
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id FROM works WHERE slug = %s LIMIT 1", (slug,))
-            existing = cur.fetchone()
-            if not existing:
-                raise HTTPException(status_code=404, detail="Work not found")
-            # if images are being updated, capture old images to delete
-            old_images = None
-            if "images" in update_fields:
-                cur.execute("SELECT images FROM works WHERE slug = %s LIMIT 1", (slug,))
-                t = cur.fetchone()
-                old_images = t.get("images") if t else None
-
-            cur.execute(f"UPDATE works SET {set_clause} WHERE slug = %s", tuple(params))
-            # delete any old images that were removed
-            if old_images and update_fields.get("images"):
-                try:
-                    old_list = json.loads(old_images) if isinstance(old_images, str) else old_images
-                    new_list = json.loads(update_fields.get("images")) if isinstance(update_fields.get("images"), str) else update_fields.get("images")
-                    if isinstance(old_list, list):
-                        for img in old_list:
-                            if img and img not in (new_list or []):
-                                _delete_uploaded_file_from_path(img)
-                except Exception:
-                    pass
-            cur.execute(
-                "SELECT id, slug, title, description, year, url, repo, images, tech, published, created_at, updated_at FROM works WHERE id = %s",
-                (existing["id"],),
-            )
-            row = cur.fetchone()
+    with repository.transaction() as cur:
+        existing, row = repository.works.update(cur, slug, update_fields)
 
-    if row.get("tech") and isinstance(row["tech"], str):
-        try:
-            row["tech"] = json.loads(row["tech"])
-        except Exception:
-            row["tech"] = None
-    if row.get("images") and isinstance(row["images"], str):
+    # delete any old images that were removed, once the update is committed
+    old_images = existing.get("images")
+    if old_images and update_fields.get("images"):
         try:
-            row["images"] = json.loads(row["images"])
+            old_list = json.loads(old_images) if isinstance(old_images, str) else old_images
+            new_list = json.loads(update_fields.get("images")) if isinstance(update_fields.get("images"), str) else update_fields.get("images")
+            if isinstance(old_list, list):
+                for img in old_list:
+                    if img and img not in (new_list or []):
+                        _delete_uploaded_file_from_path(img)
         except Exception:
-            row["images"] = None
-    row["published"] = bool(row.get("published"))
+            pass
+
+    _normalize(row)
+
+    read_cache.invalidate("works", slug, row["slug"])
+    snapshots.mark_stale("works")
+    search_index.upsert("works", row)
 
     return row
 
 
 @router.delete("/{slug}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_work(slug: str, current_user: str = Depends(get_current_user)):
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, images FROM works WHERE slug = %s LIMIT 1", (slug,))
-            existing = cur.fetchone()
-            if not existing:
-                raise HTTPException(status_code=404, detail="Work not found")
-            # delete images referenced by this work
-            try:
-                imgs = existing.get("images")
-                if imgs:
-                    lst = json.loads(imgs) if isinstance(imgs, str) else imgs
-                    if isinstance(lst, list):
-                        for img in lst:
-                            if img:
-                                _delete_uploaded_file_from_path(img)
-            except Exception:
-                pass
-            cur.execute("DELETE FROM works WHERE id = %s", (existing["id"],))
+    with repository.transaction() as cur:
+        existing = repository.works.delete(cur, slug)
+
+    # delete images referenced by this work
+    try:
+        imgs = existing.get("images")
+        if imgs:
+            lst = json.loads(imgs) if isinstance(imgs, str) else imgs
+            if isinstance(lst, list):
+                for img in lst:
+                    if img:
+                        _delete_uploaded_file_from_path(img)
+    except Exception:
+        pass
+
+    read_cache.invalidate("works", slug)
+    snapshots.mark_stale("works")
+    search_index.remove("works", existing["id"])
 
     return None
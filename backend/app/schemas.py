@@ -36,6 +36,23 @@ class ThoughtOut(ThoughtBase):
         from_attributes = True
 
 
+class ThoughtSummary(BaseModel):
+    # list view of a thought: everything except the content body
+    id: int
+    slug: str
+    title: str
+    excerpt: Optional[str] = None
+    featured_img: Optional[str] = None
+    tags: Optional[List[str]] = None
+    published: bool
+    published_at: Optional[datetime] = None
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
 class WorkBase(BaseModel):
     slug: str
     title: str
@@ -73,6 +90,25 @@ class WorkOut(WorkBase):
         from_attributes = True
 
 
+class WorkSummary(BaseModel):
+    # list view of a work: the description is cut down to a short excerpt
+    id: int
+    slug: str
+    title: str
+    excerpt: Optional[str] = None
+    year: Optional[str] = None
+    url: Optional[str] = None
+    repo: Optional[str] = None
+    tech: Optional[List[str]] = None
+    images: Optional[List[str]] = None
+    published: bool
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
 class AnalyticBase(BaseModel):
     slug: str
     title: str
@@ -105,3 +141,30 @@ class AnalyticOut(AnalyticBase):
 
     class Config:
         from_attributes = True
+
+
+class TagCount(BaseModel):
+    resource: str
+    tag: str
+    count: int
+
+
+class SearchHighlights(BaseModel):
+    # HTML-escaped snippets with matches wrapped in <mark>
+    title: str
+    body: str
+
+
+class SearchResult(BaseModel):
+    type: str
+    slug: str
+    title: str
+    excerpt: Optional[str] = None
+    tags: Optional[List[str]] = None
+    score: float
+    highlights: SearchHighlights
+
+
+class SearchResponse(BaseModel):
+    query: str
+    results: List[SearchResult]
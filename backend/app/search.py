@@ -0,0 +1,316 @@
+import asyncio
+import heapq
+import html
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# "memory": in-process inverted index kept up to date by the write handlers.
+# "mysql": FULLTEXT indexes (sql/migrations/003_search_fulltext.sql); InnoDB
+# maintains them, so every worker sees writes immediately.
+SEARCH_ENGINE = os.getenv("SEARCH_ENGINE", "memory").strip().lower()
+# Each worker owns its memory index, so it is rebuilt from the database every
+# N seconds to pick up writes served by other workers (0 disables).
+SEARCH_REBUILD_INTERVAL = float(os.getenv("SEARCH_REBUILD_INTERVAL", "300"))
+
+KINDS = ("thoughts", "works", "analytics")
+
+# Per-field weights used when ranking
+WEIGHTS = {"title": 4.0, "tags": 3.0, "excerpt": 2.0, "body": 1.0}
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_TAG_RE = re.compile(r"<[^>]+>")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it of on or that the to was were with".split()
+)
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return [t for t in _TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in _STOPWORDS]
+
+
+def plain_text(value):
+    # thought content is stored HTML-escaped editor markup
+    if not value:
+        return ""
+    return " ".join(html.unescape(_TAG_RE.sub(" ", html.unescape(value))).split())
+
+
+def _as_list(value):
+    if isinstance(value, list):
+        return [str(v) for v in value if v]
+    if isinstance(value, str) and value:
+        try:
+            parsed = json.loads(value)
+            if isinstance(parsed, list):
+                return [str(v) for v in parsed if v]
+        except Exception:
+            pass
+    return []
+
+
+def document_from_row(kind, row):
+    """Searchable fields of a thoughts/works/analytics row."""
+    if kind == "thoughts":
+        tags, body = _as_list(row.get("tags")), plain_text(row.get("content"))
+        excerpt = row.get("excerpt") or ""
+    elif kind == "works":
+        tags, body = _as_list(row.get("tech")), plain_text(row.get("description"))
+        excerpt = body[:280]
+    else:
+        tags, body = _as_list(row.get("tags")), ""
+        excerpt = row.get("excerpt") or ""
+    return {
+        "type": kind,
+        "id": row["id"],
+        "slug": row["slug"],
+        "title": row.get("title") or "",
+        "excerpt": excerpt,
+        "tags": tags,
+        "body": body,
+        "published": bool(row.get("published")),
+    }
+
+
+def highlight(text, terms, width=160):
+    """HTML-safe snippet of ``text`` around the first matching term, matches in <mark>."""
+    if not text:
+        return ""
+    lower = text.lower()
+    pos = -1
+    for t in terms:
+        m = re.search(r"\b" + re.escape(t), lower)
+        if m and (pos < 0 or m.start() < pos):
+            pos = m.start()
+    if pos < 0:
+        start = 0
+    else:
+        start = max(0, pos - width // 3)
+        # don't cut a word in half
+        if start:
+            space = text.find(" ", start)
+            if 0 <= space < pos:
+                start = space + 1
+    snippet = text[start:start + width]
+    out = html.escape(snippet)
+    if terms:
+        pattern = re.compile(r"\b(" + "|".join(re.escape(html.escape(t)) for t in terms) + r")", re.IGNORECASE)
+        out = pattern.sub(r"<mark>\1</mark>", out)
+    if start > 0:
+        out = "…" + out
+    if start + width < len(text):
+        out += "…"
+    return out
+
+
+def _result(doc, score, terms):
+    return {
+        "type": doc["type"],
+        "slug": doc["slug"],
+        "title": doc["title"],
+        "excerpt": doc["excerpt"],
+        "tags": doc["tags"],
+        "score": round(score, 4),
+        "highlights": {
+            "title": highlight(doc["title"], terms, width=300),
+            "body": highlight(doc["body"] or doc["excerpt"], terms),
+        },
+    }
+
+
+class InvertedIndex:
+    """In-process inverted index with field-weighted BM25 ranking.
+
+    Postings map term -> {doc key -> weighted term frequency}; a query only
+    touches the postings of its own terms, so latency tracks the number of
+    matching documents rather than the corpus size.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = defaultdict(dict)
+        self._docs = {}
+        self._lengths = {}
+        self._total_length = 0.0
+
+    def __len__(self):
+        return len(self._docs)
+
+    def upsert(self, kind, row):
+        doc = document_from_row(kind, row)
+        key = (kind, doc["id"])
+        with self._lock:
+            self._remove(key)
+            if not doc["published"]:
+                return
+            weighted = defaultdict(float)
+            for field in ("title", "excerpt", "body"):
+                for t in tokenize(doc[field]):
+                    weighted[t] += WEIGHTS[field]
+            for tag in doc["tags"]:
+                for t in tokenize(tag):
+                    weighted[t] += WEIGHTS["tags"]
+            for t, tf in weighted.items():
+                self._postings[t][key] = tf
+            length = sum(weighted.values())
+            self._docs[key] = doc
+            self._lengths[key] = length
+            self._total_length += length
+
+    def remove(self, kind, row_id):
+        with self._lock:
+            self._remove((kind, row_id))
+
+    def _remove(self, key):
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return
+        self._total_length -= self._lengths.pop(key, 0.0)
+        terms = set(tokenize(doc["title"]) + tokenize(doc["excerpt"]) + tokenize(doc["body"]))
+        for tag in doc["tags"]:
+            terms.update(tokenize(tag))
+        for t in terms:
+            posting = self._postings.get(t)
+            if posting is not None:
+                posting.pop(key, None)
+                if not posting:
+                    del self._postings[t]
+
+    def replace_all(self, rows_by_kind):
+        fresh = InvertedIndex()
+        for kind, rows in rows_by_kind.items():
+            for row in rows:
+                fresh.upsert(kind, row)
+        with self._lock:
+            self._postings = fresh._postings
+            self._docs = fresh._docs
+            self._lengths = fresh._lengths
+            self._total_length = fresh._total_length
+
+    async def search(self, q, kinds=KINDS, limit=10):
+        # async like MySQLFulltextEngine.search; ranking in memory never blocks long
+        return self.rank(q, kinds, limit)
+
+    def rank(self, q, kinds=KINDS, limit=10):
+        terms = list(dict.fromkeys(tokenize(q)))
+        if not terms:
+            return []
+        with self._lock:
+            n = len(self._docs)
+            if not n:
+                return []
+            avg = self._total_length / n
+            scores = defaultdict(float)
+            for t in terms:
+                posting = self._postings.get(t)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                for key, tf in posting.items():
+                    if key[0] not in kinds:
+                        continue
+                    norm = tf + self.k1 * (1 - self.b + self.b * self._lengths[key] / avg)
+                    scores[key] += idf * tf * (self.k1 + 1) / norm
+            top = heapq.nlargest(limit, scores.items(), key=lambda kv: kv[1])
+            docs = [(self._docs[key], score) for key, score in top]
+        return [_result(doc, score, terms) for doc, score in docs]
+
+
+# SELECT lists and MATCH column sets per table; each MATCH needs a FULLTEXT
+# index over exactly those columns (see 003_search_fulltext.sql).
+_FULLTEXT = {
+    "thoughts": ("SELECT id, slug, title, excerpt, tags, content, published", "title", "title, excerpt, content"),
+    "works": ("SELECT id, slug, title, tech, description, published", "title", "title, description"),
+    "analytics": ("SELECT id, slug, title, excerpt, tags, published", "title", "title, excerpt"),
+}
+
+
+class MySQLFulltextEngine:
+    """Ranks with InnoDB FULLTEXT; title matches are weighted above body matches.
+
+    Tags live in JSON columns, which FULLTEXT cannot index, so they only show
+    up in results and not in the ranking.
+    """
+
+    def upsert(self, kind, row):
+        pass
+
+    def remove(self, kind, row_id):
+        pass
+
+    def replace_all(self, rows_by_kind):
+        pass
+
+    def __len__(self):
+        return 0
+
+    async def search(self, q, kinds=KINDS, limit=10):
+        from .db import get_aconn
+
+        terms = list(dict.fromkeys(tokenize(q)))
+        if not terms:
+            return []
+        scored = []
+        async with get_aconn() as conn:
+            async with conn.cursor() as cur:
+                for kind in kinds:
+                    select, title_cols, all_cols = _FULLTEXT[kind]
+                    await cur.execute(
+                        f"{select}, MATCH({title_cols}) AGAINST (%s) * {WEIGHTS['title']} + MATCH({all_cols}) AGAINST (%s) AS score"
+                        f" FROM {kind} WHERE published = 1 AND MATCH({all_cols}) AGAINST (%s)"
+                        " ORDER BY score DESC LIMIT %s",
+                        (q, q, q, limit),
+                    )
+                    for row in await cur.fetchall():
+                        scored.append((document_from_row(kind, row), float(row["score"])))
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return [_result(doc, score, terms) for doc, score in scored[:limit]]
+
+
+def _make_engine():
+    if SEARCH_ENGINE == "mysql":
+        return MySQLFulltextEngine()
+    if SEARCH_ENGINE != "memory":
+        logger.warning("Unknown SEARCH_ENGINE %r, using the in-process index", SEARCH_ENGINE)
+    return InvertedIndex()
+
+
+search_index = _make_engine()
+
+
+def rebuild_index():
+    """Load every published row into the in-process index (no-op for mysql)."""
+    if not isinstance(search_index, InvertedIndex):
+        return
+    from .db import get_conn
+
+    rows_by_kind = {}
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            for kind, (select, _, _) in _FULLTEXT.items():
+                cur.execute(f"{select} FROM {kind} WHERE published = 1")
+                rows_by_kind[kind] = cur.fetchall()
+    search_index.replace_all(rows_by_kind)
+
+
+async def rebuild_periodically():
+    """Background task: refresh this worker's memory index every SEARCH_REBUILD_INTERVAL."""
+    import anyio
+
+    while True:
+        await asyncio.sleep(SEARCH_REBUILD_INTERVAL)
+        try:
+            await anyio.to_thread.run_sync(rebuild_index)
+        except Exception:
+            logger.exception("Search index rebuild failed")
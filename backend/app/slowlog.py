@@ -0,0 +1,156 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Statements slower than SLOW_QUERY_MS are logged and aggregated by
+# fingerprint (the statement with literals and placeholders replaced by ?).
+# The SLOW_QUERY_TOP fingerprints with the most total time are kept; ones not
+# seen for SLOW_QUERY_WINDOW seconds are forgotten. A statement slower than
+# SLOW_QUERY_EXPLAIN_MS gets its plan captured with EXPLAIN on the same
+# connection, at most once per SLOW_QUERY_EXPLAIN_INTERVAL per fingerprint.
+# Kept per worker process, like the pool stats.
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_EXPLAIN_MS = float(os.getenv("SLOW_QUERY_EXPLAIN_MS", "300"))
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "600"))
+SLOW_QUERY_TOP = int(os.getenv("SLOW_QUERY_TOP", "50"))
+SLOW_QUERY_WINDOW = float(os.getenv("SLOW_QUERY_WINDOW", "3600"))
+
+SLOW_QUERY_SECONDS = SLOW_QUERY_MS / 1000.0
+
+_COMMENT_RE = re.compile(r"/\*.*?\*/|--[^\n]*", re.S)
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER_RE = re.compile(r"%\(\w+\)s|%s")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+# EXPLAIN works on these; writes are planned but would not be worth the risk
+_EXPLAINABLE = ("select", "with")
+
+_lock = threading.Lock()
+_entries = {}
+
+
+def fingerprint(query):
+    """Normalized statement text: literals and placeholders become ``?``.
+
+    ``IN (?, ?, ?)`` lists of any length collapse to ``IN (?+)`` so pages and
+    batch sizes share one fingerprint.
+    """
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    text = _COMMENT_RE.sub(" ", query)
+    text = _STRING_RE.sub("?", text)
+    text = _PLACEHOLDER_RE.sub("?", text)
+    text = _NUMBER_RE.sub("?", text)
+    text = _IN_LIST_RE.sub("(?+)", text)
+    return _SPACE_RE.sub(" ", text).strip().lower()
+
+
+def _plan_flags(rows):
+    """Warnings worth surfacing from EXPLAIN rows (filesort, full scans...)."""
+    flags = set()
+    for row in rows or []:
+        extra = (row.get("Extra") or "").lower()
+        if "filesort" in extra:
+            flags.add("filesort")
+        if "temporary" in extra:
+            flags.add("temporary")
+        if (row.get("type") or "").upper() == "ALL":
+            flags.add("full_scan")
+        if row.get("key") is None and row.get("possible_keys"):
+            flags.add("index_not_used")
+    return sorted(flags)
+
+
+def record(query, elapsed):
+    """Account a slow statement; returns its fingerprint id if EXPLAIN is due."""
+    text = fingerprint(query)
+    fid = hashlib.sha1(text.encode()).hexdigest()[:16]
+    now = time.time()
+    ms = elapsed * 1000.0
+    logger.warning("Slow query %s (%.1f ms): %s", fid, ms, text[:500])
+    with _lock:
+        entry = _entries.get(fid)
+        if entry is None:
+            _evict(now)
+            entry = _entries[fid] = {
+                "id": fid,
+                "fingerprint": text,
+                "count": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "first_seen": now,
+                "last_seen": now,
+                "explain": None,
+                "explain_ms": None,
+                "explained_at": None,
+                "plan_flags": [],
+            }
+        entry["count"] += 1
+        entry["total_ms"] += ms
+        entry["max_ms"] = max(entry["max_ms"], ms)
+        entry["last_seen"] = now
+        due = (
+            ms >= SLOW_QUERY_EXPLAIN_MS
+            and text.startswith(_EXPLAINABLE)
+            and (entry["explained_at"] is None or now - entry["explained_at"] >= SLOW_QUERY_EXPLAIN_INTERVAL)
+        )
+        if due:
+            # claim the sample now so concurrent slow runs don't all EXPLAIN
+            entry["explained_at"] = now
+            entry["explain_ms"] = round(ms, 1)
+    return fid if due else None
+
+
+def _evict(now):
+    for fid in [f for f, e in _entries.items() if now - e["last_seen"] > SLOW_QUERY_WINDOW]:
+        del _entries[fid]
+    while len(_entries) >= max(1, SLOW_QUERY_TOP):
+        coldest = min(_entries.values(), key=lambda e: e["total_ms"])
+        del _entries[coldest["id"]]
+
+
+def set_explain(fid, rows):
+    plan = [dict(r) for r in rows or []]
+    flags = _plan_flags(plan)
+    with _lock:
+        entry = _entries.get(fid)
+        if entry is not None:
+            entry["explain"] = plan
+            entry["plan_flags"] = flags
+    if flags:
+        logger.warning("Slow query %s plan: %s", fid, ", ".join(flags))
+
+
+def top(limit=None, sort="total_ms"):
+    """Slow fingerprints, most expensive first."""
+    now = time.time()
+    with _lock:
+        entries = [dict(e) for e in _entries.values() if now - e["last_seen"] <= SLOW_QUERY_WINDOW]
+    for e in entries:
+        e["avg_ms"] = round(e["total_ms"] / e["count"], 1)
+        e["total_ms"] = round(e["total_ms"], 1)
+        e["max_ms"] = round(e["max_ms"], 1)
+    entries.sort(key=lambda e: e.get(sort) or 0, reverse=True)
+    return entries[:limit] if limit else entries
+
+
+def reset():
+    with _lock:
+        _entries.clear()
+
+
+def settings():
+    return {
+        "pid": os.getpid(),
+        "threshold_ms": SLOW_QUERY_MS,
+        "explain_ms": SLOW_QUERY_EXPLAIN_MS,
+        "explain_interval": SLOW_QUERY_EXPLAIN_INTERVAL,
+        "top": SLOW_QUERY_TOP,
+        "window": SLOW_QUERY_WINDOW,
+    }
@@ -0,0 +1,432 @@
+import asyncio
+import bisect
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import datetime
+
+from .conditional import (
+    LIST_VERSION_SQL,
+    detail_validators,
+    list_validators,
+    not_modified,
+    not_modified_response,
+    set_validators,
+)
+from .fastjson import dumps, json_response, loads, make_row_mapper, raw_json_response
+from .pagination import decode_cursor, encode_cursor
+from .projection import COLUMNS, DETAIL_FIELDS, project
+from .tags import TAG_COLUMN, normalize_tags
+
+logger = logging.getLogger(__name__)
+
+# Static snapshots of published content. One file per resource holds every
+# published row: the encoded detail record of each, followed by an index of
+# the list columns (newest first) and a fixed-size trailer pointing at it.
+# Workers mmap the file, so detail responses are a slice of the page cache
+# and list pages are cut from the in-memory index, without touching MySQL.
+#
+# Write handlers mark a resource stale right after their commit: that bumps
+# its counter in the shared "dirty" file, and every worker stops serving a
+# snapshot built against an older counter (reads fall through to the cache
+# and MySQL). A background task rebuilds it after SNAPSHOT_DEBOUNCE seconds,
+# re-reading only rows whose version moved, and atomically replaces the
+# file. Every SNAPSHOT_REFRESH_INTERVAL seconds all resources are re-checked
+# (picks up writes made outside the API; 0 disables). The same task maps
+# files replaced by other workers, in a thread: requests never parse an index.
+# If the database is down the build fails and the last file keeps serving,
+# unless it was marked stale: from a write until the rebuild, the snapshot is
+# not a fallback for a database outage.
+SNAPSHOTS = os.getenv("SNAPSHOTS", "1") == "1"
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "cache", "snapshots")))
+SNAPSHOT_DEBOUNCE = float(os.getenv("SNAPSHOT_DEBOUNCE", "1"))
+SNAPSHOT_REFRESH_INTERVAL = float(os.getenv("SNAPSHOT_REFRESH_INTERVAL", "300"))
+# how often a worker checks whether another process replaced a snapshot file
+SNAPSHOT_CHECK_INTERVAL = float(os.getenv("SNAPSHOT_CHECK_INTERVAL", "1"))
+
+RESOURCES = ("thoughts", "works", "analytics")
+# body columns only kept in the detail records, not in the list index
+_BODY_COLUMNS = {"thoughts": ("content",), "works": ("description",), "analytics": ()}
+_NORMALIZE = {
+    "thoughts": make_row_mapper(json_columns=("tags",), bool_columns=("published",)),
+    "works": make_row_mapper(json_columns=("tech", "images"), bool_columns=("published",)),
+    "analytics": make_row_mapper(json_columns=("tags",), bool_columns=("published",)),
+}
+_MAGIC = b"APSNAP01"
+_TRAILER = struct.Struct("<Q8s")
+_LOCK_FILE = "build.lock"
+# one little-endian u64 write counter per resource, in RESOURCES order
+_DIRTY_FILE = "dirty"
+_COUNTER = struct.Struct("<Q")
+# rows per SELECT when re-reading changed rows
+_FETCH_ROWS = 500
+
+
+def _path(resource):
+    return os.path.join(SNAPSHOT_DIR, f"{resource}.snap")
+
+
+class Snapshot:
+    """Published rows of one resource, read from its snapshot file."""
+
+    def __init__(self, resource, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        end = len(self._map) - _TRAILER.size
+        index_at, magic = _TRAILER.unpack_from(self._map, end)
+        if magic != _MAGIC or index_at > end:
+            raise ValueError(f"{path} is not a snapshot file")
+        index = loads(self._map[index_at:end])
+        self.resource = resource
+        self.built_at = index["built_at"]
+        # write counter of the resource when the build started
+        self.generation = index["generation"]
+        # newest first, like the list queries (created_at DESC, id DESC)
+        self.rows = index["rows"]
+        self.spans = index["spans"]
+        # row versions (detail ETags) and the content_versions row read in
+        # the same transaction as the rows (list validators)
+        self.versions = index["versions"]
+        changed_at = index["list_version"]["changed_at"]
+        self.list_version = {
+            "version": index["list_version"]["version"],
+            "changed_at": datetime.fromisoformat(changed_at) if changed_at else None,
+        }
+        self.keys = [(datetime.fromisoformat(r["created_at"]), r["id"]) for r in self.rows]
+        self.updated = [datetime.fromisoformat(r["updated_at"]) for r in self.rows]
+        self._ascending = self.keys[::-1]
+        self.by_slug = {r["slug"]: i for i, r in enumerate(self.rows)}
+        self.by_tag = {}
+        column = TAG_COLUMN[resource]
+        for i, r in enumerate(self.rows):
+            for t in normalize_tags(r.get(column)):
+                self.by_tag.setdefault(t.lower(), []).append(i)
+
+    def detail_bytes(self, i):
+        offset, length = self.spans[i]
+        return self._map[offset:offset + length]
+
+    def record(self, i, names):
+        row = self.rows[i]
+        if any(n in _BODY_COLUMNS[self.resource] for n in names):
+            row = {**row, **loads(self.detail_bytes(i))}
+        return project([row], names)[0]
+
+    def page(self, skip, limit, cursor, tag):
+        """Positions of one list page and the next cursor, as page_query/finish_page would."""
+        positions = self.by_tag.get(tag.strip().lower(), []) if tag else None
+        if cursor:
+            # first row strictly after the cursor's (created_at, id)
+            start = len(self.keys) - bisect.bisect_left(self._ascending, decode_cursor(cursor))
+            if positions is not None:
+                start = bisect.bisect_left(positions, start)
+        else:
+            start = max(0, int(skip))
+        if positions is None:
+            picked = list(range(start, min(start + limit + 1, len(self.rows))))
+        else:
+            picked = positions[start:start + limit + 1]
+        if len(picked) > limit:
+            picked = picked[:limit]
+            created_at, row_id = self.keys[picked[-1]]
+            return picked, encode_cursor(created_at, row_id)
+        return picked, None
+
+
+_dirty = None
+_dirty_lock = threading.Lock()
+
+
+def _dirty_map():
+    global _dirty
+    if _dirty is None:
+        with _dirty_lock:
+            if _dirty is None:
+                os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+                fd = os.open(os.path.join(SNAPSHOT_DIR, _DIRTY_FILE), os.O_RDWR | os.O_CREAT, 0o600)
+                try:
+                    size = _COUNTER.size * len(RESOURCES)
+                    if os.fstat(fd).st_size < size:
+                        os.ftruncate(fd, size)
+                    _dirty = (fd, mmap.mmap(fd, size))
+                except BaseException:
+                    os.close(fd)
+                    raise
+    return _dirty
+
+
+def generation(resource):
+    """How many times ``resource`` was marked stale, across all workers."""
+    return _COUNTER.unpack_from(_dirty_map()[1], RESOURCES.index(resource) * _COUNTER.size)[0]
+
+
+def _bump(resource):
+    fd, counters = _dirty_map()
+    offset = RESOURCES.index(resource) * _COUNTER.size
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    try:
+        _COUNTER.pack_into(counters, offset, _COUNTER.unpack_from(counters, offset)[0] + 1)
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+_loaded = {}
+
+
+def current(resource):
+    """The latest snapshot of ``resource``, or None when there is none or it is stale."""
+    if not SNAPSHOTS:
+        return None
+    snap = _current(resource)
+    try:
+        if snap is not None and snap.generation != generation(resource):
+            return None
+    except OSError:
+        # without the counters a stale snapshot can't be told apart
+        return None
+    return snap
+
+
+def _current(resource):
+    entry = _loaded.get(resource)
+    return entry[1] if entry is not None else None
+
+
+def _reload(resources=RESOURCES):
+    """Map the snapshot files that changed on disk since the last call.
+
+    Parsing the index of a large table takes a while, so this runs in a
+    worker thread (build_periodically); requests only look up _loaded.
+    """
+    for resource in resources:
+        path = _path(resource)
+        try:
+            st = os.stat(path)
+            signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except OSError:
+            signature = None
+        entry = _loaded.get(resource)
+        if entry is not None and entry[0] == signature:
+            continue
+        snap = entry[1] if entry is not None else None
+        if signature is not None:
+            try:
+                snap = Snapshot(resource, path)
+            except (OSError, ValueError, KeyError, struct.error):
+                # keep the last good one
+                logger.warning("Unreadable snapshot %s", path, exc_info=True)
+        else:
+            snap = None
+        # the replaced mapping is closed once no request uses it any more
+        _loaded[resource] = (signature, snap)
+
+
+def list_response(resource, key, request, response, skip, limit, cursor, tag, names):
+    """A published list page answered from the snapshot, or None without one."""
+    snap = current(resource)
+    if snap is None:
+        return None
+    etag, last_modified = list_validators(resource, key, snap.list_version)
+    if not_modified(request, etag, last_modified):
+        return not_modified_response(etag, last_modified)
+    picked, next_cursor = snap.page(skip, limit, cursor, tag)
+    if names is None:
+        rows = [snap.rows[i] for i in picked]
+    else:
+        rows = [snap.record(i, names) for i in picked]
+    set_validators(response, etag, last_modified)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return json_response(rows, response)
+
+
+def detail_response(resource, slug, request, response, fields, names):
+    """A published record answered from the snapshot, or None if it has no ``slug``."""
+    snap = current(resource)
+    i = snap.by_slug.get(slug) if snap is not None else None
+    if i is None:
+        return None
+    etag, last_modified = detail_validators(resource, snap.rows[i]["id"], snap.versions[i], snap.updated[i], fields)
+    if not_modified(request, etag, last_modified, by_date=False):
+        return not_modified_response(etag, last_modified)
+    set_validators(response, etag, last_modified)
+    if names is None:
+        return raw_json_response(snap.detail_bytes(i), response)
+    return json_response(snap.record(i, names), response)
+
+
+def _build(cur, resource, generation):
+    """Rewrite the snapshot of ``resource`` if its published rows changed.
+
+    ``generation`` is the resource's write counter, read before the
+    transaction of ``cur`` started.
+    """
+    path = _path(resource)
+    try:
+        old = Snapshot(resource, path)
+    except FileNotFoundError:
+        old = None
+    except (OSError, ValueError, KeyError, struct.error):
+        logger.warning("Rebuilding unreadable snapshot %s", path)
+        old = None
+
+    cur.execute(LIST_VERSION_SQL, (resource,))
+    list_version = cur.fetchone() or {"version": 0, "changed_at": None}
+    cur.execute(f"SELECT id, updated_at, version FROM {resource} WHERE published = 1 ORDER BY created_at DESC, id DESC")
+    order = cur.fetchall()
+    known = {r["id"]: i for i, r in enumerate(old.rows)} if old is not None else {}
+    # updated_at has seconds only; version moves on every update
+    changed = [r["id"] for r in order if r["id"] not in known or old.versions[known[r["id"]]] != r["version"]]
+    if (
+        old is not None
+        and not changed
+        and old.generation == generation
+        and old.list_version == list_version
+        and len(order) == len(old.rows)
+        and all(r["id"] == o["id"] for r, o in zip(order, old.rows))
+    ):
+        return False
+
+    fresh = {}
+    columns = ", ".join(COLUMNS[resource].values())
+    normalize = _NORMALIZE[resource]
+    for start in range(0, len(changed), _FETCH_ROWS):
+        ids = changed[start:start + _FETCH_ROWS]
+        cur.execute(
+            f"SELECT {columns} FROM {resource} WHERE published = 1 AND id IN ({', '.join(['%s'] * len(ids))})",
+            tuple(ids),
+        )
+        for row in cur.fetchall():
+            fresh[row["id"]] = normalize(row)
+
+    body_columns = _BODY_COLUMNS[resource]
+    rows, spans, versions, offset = [], [], [], 0
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        for r in order:
+            row = fresh.get(r["id"])
+            if row is not None:
+                body = dumps({k: row[k] for k in DETAIL_FIELDS[resource]})
+                entry = {k: v for k, v in row.items() if k not in body_columns}
+            elif r["id"] in known:
+                body = old.detail_bytes(known[r["id"]])
+                entry = old.rows[known[r["id"]]]
+            else:
+                # unpublished or deleted between the two queries
+                continue
+            f.write(body)
+            rows.append(entry)
+            spans.append((offset, len(body)))
+            versions.append(r["version"])
+            offset += len(body)
+        index = {"resource": resource, "built_at": time.time(), "rows": rows, "spans": spans, "versions": versions}
+        index["list_version"] = list_version
+        index["generation"] = generation
+        f.write(dumps(index))
+        f.write(_TRAILER.pack(offset, _MAGIC))
+    os.replace(tmp, path)
+    logger.info("Snapshot %s: %d rows, %d re-read", resource, len(rows), len(fresh))
+    return True
+
+
+def build(resources=RESOURCES):
+    """Bring the snapshots of ``resources`` up to date; returns the rewritten ones."""
+    from .db import get_conn
+
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    rebuilt = []
+    with open(os.path.join(SNAPSHOT_DIR, _LOCK_FILE), "w") as lock:
+        # one builder at a time; whoever waits finds little left to re-read
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        # before reading: a write marked after this leaves the new file stale
+        generations = {resource: generation(resource) for resource in resources}
+        with get_conn() as conn:
+            # one consistent read, so a snapshot's list_version matches its rows
+            conn.begin()
+            with conn.cursor() as cur:
+                for resource in resources:
+                    if _build(cur, resource, generations[resource]):
+                        rebuilt.append(resource)
+            conn.commit()
+    return rebuilt
+
+
+_stale = set()
+_stale_lock = threading.Lock()
+
+
+def mark_stale(resource):
+    """Called by the write handlers after a commit; the builder picks it up.
+
+    From here on no worker serves the current snapshot of ``resource``.
+    """
+    if not SNAPSHOTS:
+        return
+    with _stale_lock:
+        _stale.add(resource)
+    try:
+        _bump(resource)
+    except OSError:
+        logger.warning("Could not mark the %s snapshot stale", resource, exc_info=True)
+
+
+def _take_stale():
+    with _stale_lock:
+        due = set(_stale)
+        _stale.clear()
+    # also those marked by other workers, whose builder may have gone away
+    for resource in RESOURCES:
+        snap = _current(resource)
+        if snap is not None and snap.generation != generation(resource):
+            due.add(resource)
+    return sorted(due)
+
+
+async def build_periodically():
+    """Background task: map replaced files, rebuild stale snapshots, and all of them now and then."""
+    import anyio
+
+    checked = built = reloaded = None
+    while True:
+        now = time.monotonic()
+        if reloaded is None or now - reloaded >= SNAPSHOT_CHECK_INTERVAL:
+            await anyio.to_thread.run_sync(_reload)
+            reloaded = now
+        if built is None or now - built >= SNAPSHOT_DEBOUNCE:
+            try:
+                due = _take_stale()
+            except OSError as exc:
+                logger.warning("Could not read the snapshot counters: %s", exc)
+                due = []
+            if checked is None or (SNAPSHOT_REFRESH_INTERVAL and now - checked >= SNAPSHOT_REFRESH_INTERVAL):
+                due, checked = list(RESOURCES), now
+            if due:
+                built = now
+                try:
+                    await anyio.to_thread.run_sync(build, due)
+                except Exception as exc:
+                    logger.warning("Snapshot build failed, serving the last ones: %s", exc)
+                    with _stale_lock:
+                        _stale.update(due)
+                # this worker serves the new files right away
+                await anyio.to_thread.run_sync(_reload, due)
+        await asyncio.sleep(min(SNAPSHOT_DEBOUNCE, SNAPSHOT_CHECK_INTERVAL))
+
+
+def stats():
+    out = {"enabled": SNAPSHOTS, "dir": SNAPSHOT_DIR, "resources": {}}
+    for resource in RESOURCES:
+        snap = _current(resource) if SNAPSHOTS else None
+        if snap is None:
+            out["resources"][resource] = None
+            continue
+        out["resources"][resource] = {
+            "rows": len(snap.rows),
+            "built_at": snap.built_at,
+            "stale": snap.generation != generation(resource),
+        }
+    return out
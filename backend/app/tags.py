@@ -0,0 +1,99 @@
+import json
+
+# Normalized tag index kept in sync by the write handlers:
+#   content_tags(resource, item_id, tag)  -- one row per tagged item
+#   tag_counts(resource, tag, item_count, published_count)
+# thoughts/analytics use their `tags` column, works use `tech`.
+TAG_COLUMN = {"thoughts": "tags", "works": "tech", "analytics": "tags"}
+MAX_TAG_LENGTH = 100
+
+
+def normalize_tags(tags):
+    """Trimmed, de-duplicated tags (case-insensitive, like the table collation).
+
+    Accepts a list or the raw JSON column value.
+    """
+    if isinstance(tags, (str, bytes)):
+        try:
+            tags = json.loads(tags)
+        except Exception:
+            tags = None
+    if not isinstance(tags, list):
+        return []
+    out = []
+    seen = set()
+    for t in tags:
+        if not isinstance(t, str):
+            continue
+        t = t.strip()[:MAX_TAG_LENGTH]
+        if t and t.lower() not in seen:
+            seen.add(t.lower())
+            out.append(t)
+    return out
+
+
+def sync_tags(cur, resource, item_id, old_tags, new_tags, old_published, new_published):
+    """Queue the difference between an item's old and new tags to the index.
+
+    Only the changed tags are touched; counts are adjusted by deltas rather
+    than recomputed. Pass ``new_tags=[]`` when the item is deleted, and
+    ``item_id=None`` for a row just inserted in this transaction
+    (LAST_INSERT_ID()). The statements go out with the cursor's next
+    execute(), usually the COMMIT of repository.transaction(). Returns True
+    if the index changes; the caller invalidates the "tags" cache once its
+    transaction has committed.
+    """
+    old = {t.lower(): t for t in normalize_tags(old_tags)}
+    new = {t.lower(): t for t in normalize_tags(new_tags)}
+    old_pub = 1 if old_published else 0
+    new_pub = 1 if new_published else 0
+
+    removed = [old[k] for k in old if k not in new]
+    added = [new[k] for k in new if k not in old]
+    kept = [new[k] for k in new if k in old]
+
+    deltas = []
+    for t in removed:
+        deltas.append((resource, t, -1, -old_pub))
+    for t in added:
+        deltas.append((resource, t, 1, new_pub))
+    if new_pub != old_pub:
+        for t in kept:
+            deltas.append((resource, t, 0, new_pub - old_pub))
+    if not deltas:
+        return False
+
+    if removed:
+        placeholders = ", ".join(["%s"] * len(removed))
+        cur.queue(
+            f"DELETE FROM content_tags WHERE resource = %s AND item_id = %s AND tag IN ({placeholders})",
+            (resource, item_id, *removed),
+        )
+    if added:
+        item = "%s" if item_id is not None else "LAST_INSERT_ID()"
+        args = []
+        for t in added:
+            args += [resource, item_id, t] if item_id is not None else [resource, t]
+        cur.queue(
+            "INSERT IGNORE INTO content_tags (resource, item_id, tag) VALUES "
+            + ", ".join([f"(%s, {item}, %s)"] * len(added)),
+            tuple(args),
+        )
+    cur.queue(
+        "INSERT INTO tag_counts (resource, tag, item_count, published_count) VALUES "
+        + ", ".join(["(%s, %s, %s, %s)"] * len(deltas))
+        + " ON DUPLICATE KEY UPDATE item_count = item_count + VALUES(item_count), "
+        "published_count = published_count + VALUES(published_count)",
+        tuple(v for delta in deltas for v in delta),
+    )
+    if removed:
+        cur.queue("DELETE FROM tag_counts WHERE resource = %s AND item_count <= 0", (resource,))
+    return True
+
+
+def tag_filter(resource, tag):
+    """WHERE fragment and params restricting a list query to items with ``tag``."""
+    return (
+        "id IN (SELECT item_id FROM content_tags WHERE resource = %s AND tag = %s)",
+        [resource, tag.strip()],
+    )
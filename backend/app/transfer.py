@@ -0,0 +1,235 @@
+import os
+from collections import Counter
+from datetime import datetime, timezone
+
+import pymysql
+from fastapi import HTTPException
+
+from . import blobs, repository, snapshots
+from .cache import read_cache
+from .db import get_conn
+from .fastjson import dumps, loads, make_row_mapper
+from .search import search_index
+from .tags import TAG_COLUMN, normalize_tags
+from .validators import validate_slug, validate_title
+
+# NDJSON export/import of thoughts, works and analytics metadata (one row per
+# line, the columns of the repository rows). Exports stream from an
+# unbuffered server-side cursor, EXPORT_CHUNK_ROWS rows per chunk, so memory
+# does not grow with the table. Imports insert IMPORT_BATCH_ROWS rows per
+# transaction with one executemany; rows that fail are reported by line.
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "500"))
+IMPORT_BATCH_ROWS = int(os.getenv("IMPORT_BATCH_ROWS", "1000"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+
+RESOURCES = ("thoughts", "works", "analytics")
+
+# columns that must be present (and non-null) in an imported row
+_REQUIRED = {
+    "thoughts": ("slug", "title", "content"),
+    "works": ("slug", "title", "description"),
+    "analytics": ("slug", "title", "file_url"),
+}
+_JSON_COLUMNS = {"thoughts": ("tags",), "works": ("tech", "images"), "analytics": ("tags",)}
+_DATETIME_COLUMNS = ("published_at", "created_at", "updated_at")
+
+_MAPPERS = {r: make_row_mapper(json_columns=_JSON_COLUMNS[r], bool_columns=("published",)) for r in RESOURCES}
+
+
+class RowError(Exception):
+    pass
+
+
+def _repo(resource):
+    return getattr(repository, resource)
+
+
+def export_rows(resource):
+    """Yield ``resource`` as NDJSON chunks, oldest row first."""
+    columns = _repo(resource).columns
+    normalize = _MAPPERS[resource]
+    with get_conn() as conn:
+        cur = conn.cursor(pymysql.cursors.SSDictCursor)
+        try:
+            cur.execute(f"SELECT {', '.join(columns)} FROM {resource} ORDER BY id")
+            while True:
+                rows = cur.fetchmany(EXPORT_CHUNK_ROWS)
+                if not rows:
+                    break
+                yield b"".join(dumps(normalize(row)) + b"\n" for row in rows)
+            cur.close()
+        except GeneratorExit:
+            # the client went away mid-stream: dropping the connection is
+            # cheaper than reading the rest of the result to free it
+            conn.close()
+            raise
+
+
+def _datetime(value, name):
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        raise RowError(f"{name} is not an ISO 8601 datetime")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _clean(resource, item, now):
+    """Column values for one imported row; raises RowError when it is invalid."""
+    if not isinstance(item, dict):
+        raise RowError("line is not a JSON object")
+    for name in _REQUIRED[resource]:
+        if item.get(name) is None:
+            raise RowError(f"{name} is required")
+    try:
+        validate_slug(item["slug"])
+        validate_title(item["title"])
+    except HTTPException as exc:
+        raise RowError(exc.detail)
+
+    values = {}
+    for name in _repo(resource).columns:
+        if name == "id":
+            continue
+        value = item.get(name)
+        if name == "published":
+            value = 1 if value else 0
+        elif name in _JSON_COLUMNS[resource]:
+            if value is not None and not isinstance(value, list):
+                raise RowError(f"{name} must be a list")
+            value = dumps(value).decode() if value is not None else None
+        elif name in _DATETIME_COLUMNS:
+            value = _datetime(value, name)
+        elif value is not None and not isinstance(value, (str, int, float)):
+            raise RowError(f"{name} must be a string")
+        values[name] = value
+    values["created_at"] = values["created_at"] or now
+    values["updated_at"] = values["updated_at"] or values["created_at"]
+    if "published_at" in values and values["published"] and values["published_at"] is None:
+        values["published_at"] = values["created_at"]
+    return values
+
+
+class ImportReport:
+    def __init__(self, resource):
+        self.resource = resource
+        self.received = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line, slug, message):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"line": line, "slug": slug, "error": message})
+
+    def as_dict(self):
+        return {
+            "resource": self.resource,
+            "received": self.received,
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": sorted(self.errors, key=lambda e: e["line"]),
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+# errors caused by the values of one row (duplicate key, too long, bad value)
+_ROW_ERRORS = (pymysql.err.IntegrityError, pymysql.err.DataError)
+
+
+def import_batch(resource, lines, report):
+    """Insert one batch of ``(line_number, raw_line)`` pairs in one transaction."""
+    names = [c for c in _repo(resource).columns if c != "id"]
+    insert = f"INSERT INTO {resource} ({', '.join(names)}) VALUES ({', '.join(['%s'] * len(names))})"
+    report.received += len(lines)
+
+    with repository.transaction() as cur:
+        cur.execute("SELECT NOW() AS db_now")
+        now = cur.fetchone()["db_now"]
+        pending = {}
+        for number, raw in lines:
+            slug = None
+            try:
+                item = loads(raw)
+                slug = item.get("slug") if isinstance(item, dict) else None
+                values = _clean(resource, item, now)
+            except RowError as exc:
+                report.error(number, slug, str(exc))
+                continue
+            except ValueError:
+                report.error(number, None, "invalid JSON")
+                continue
+            if values["slug"] in pending:
+                report.error(number, slug, "duplicate slug in import")
+                continue
+            pending[values["slug"]] = (number, values)
+        if not pending:
+            return
+
+        placeholders = ", ".join(["%s"] * len(pending))
+        cur.execute(f"SELECT slug FROM {resource} WHERE slug IN ({placeholders})", tuple(pending))
+        for row in cur.fetchall():
+            number, _ = pending.pop(row["slug"])
+            report.error(number, row["slug"], "slug already exists")
+        if not pending:
+            return
+
+        try:
+            cur.executemany(insert, [tuple(v[n] for n in names) for _, v in pending.values()])
+        except _ROW_ERRORS:
+            # find the offending rows one by one; a failed statement only
+            # undoes itself, the rest of the transaction stays. Connection
+            # errors are not about a row: they fail the whole import.
+            for slug, (number, values) in list(pending.items()):
+                try:
+                    cur.execute(insert, tuple(values[n] for n in names))
+                except _ROW_ERRORS as exc:
+                    del pending[slug]
+                    report.error(number, slug, exc.args[-1] if exc.args else str(exc))
+            if not pending:
+                return
+
+        placeholders = ", ".join(["%s"] * len(pending))
+        cur.execute(f"SELECT id, slug FROM {resource} WHERE slug IN ({placeholders})", tuple(pending))
+        rows = [dict(pending[r["slug"]][1], id=r["id"]) for r in cur.fetchall()]
+        _index(cur, resource, rows)
+        repository.touch(cur, resource)
+
+    report.inserted += len(rows)
+    read_cache.invalidate(resource)
+    snapshots.mark_stale(resource)
+    for row in rows:
+        search_index.upsert(resource, row)
+
+
+def _index(cur, resource, rows):
+    # tag index and blob refcounts for freshly inserted rows, in bulk
+    column = TAG_COLUMN[resource]
+    pairs = []
+    counts = Counter()
+    published = Counter()
+    refs = Counter()
+    for row in rows:
+        for tag in normalize_tags(row.get(column)):
+            pairs.append((resource, row["id"], tag))
+            counts[tag] += 1
+            published[tag] += 1 if row["published"] else 0
+        refs.update(blobs.row_refs(resource, row))
+    if pairs:
+        cur.executemany("INSERT IGNORE INTO content_tags (resource, item_id, tag) VALUES (%s, %s, %s)", pairs)
+        cur.executemany(
+            "INSERT INTO tag_counts (resource, tag, item_count, published_count) VALUES (%s, %s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE item_count = item_count + VALUES(item_count), "
+            "published_count = published_count + VALUES(published_count)",
+            [(resource, tag, n, published[tag]) for tag, n in counts.items()],
+        )
+        repository.after_commit(cur, lambda: read_cache.invalidate("tags"))
+    if refs:
+        cur.executemany(
+            "UPDATE upload_blobs SET refcount = refcount + %s WHERE name = %s",
+            [(n, name) for name, n in sorted(refs.items())],
+        )
@@ -0,0 +1,62 @@
+"""Compare the threaded (DB_ASYNC=0) and aiomysql (DB_ASYNC=1) read paths.
+
+Needs a reachable MySQL configured through the usual DB_* variables with some
+thoughts/works/analytics rows in it. Run from backend/:
+
+    python -m bench.db_modes --concurrency 100 500 --duration 20
+"""
+import argparse
+import asyncio
+import json
+
+import httpx
+
+from .common import start_server, stop_server, run_load, print_row
+
+
+def _read_requests(base_url):
+    reqs = [
+        ("GET", "/api/thoughts/?limit=10"),
+        ("GET", "/api/works/?limit=10"),
+        ("GET", "/api/analytics/?limit=10"),
+    ]
+    # add one detail page per resource when data exists
+    for resource in ("thoughts", "works", "analytics"):
+        rows = httpx.get(f"{base_url}/api/{resource}/?limit=1", timeout=10).json()
+        if rows:
+            reqs.append(("GET", f"/api/{resource}/{rows[0]['slug']}"))
+    return reqs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[100, 500])
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    results = []
+    for mode in ("0", "1"):
+        label = "threaded (DB_ASYNC=0)" if mode == "0" else "aiomysql (DB_ASYNC=1)"
+        proc = start_server(args.port, env={"DB_ASYNC": mode})
+        try:
+            reqs = _read_requests(base_url)
+            # short warm-up so both pools are filled before measuring
+            asyncio.run(run_load(base_url, reqs, 10, 2))
+            for c in args.concurrency:
+                result = asyncio.run(run_load(base_url, reqs, c, args.duration))
+                result["mode"] = label
+                print_row(label, result)
+                results.append(result)
+        finally:
+            stop_server(proc)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Load-test the API scenario by scenario at fixed concurrency levels.
+
+Boots app.main:app against the configured database (seed it first with
+``python -m bench.seed``) and drives each scenario for --duration seconds at
+every --concurrency level:
+
+    list      list pages of thoughts, works and analytics, plain and by tag
+    detail    thought/work/analytic detail pages and notebook cell pages
+    images    image variants negotiated for AVIF, WebP and JPEG clients
+    notebook  slimmed notebooks
+    upload    authenticated image uploads (new and already-stored content)
+    auth      logins (password hashing dominates)
+
+Results, with the commit and settings they were measured at, are written as
+JSON to --output; --compare prints the change against an earlier file and
+exits non-zero if any p95 got worse by more than --threshold percent.
+Run from backend/:
+
+    python -m bench.loadtest --concurrency 10 50 --output bench-results.json
+    python -m bench.loadtest --output new.json --compare bench-results.json
+"""
+import argparse
+import asyncio
+import inspect
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+from PIL import Image
+
+from app.routers import auth
+
+from .common import BACKEND_DIR, print_row, run_load, start_server, stop_server
+
+SCENARIOS = ("list", "detail", "images", "notebook", "upload", "auth")
+
+_ACCEPTS = ("image/avif,image/webp,*/*", "image/webp,*/*", "image/jpeg,*/*")
+
+
+def _admin_credentials():
+    # the account app startup creates, unless overridden
+    defaults = inspect.signature(auth.ensure_admin_user).parameters
+    return (
+        os.getenv("BENCH_USERNAME", defaults["username"].default),
+        os.getenv("BENCH_PASSWORD", defaults["password"].default),
+    )
+
+
+def _slugs(base_url, resource, limit=100):
+    rows = httpx.get(f"{base_url}/api/{resource}/", params={"limit": limit}, timeout=30).json()
+    return [r["slug"] for r in rows]
+
+
+def _upload_images(count):
+    rng = random.Random(7)
+    images = []
+    for _ in range(count):
+        img = Image.frombytes("RGB", (40, 30), rng.randbytes(40 * 30 * 3)).resize((800, 600))
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=85)
+        images.append(out.getvalue())
+    return images
+
+
+def build_scenarios(base_url, token):
+    """Request lists for every scenario, discovered from the seeded data."""
+    thoughts = _slugs(base_url, "thoughts")
+    works = _slugs(base_url, "works")
+    analytics = _slugs(base_url, "analytics")
+    auth_headers = {"Authorization": f"Bearer {token}"}
+    username, password = _admin_credentials()
+
+    scenarios = {
+        "list": [
+            ("GET", "/api/thoughts/?limit=10"),
+            ("GET", "/api/works/?limit=10"),
+            ("GET", "/api/analytics/?limit=10"),
+            ("GET", "/api/thoughts/?limit=10&tag=python"),
+            ("GET", "/api/tags/?resource=thoughts"),
+        ],
+        "detail": [("GET", f"/api/thoughts/{s}") for s in thoughts[:50]]
+        + [("GET", f"/api/works/{s}") for s in works[:20]]
+        + [("GET", f"/api/analytics/{s}/cells?offset=0&limit=20") for s in analytics[:10]],
+        "notebook": [("GET", f"/api/analytics/{s}/notebook") for s in analytics[:10]],
+        "auth": [("POST", "/api/auth/login", {"json": {"username": username, "password": password}})],
+    }
+
+    images = []
+    for slug in works[:10]:
+        work = httpx.get(f"{base_url}/api/works/{slug}", timeout=30).json()
+        images.extend(u for u in work.get("images") or [] if u.startswith("/api/images/"))
+    scenarios["images"] = [
+        ("GET", url, {"params": {"w": w}, "headers": {"Accept": accept}})
+        for url in sorted(set(images))[:20]
+        for w in (320, 640, 1280)
+        for accept in _ACCEPTS
+    ]
+
+    # half new content (full processing), half repeats (dedup path)
+    uploads = _upload_images(20)
+    scenarios["upload"] = [
+        (
+            "POST",
+            "/api/uploads/",
+            {"files": {"file": (f"bench-{i}.jpg", data, "image/jpeg")}, "data": {"category": "works"}, "headers": auth_headers},
+        )
+        for i, data in enumerate(uploads + uploads[:1] * len(uploads))
+    ]
+    return {name: reqs for name, reqs in scenarios.items() if reqs}
+
+
+def _login(base_url):
+    username, password = _admin_credentials()
+    resp = httpx.post(f"{base_url}/api/auth/login", json={"username": username, "password": password}, timeout=30)
+    resp.raise_for_status()
+    return resp.json()["access_token"]
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Print per-scenario deltas against ``baseline``; returns True on a p95 regression."""
+    old = {(r["scenario"], r["concurrency"]): r for r in baseline.get("results", [])}
+    regressed = False
+    print(f"\nagainst {baseline.get('commit') or 'baseline'}:")
+    for r in results:
+        before = old.get((r["scenario"], r["concurrency"]))
+        if before is None:
+            continue
+        rps = (r["rps"] / before["rps"] - 1) * 100 if before["rps"] else 0.0
+        p95 = (r["p95_ms"] / before["p95_ms"] - 1) * 100 if before["p95_ms"] else 0.0
+        flag = ""
+        if p95 > threshold:
+            regressed = True
+            flag = "  <-- p95 regression"
+        print(f"{r['scenario']:<10} c={r['concurrency']:<4} rps {rps:+7.1f}%  p95 {p95:+7.1f}%{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds of load before each scenario")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="earlier --output file to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="p95 regression (percent) that fails --compare")
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    results = []
+    proc = start_server(args.port, workers=args.workers)
+    try:
+        token = _login(base_url)
+        scenarios = build_scenarios(base_url, token)
+        for name in args.scenarios:
+            reqs = scenarios.get(name)
+            if not reqs:
+                print(f"{name:<28} skipped (no seeded data)")
+                continue
+            asyncio.run(run_load(base_url, reqs, 4, args.warmup))
+            for c in args.concurrency:
+                result = asyncio.run(run_load(base_url, reqs, c, args.duration))
+                result["scenario"] = name
+                print_row(name, result)
+                results.append(result)
+    finally:
+        stop_server(proc)
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {
+            "workers": args.workers,
+            "duration": args.duration,
+            "env": {k: v for k, v in os.environ.items() if k.startswith(("DB_", "IMAGE_", "READ_CACHE")) and k != "DB_PASS"},
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
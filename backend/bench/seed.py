@@ -0,0 +1,335 @@
+"""Seed the configured database with benchmark data of realistic volume.
+
+Rows are generated deterministically from --seed, so two runs with the same
+arguments produce the same data (and the same content-addressed uploads):
+
+- thoughts with large HTML bodies (default 10k, ~20 KB each), tags and a
+  featured image,
+- works with lists of images,
+- analytics notebooks of about 1 MB (code, text and base64 plot outputs).
+
+Images and notebooks are written to the blob store exactly as uploads are,
+with their derivatives and notebook cell stores built up front. Every seeded
+row has a ``bench-`` slug; --reset removes them (and their references) first.
+Point the DB_* variables at a throwaway database, then, from backend/:
+
+    python -m bench.seed --create-schema --reset
+"""
+import argparse
+import base64
+import hashlib
+import html
+import io
+import json
+import os
+import random
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from app import blobs, imaging, notebooks, repository
+from app.db import get_conn
+
+SCHEMA_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "sql", "schema.sql"))
+SLUG_PREFIX = "bench-"
+
+_WORDS = (
+    "pool cache index latency query worker upload image notebook cursor page tag search "
+    "thread process socket buffer stream batch commit schema request response header "
+    "compression variant kernel output plot metric histogram replica lock queue"
+).split()
+_TAGS = ["python", "mysql", "fastapi", "performance", "data", "ml", "web", "notes", "design", "ops"]
+_TECH = ["Python", "FastAPI", "MySQL", "Next.js", "React", "Docker", "Pandas", "Redis"]
+
+
+def _sentence(rng, words=14):
+    text = " ".join(rng.choice(_WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def _paragraphs(rng, size):
+    # editor markup, stored HTML-escaped like the admin editor saves it
+    parts = []
+    length = 0
+    while length < size:
+        p = "<p>" + " ".join(_sentence(rng) for _ in range(6)) + "</p>"
+        parts.append(p)
+        length += len(p)
+    return parts
+
+
+def _noise(rng, width, height, cell):
+    # deterministic (unlike Image.effect_noise): random cells, smoothly upscaled
+    w, h = max(1, width // cell), max(1, height // cell)
+    return Image.frombytes("L", (w, h), rng.randbytes(w * h)).resize((width, height), Image.BICUBIC)
+
+
+def _image_bytes(rng, width, height):
+    # gradients plus noise: compresses like a photo rather than flat colour
+    gradient = Image.linear_gradient("L").resize((width, height))
+    img = Image.merge("RGB", (gradient, _noise(rng, width, height, 8), gradient.rotate(rng.choice((90, 180, 270)))))
+    out = io.BytesIO()
+    img.save(out, format="PNG")
+    return out.getvalue()
+
+
+def _store_images(rng, count):
+    """Upload ``count`` images into the blob store; returns their URLs."""
+    urls = []
+    jobs = []
+    for _ in range(count):
+        data = _image_bytes(rng, rng.choice((1200, 1600, 2400)), rng.choice((800, 1000, 1350)))
+        name = f"{hashlib.sha256(data).hexdigest()}.jpg"
+        if not os.path.isfile(blobs.blob_path(name)):
+            jobs.append((data, blobs.blob_path(name)))
+        urls.append(blobs.blob_url(name))
+    if jobs:
+        # AVIF encoding dominates; use every core
+        with ProcessPoolExecutor() as pool:
+            list(pool.map(imaging.process_upload, *zip(*jobs)))
+    return urls
+
+
+def _plot_png(rng):
+    out = io.BytesIO()
+    _noise(rng, 480, 320, rng.choice((2, 4, 8))).convert("RGB").save(out, format="PNG")
+    return out.getvalue()
+
+
+def _notebook(rng, target_bytes):
+    cells = []
+    size = 0
+    n = 0
+    while size < target_bytes:
+        n += 1
+        cells.append({"cell_type": "markdown", "metadata": {}, "source": [f"## Step {n}\n", _sentence(rng, 30)]})
+        png = base64.b64encode(_plot_png(rng)).decode()
+        cells.append(
+            {
+                "cell_type": "code",
+                "execution_count": n,
+                "metadata": {},
+                "source": [f"df_{n} = load('{rng.choice(_WORDS)}')\n", f"df_{n}.plot(kind='line')\n"],
+                "outputs": [
+                    {"output_type": "stream", "name": "stdout", "text": [_sentence(rng) + "\n" for _ in range(5)]},
+                    {
+                        "output_type": "display_data",
+                        "metadata": {},
+                        "data": {"image/png": png, "text/plain": ["<Figure size 480x320>"]},
+                    },
+                ],
+            }
+        )
+        size += len(png) + 600
+    return {
+        "nbformat": 4,
+        "nbformat_minor": 5,
+        "metadata": {
+            "kernelspec": {"name": "python3", "display_name": "Python 3", "language": "python"},
+            "language_info": {"name": "python"},
+        },
+        "cells": cells,
+    }
+
+
+def _store_notebooks(rng, count, target_bytes):
+    urls = []
+    for _ in range(count):
+        data = json.dumps(_notebook(rng, target_bytes), indent=1).encode()
+        name = f"{hashlib.sha256(data).hexdigest()}.ipynb"
+        path = blobs.blob_path(name)
+        if not os.path.isfile(path):
+            with open(path, "wb") as f:
+                f.write(data)
+        if not notebooks.has_cells(path):
+            notebooks.build_cells(path)
+        urls.append(blobs.blob_url(name))
+    return urls
+
+
+def create_schema(cur, database):
+    with open(SCHEMA_FILE) as f:
+        sql = f.read()
+    sql = re.sub(r"^\s*--.*$", "", sql, flags=re.M).replace("`a_pujo`", f"`{database}`")
+    for statement in sql.split(";"):
+        if statement.strip():
+            cur.execute(statement)
+
+
+def reset(cur):
+    """Delete the bench- rows and release the uploads they referenced."""
+    refs = Counter()
+    for table, cols in (("thoughts", "featured_img, content"), ("works", "images"), ("analytics", "file_url")):
+        cur.execute(f"SELECT id, {cols} FROM {table} WHERE slug LIKE %s", (SLUG_PREFIX + "%",))
+        rows = cur.fetchall()
+        refs.update(name for row in rows for name in blobs.row_refs(table, row))
+        ids = [r["id"] for r in rows]
+        for i in range(0, len(ids), 1000):
+            chunk = ids[i : i + 1000]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cur.execute(f"DELETE FROM content_tags WHERE resource = %s AND item_id IN ({placeholders})", (table, *chunk))
+            cur.execute(f"DELETE FROM {table} WHERE id IN ({placeholders})", tuple(chunk))
+        print(f"removed {len(ids)} {table}")
+    if refs:
+        cur.executemany("UPDATE upload_blobs SET refcount = refcount - %s WHERE name = %s", [(n, k) for k, n in refs.items()])
+
+
+def _insert(cur, sql, rows, batch):
+    for i in range(0, len(rows), batch):
+        cur.executemany(sql, rows[i : i + batch])
+
+
+def seed(cur, args):
+    rng = random.Random(args.seed)
+    started = time.time()
+    images = _store_images(rng, args.images)
+    print(f"stored {len(images)} images in {time.time() - started:.1f}s")
+    started = time.time()
+    nb_urls = _store_notebooks(rng, args.analytics, args.notebook_kb * 1024)
+    print(f"stored {len(nb_urls)} notebooks in {time.time() - started:.1f}s")
+
+    refs = Counter()
+    rows = []
+    for i in range(args.thoughts):
+        featured = rng.choice(images) if images else None
+        body = _paragraphs(rng, args.body_kb * 1024)
+        if images:
+            body.insert(len(body) // 2, f'<p><img src="{rng.choice(images)}" alt="figure"></p>')
+        content = html.escape("".join(body))
+        row = {"featured_img": featured, "content": content}
+        refs.update(blobs.row_refs("thoughts", row))
+        published = 1 if rng.random() < 0.9 else 0
+        rows.append(
+            (
+                f"{SLUG_PREFIX}thought-{i}",
+                _sentence(rng, 8)[:300],
+                _sentence(rng, 30)[:500],
+                content,
+                featured,
+                published,
+                published,
+                json.dumps(rng.sample(_TAGS, rng.randint(1, 4))),
+            )
+        )
+    _insert(
+        cur,
+        "INSERT INTO thoughts (slug, title, excerpt, content, featured_img, published, published_at, tags) "
+        "VALUES (%s, %s, %s, %s, %s, %s, IF(%s, NOW(), NULL), %s)",
+        rows,
+        args.batch,
+    )
+    print(f"inserted {len(rows)} thoughts")
+
+    rows = []
+    for i in range(args.works):
+        work_images = rng.sample(images, min(len(images), rng.randint(3, 8))) if images else []
+        refs.update(blobs.row_refs("works", {"images": work_images}))
+        rows.append(
+            (
+                f"{SLUG_PREFIX}work-{i}",
+                _sentence(rng, 6)[:300],
+                html.escape("".join(_paragraphs(rng, 2048))),
+                str(2015 + i % 10),
+                json.dumps(work_images),
+                json.dumps(rng.sample(_TECH, rng.randint(1, 4))),
+                1 if rng.random() < 0.9 else 0,
+            )
+        )
+    _insert(
+        cur,
+        "INSERT INTO works (slug, title, description, year, images, tech, published) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+        rows,
+        args.batch,
+    )
+    print(f"inserted {len(rows)} works")
+
+    rows = []
+    for i, url in enumerate(nb_urls):
+        refs.update(blobs.row_refs("analytics", {"file_url": url}))
+        rows.append(
+            (
+                f"{SLUG_PREFIX}analytic-{i}",
+                _sentence(rng, 6)[:300],
+                _sentence(rng, 30)[:500],
+                url,
+                "application/json",
+                1,
+                json.dumps(rng.sample(_TAGS, rng.randint(1, 3))),
+            )
+        )
+    _insert(
+        cur,
+        "INSERT INTO analytics (slug, title, excerpt, file_url, file_type, published, published_at, tags) "
+        "VALUES (%s, %s, %s, %s, %s, %s, NOW(), %s)",
+        rows,
+        args.batch,
+    )
+    print(f"inserted {len(rows)} analytics")
+
+    # blob reference counts, as the write handlers would have kept them
+    sizes = {name: os.path.getsize(blobs.blob_path(name)) for name in refs}
+    cur.executemany(
+        "INSERT INTO upload_blobs (name, size, refcount) VALUES (%s, %s, %s) "
+        "ON DUPLICATE KEY UPDATE refcount = refcount + VALUES(refcount)",
+        [(name, sizes[name], n) for name, n in refs.items()],
+    )
+    rebuild_tags(cur)
+
+
+def rebuild_tags(cur):
+    """Rebuild content_tags/tag_counts for the bench rows (without JSON_TABLE)."""
+    for table, column in (("thoughts", "tags"), ("works", "tech"), ("analytics", "tags")):
+        cur.execute(f"SELECT id, {column} AS tags FROM {table} WHERE slug LIKE %s", (SLUG_PREFIX + "%",))
+        pairs = []
+        for row in cur.fetchall():
+            tags = json.loads(row["tags"]) if isinstance(row["tags"], str) else row["tags"] or []
+            pairs.extend((table, row["id"], t[:100]) for t in tags)
+        _insert(cur, "INSERT IGNORE INTO content_tags (resource, item_id, tag) VALUES (%s, %s, %s)", pairs, 1000)
+    cur.execute("DELETE FROM tag_counts")
+    cur.execute(
+        "INSERT INTO tag_counts (resource, tag, item_count, published_count) "
+        "SELECT ct.resource, ct.tag, COUNT(*), SUM(COALESCE(t.published, w.published, a.published, 0)) "
+        "FROM content_tags ct "
+        "LEFT JOIN thoughts t ON ct.resource = 'thoughts' AND t.id = ct.item_id "
+        "LEFT JOIN works w ON ct.resource = 'works' AND w.id = ct.item_id "
+        "LEFT JOIN analytics a ON ct.resource = 'analytics' AND a.id = ct.item_id "
+        "GROUP BY ct.resource, ct.tag"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--thoughts", type=int, default=10000)
+    parser.add_argument("--body-kb", type=int, default=20, help="approximate size of each thought body")
+    parser.add_argument("--works", type=int, default=500)
+    parser.add_argument("--analytics", type=int, default=20)
+    parser.add_argument("--notebook-kb", type=int, default=1024, help="approximate size of each notebook")
+    parser.add_argument("--images", type=int, default=40, help="distinct images shared by thoughts and works")
+    parser.add_argument("--batch", type=int, default=100, help="rows per INSERT batch")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--create-schema", action="store_true", help="apply sql/schema.sql to DB_NAME first")
+    parser.add_argument("--reset", action="store_true", help="remove previously seeded bench- rows first")
+    args = parser.parse_args()
+
+    os.makedirs(blobs.BLOB_DIR, exist_ok=True)
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            if args.create_schema:
+                create_schema(cur, os.getenv("DB_NAME") or "a_pujo")
+            if args.reset:
+                reset(cur)
+            else:
+                cur.execute("SELECT COUNT(*) AS n FROM thoughts WHERE slug LIKE %s", (SLUG_PREFIX + "%",))
+                if cur.fetchone()["n"]:
+                    parser.error("bench rows already exist; pass --reset to replace them")
+            seed(cur, args)
+            # rows changed behind the API: move the list validators
+            for resource in ("thoughts", "works", "analytics"):
+                repository.touch(cur, resource)
+
+
+if __name__ == "__main__":
+    main()
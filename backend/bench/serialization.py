@@ -0,0 +1,128 @@
+"""Per-row serialization cost of list pages: response_model path vs FAST_JSON.
+
+No database needed; rows are synthetic but shaped like the list SELECTs
+(JSON columns as strings, TINYINT flags, naive datetimes). Run from backend/:
+
+    python -m bench.serialization --rows 10 100 1000
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, serialize_response
+
+from app.fastjson import FastJSONResponse, orjson
+from app.routers import thoughts, works
+
+
+def _thought_rows(n):
+    now = datetime(2025, 1, 1, 12, 0, 0)
+    return [
+        {
+            "id": i,
+            "slug": f"thought-{i}",
+            "title": f"Thought number {i} about pooling and caching",
+            "excerpt": "A short excerpt that the index page shows under the title. " * 2,
+            "featured_img": f"/api/images/thoughts/{i}.jpg",
+            "published": 1,
+            "published_at": now - timedelta(days=i),
+            "tags": json.dumps(["python", "fastapi", "mysql"]),
+            "created_at": now - timedelta(days=i),
+            "updated_at": now - timedelta(days=i),
+        }
+        for i in range(n)
+    ]
+
+
+def _work_rows(n):
+    now = datetime(2025, 1, 1, 12, 0, 0)
+    return [
+        {
+            "id": i,
+            "slug": f"work-{i}",
+            "title": f"Work {i}",
+            "excerpt": "Portfolio card text. " * 10,
+            "year": "2024",
+            "url": "https://example.com",
+            "repo": "https://github.com/example/repo",
+            "images": json.dumps([f"/api/images/works/{i}-{k}.jpg" for k in range(4)]),
+            "tech": json.dumps(["Next.js", "FastAPI", "MySQL"]),
+            "published": 1,
+            "created_at": now - timedelta(days=i),
+            "updated_at": now - timedelta(days=i),
+        }
+        for i in range(n)
+    ]
+
+
+def _legacy_normalize(rows, json_cols):
+    # the per-row hand decoding the list endpoints used before the row mappers
+    for r in rows:
+        for col in json_cols:
+            if r.get(col) and isinstance(r[col], str):
+                try:
+                    r[col] = json.loads(r[col])
+                except Exception:
+                    r[col] = None
+        r["published"] = bool(r.get("published"))
+    return rows
+
+
+def endpoint_router(endpoint):
+    return thoughts.router if endpoint is thoughts.list_thoughts else works.router
+
+
+def _route(endpoint):
+    for route in endpoint_router(endpoint).routes:
+        if isinstance(route, APIRoute) and route.endpoint is endpoint:
+            return route
+    raise LookupError(endpoint)
+
+
+async def _time(fn, rows_factory, n, repeat):
+    # copies are made outside the timed section: the mappers mutate rows in place
+    batches = [rows_factory(n) for _ in range(repeat)]
+    start = time.perf_counter()
+    for rows in batches:
+        await fn(rows)
+    return (time.perf_counter() - start) / (repeat * n)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"encoder: {'orjson' if orjson else 'stdlib json'}")
+    cases = [
+        ("thoughts", thoughts.list_thoughts, _thought_rows, ("tags",), thoughts._normalize),
+        ("works", works.list_works, _work_rows, ("tech", "images"), works._normalize),
+    ]
+    for name, endpoint, factory, json_cols, mapper in cases:
+        route = _route(endpoint)
+
+        async def before(rows):
+            # what FastAPI does for a dict-returning endpoint with a response_model
+            rows = _legacy_normalize(rows, json_cols)
+            content = await serialize_response(field=route.response_field, response_content=rows)
+            JSONResponse(content)
+
+        async def after(rows):
+            FastJSONResponse([mapper(r) for r in rows])
+
+        for n in args.rows:
+            repeat = max(3, args.repeat * 10 // max(n, 10))
+            t_before = asyncio.run(_time(before, factory, n, repeat))
+            t_after = asyncio.run(_time(after, factory, n, repeat))
+            print(
+                f"{name:<9} rows={n:<5} before={t_before * 1e6:8.2f}us/row "
+                f"after={t_after * 1e6:8.2f}us/row speedup={t_before / t_after:5.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
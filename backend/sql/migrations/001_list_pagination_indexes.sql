@@ -0,0 +1,16 @@
+-- Composite indexes backing ORDER BY created_at DESC, id DESC on the list
+-- endpoints (offset and keyset/cursor pagination), optionally filtered by
+-- `published`. Apply once to databases created from an older schema.sql.
+USE `a_pujo`;
+
+ALTER TABLE `thoughts`
+  ADD INDEX `idx_thoughts_created` (`created_at`, `id`),
+  ADD INDEX `idx_thoughts_published_created` (`published`, `created_at`, `id`);
+
+ALTER TABLE `works`
+  ADD INDEX `idx_works_created` (`created_at`, `id`),
+  ADD INDEX `idx_works_published_created` (`published`, `created_at`, `id`);
+
+ALTER TABLE `analytics`
+  ADD INDEX `idx_analytics_created` (`created_at`, `id`),
+  ADD INDEX `idx_analytics_published_created` (`published`, `created_at`, `id`);
@@ -0,0 +1,8 @@
+-- The orphan collector's reference index (app/orphans.py RefIndex.refresh)
+-- re-reads only rows with updated_at past its cursor; these indexes keep that
+-- a range scan instead of a table scan on every pass.
+USE `a_pujo`;
+
+ALTER TABLE `thoughts` ADD INDEX `idx_thoughts_updated` (`updated_at`);
+ALTER TABLE `works` ADD INDEX `idx_works_updated` (`updated_at`);
+ALTER TABLE `analytics` ADD INDEX `idx_analytics_updated` (`updated_at`);
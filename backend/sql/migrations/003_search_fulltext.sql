@@ -0,0 +1,15 @@
+-- FULLTEXT indexes for SEARCH_ENGINE=mysql (app/search.py). Each MATCH()
+-- column list in the search queries needs an index over exactly those columns.
+USE `a_pujo`;
+
+ALTER TABLE `thoughts`
+  ADD FULLTEXT INDEX `ft_thoughts_title` (`title`),
+  ADD FULLTEXT INDEX `ft_thoughts_all` (`title`, `excerpt`, `content`);
+
+ALTER TABLE `works`
+  ADD FULLTEXT INDEX `ft_works_title` (`title`),
+  ADD FULLTEXT INDEX `ft_works_all` (`title`, `description`);
+
+ALTER TABLE `analytics`
+  ADD FULLTEXT INDEX `ft_analytics_title` (`title`),
+  ADD FULLTEXT INDEX `ft_analytics_all` (`title`, `excerpt`);
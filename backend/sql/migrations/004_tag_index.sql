@@ -0,0 +1,43 @@
+-- Normalized tag index (app/tags.py) plus a one-off backfill from the JSON
+-- columns. Needs MySQL 8.0.4+ for JSON_TABLE.
+USE `a_pujo`;
+
+CREATE TABLE IF NOT EXISTS `content_tags` (
+  `resource` VARCHAR(20) NOT NULL,
+  `item_id` BIGINT UNSIGNED NOT NULL,
+  `tag` VARCHAR(100) NOT NULL,
+  PRIMARY KEY (`resource`, `tag`, `item_id`),
+  INDEX `idx_content_tags_item` (`resource`, `item_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS `tag_counts` (
+  `resource` VARCHAR(20) NOT NULL,
+  `tag` VARCHAR(100) NOT NULL,
+  `item_count` INT NOT NULL DEFAULT 0,
+  `published_count` INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (`resource`, `tag`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT IGNORE INTO `content_tags` (`resource`, `item_id`, `tag`)
+SELECT 'thoughts', t.id, LEFT(TRIM(j.tag), 100)
+FROM `thoughts` t, JSON_TABLE(t.tags, '$[*]' COLUMNS (tag VARCHAR(1000) PATH '$')) j
+WHERE j.tag IS NOT NULL AND TRIM(j.tag) <> '';
+
+INSERT IGNORE INTO `content_tags` (`resource`, `item_id`, `tag`)
+SELECT 'works', w.id, LEFT(TRIM(j.tag), 100)
+FROM `works` w, JSON_TABLE(w.tech, '$[*]' COLUMNS (tag VARCHAR(1000) PATH '$')) j
+WHERE j.tag IS NOT NULL AND TRIM(j.tag) <> '';
+
+INSERT IGNORE INTO `content_tags` (`resource`, `item_id`, `tag`)
+SELECT 'analytics', a.id, LEFT(TRIM(j.tag), 100)
+FROM `analytics` a, JSON_TABLE(a.tags, '$[*]' COLUMNS (tag VARCHAR(1000) PATH '$')) j
+WHERE j.tag IS NOT NULL AND TRIM(j.tag) <> '';
+
+DELETE FROM `tag_counts`;
+INSERT INTO `tag_counts` (`resource`, `tag`, `item_count`, `published_count`)
+SELECT ct.resource, ct.tag, COUNT(*), SUM(COALESCE(t.published, w.published, a.published, 0))
+FROM `content_tags` ct
+LEFT JOIN `thoughts` t ON ct.resource = 'thoughts' AND t.id = ct.item_id
+LEFT JOIN `works` w ON ct.resource = 'works' AND w.id = ct.item_id
+LEFT JOIN `analytics` a ON ct.resource = 'analytics' AND a.id = ct.item_id
+GROUP BY ct.resource, ct.tag;
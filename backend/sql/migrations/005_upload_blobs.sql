@@ -0,0 +1,11 @@
+-- Reference counts for content-addressed uploads (app/blobs.py). Files
+-- uploaded before this keep their old per-category paths and are not counted.
+USE `a_pujo`;
+
+CREATE TABLE IF NOT EXISTS `upload_blobs` (
+  `name` VARCHAR(80) NOT NULL PRIMARY KEY,
+  `size` BIGINT UNSIGNED NOT NULL DEFAULT 0,
+  `refcount` INT NOT NULL DEFAULT 0,
+  `uploaded_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  INDEX `idx_upload_blobs_refcount` (`refcount`, `uploaded_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,17 @@
+-- Change counters behind the HTTP validators (app/conditional.py). Every row
+-- gets a version that each update bumps, and content_versions holds one
+-- counter per resource that every create/update/delete bumps in the same
+-- transaction, so deletes and same-second edits change the ETags too.
+USE `a_pujo`;
+
+ALTER TABLE `thoughts` ADD COLUMN `version` INT UNSIGNED NOT NULL DEFAULT 1;
+ALTER TABLE `works` ADD COLUMN `version` INT UNSIGNED NOT NULL DEFAULT 1;
+ALTER TABLE `analytics` ADD COLUMN `version` INT UNSIGNED NOT NULL DEFAULT 1;
+
+CREATE TABLE IF NOT EXISTS `content_versions` (
+  `resource` VARCHAR(20) NOT NULL PRIMARY KEY,
+  `version` BIGINT UNSIGNED NOT NULL DEFAULT 0,
+  `changed_at` DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT IGNORE INTO `content_versions` (`resource`) VALUES ('thoughts'), ('works'), ('analytics');
@@ -16,8 +16,12 @@ CREATE TABLE IF NOT EXISTS `thoughts` (
   `tags` JSON DEFAULT NULL,
   `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
   `updated_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  `version` INT UNSIGNED NOT NULL DEFAULT 1,
   INDEX (`published`),
-  INDEX (`published_at`)
+  INDEX (`published_at`),
+  INDEX `idx_thoughts_created` (`created_at`, `id`),
+  INDEX `idx_thoughts_published_created` (`published`, `created_at`, `id`),
+  INDEX `idx_thoughts_updated` (`updated_at`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- users (admin)
@@ -44,7 +48,11 @@ CREATE TABLE IF NOT EXISTS `works` (
   `tech` JSON DEFAULT NULL,
   `published` TINYINT(1) NOT NULL DEFAULT 0,
   `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-  `updated_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+  `updated_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  `version` INT UNSIGNED NOT NULL DEFAULT 1,
+  INDEX `idx_works_created` (`created_at`, `id`),
+  INDEX `idx_works_published_created` (`published`, `created_at`, `id`),
+  INDEX `idx_works_updated` (`updated_at`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- analytics
@@ -60,6 +68,46 @@ CREATE TABLE IF NOT EXISTS `analytics` (
   `tags` JSON DEFAULT NULL,
   `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
   `updated_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  `version` INT UNSIGNED NOT NULL DEFAULT 1,
   INDEX (`published`),
-  INDEX (`published_at`)
+  INDEX (`published_at`),
+  INDEX `idx_analytics_created` (`created_at`, `id`),
+  INDEX `idx_analytics_published_created` (`published`, `created_at`, `id`),
+  INDEX `idx_analytics_updated` (`updated_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- tag index, maintained incrementally by the write handlers (app/tags.py)
+CREATE TABLE IF NOT EXISTS `content_tags` (
+  `resource` VARCHAR(20) NOT NULL,
+  `item_id` BIGINT UNSIGNED NOT NULL,
+  `tag` VARCHAR(100) NOT NULL,
+  PRIMARY KEY (`resource`, `tag`, `item_id`),
+  INDEX `idx_content_tags_item` (`resource`, `item_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS `tag_counts` (
+  `resource` VARCHAR(20) NOT NULL,
+  `tag` VARCHAR(100) NOT NULL,
+  `item_count` INT NOT NULL DEFAULT 0,
+  `published_count` INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (`resource`, `tag`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- content-addressed uploads (static/uploads/blobs/<sha256><ext>) and how many
+-- rows reference each one; maintained by the write handlers (app/blobs.py)
+CREATE TABLE IF NOT EXISTS `upload_blobs` (
+  `name` VARCHAR(80) NOT NULL PRIMARY KEY,
+  `size` BIGINT UNSIGNED NOT NULL DEFAULT 0,
+  `refcount` INT NOT NULL DEFAULT 0,
+  `uploaded_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  INDEX `idx_upload_blobs_refcount` (`refcount`, `uploaded_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- per-resource change counters behind the list validators (app/conditional.py)
+CREATE TABLE IF NOT EXISTS `content_versions` (
+  `resource` VARCHAR(20) NOT NULL PRIMARY KEY,
+  `version` BIGINT UNSIGNED NOT NULL DEFAULT 0,
+  `changed_at` DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT IGNORE INTO `content_versions` (`resource`) VALUES ('thoughts'), ('works'), ('analytics');
@@ -0,0 +1,105 @@
+import os
+from contextlib import contextmanager
+
+import pytest
+
+# before any app import: no shared-memory cache, no aiomysql pool
+os.environ.setdefault("READ_CACHE_SHARED", "0")
+os.environ.setdefault("DB_ASYNC", "0")
+
+
+class FakeCursor:
+    """Enough of db._TimedCursor: every statement is logged and answered by ``conn.handler``.
+
+    Queued statements run with the next execute(); ``conn.round_trips``
+    counts the execute() calls.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+        self.rowcount = 0
+        self.lastrowid = 1
+        self.queued = []
+
+    def _run(self, query, args):
+        self.conn.log.append((query, args))
+        self.rows = list(self.conn.handler(query, args) or [])
+        self.rowcount = len(self.rows)
+
+    def queue(self, query, args=None, into=None):
+        self.queued.append((query, args, into))
+
+    def execute(self, query, args=None):
+        self.conn.round_trips += 1
+        queued, self.queued = self.queued, []
+        for q, a, into in queued:
+            self._run(q, a)
+            if into is not None:
+                into.extend(self.rows)
+        self._run(query, args)
+        return self.rowcount
+
+    def executemany(self, query, args):
+        self.conn.round_trips += 1
+        self.conn.log.append((query, args))
+        for a in args:
+            self.conn.handler(query, a)
+        return len(args)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.log = []
+        self.round_trips = 0
+        self.handler = lambda query, args: []
+
+    def cursor(self, *args):
+        return FakeCursor(self)
+
+    def begin(self):
+        self.log.append(("BEGIN", None))
+
+    def commit(self):
+        self.log.append(("COMMIT", None))
+
+    def rollback(self):
+        self.log.append(("ROLLBACK", None))
+
+    def statements(self):
+        return [query for query, _ in self.log]
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """A FakeConnection handed out by get_conn(); rolls back when the block raises."""
+    from app import db, repository
+
+    conn = FakeConnection()
+
+    @contextmanager
+    def get_conn():
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+
+    monkeypatch.setattr(db, "get_conn", get_conn)
+    monkeypatch.setattr(repository, "get_conn", get_conn)
+    return conn
@@ -0,0 +1,63 @@
+from app import blobs
+
+A = "a" * 64 + ".jpg"
+B = "b" * 64 + ".png"
+C = "c" * 64 + ".pdf"
+
+
+def _cursor(conn, released=()):
+    def handler(query, args):
+        if query.startswith("SELECT name FROM upload_blobs"):
+            return [{"name": name} for name in released]
+        return []
+
+    conn.handler = handler
+    return conn, conn.cursor()
+
+
+def test_sync_refs_moves_counts_by_delta(fake_db):
+    conn, cur = _cursor(fake_db)
+    blobs.sync_refs(cur, {A, B}, {B, C})
+    assert conn.log == []
+    cur.execute("COMMIT")
+    (add_sql, add_args), (remove_sql, remove_args) = conn.log[:2]
+    assert "refcount + 1" in add_sql and add_args == (C,)
+    assert "refcount - 1" in remove_sql and remove_args == (A,)
+    assert conn.round_trips == 1
+
+
+def test_sync_refs_unchanged_is_a_no_op(fake_db):
+    conn, cur = _cursor(fake_db)
+    assert blobs.sync_refs(cur, {A}, {A}) == []
+    cur.execute("COMMIT")
+    assert conn.statements() == ["COMMIT"]
+
+
+def test_sync_refs_fills_released_rows_without_deleting(fake_db, monkeypatch):
+    removed = []
+    monkeypatch.setattr(blobs, "delete_blob", removed.append)
+    _, cur = _cursor(fake_db, released=[A, B])
+    released = blobs.sync_refs(cur, {A, B}, set())
+    assert released == []
+    cur.execute("COMMIT")
+    assert released == [{"name": A}, {"name": B}]
+    assert removed == []
+
+
+def test_sync_refs_selects_and_deletes_with_one_cutoff(fake_db):
+    conn, cur = _cursor(fake_db, released=[A])
+    blobs.sync_refs(cur, {A}, set())
+    cur.execute("COMMIT")
+    statements = conn.statements()
+    select = next(q for q in statements if q.startswith("SELECT name FROM upload_blobs"))
+    delete = next(q for q in statements if q.startswith("DELETE FROM upload_blobs"))
+    assert statements.index(select) < statements.index(delete)
+    assert "@blob_cutoff" in select and "@blob_cutoff" in delete
+
+
+def test_row_refs():
+    url = f"/api/images/blobs/{A}"
+    assert blobs.row_refs("thoughts", {"featured_img": url, "content": f'<a href="/static/uploads/blobs/{B}">'}) == {A, B}
+    assert blobs.row_refs("works", {"images": f'["{url}"]'}) == {A}
+    assert blobs.row_refs("analytics", {"file_url": f"/static/uploads/blobs/{C}"}) == {C}
+    assert blobs.row_refs("thoughts", None) == set()
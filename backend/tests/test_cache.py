@@ -0,0 +1,114 @@
+import fcntl
+import os
+import time
+from datetime import date, datetime
+
+import pytest
+
+from app.cache import SharedTTLCache, TTLCache
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(2, 60)
+    cache.set(("thoughts", "slug", "a", None), 1)
+    cache.set(("thoughts", "slug", "b", None), 2)
+    cache.get(("thoughts", "slug", "a", None))
+    cache.set(("thoughts", "slug", "c", None), 3)
+    assert cache.get(("thoughts", "slug", "b", None)) is None
+    assert cache.get(("thoughts", "slug", "a", None)) == 1
+    assert cache.evictions == 1
+
+
+def test_ttl_cache_expires(monkeypatch):
+    cache = TTLCache(8, 10)
+    cache.set(("works", "list", 0), "page")
+    now = time.monotonic()
+    monkeypatch.setattr("app.cache.time.monotonic", lambda: now + 11)
+    assert cache.get(("works", "list", 0)) is None
+    assert cache.expirations == 1
+
+
+def test_ttl_cache_invalidate_drops_lists_and_given_slugs():
+    cache = TTLCache(8, 60)
+    cache.set(("thoughts", "list", 0), "page")
+    cache.set(("thoughts", "slug", "a", None), "a")
+    cache.set(("thoughts", "slug", "b", None), "b")
+    cache.set(("works", "list", 0), "works")
+    cache.invalidate("thoughts", "a")
+    assert cache.get(("thoughts", "list", 0)) is None
+    assert cache.get(("thoughts", "slug", "a", None)) is None
+    assert cache.get(("thoughts", "slug", "b", None)) == "b"
+    assert cache.get(("works", "list", 0)) == "works"
+
+
+@pytest.fixture
+def shared(tmp_path):
+    return SharedTTLCache(str(tmp_path / "cache"), 8, 60, 1 << 16)
+
+
+def test_shared_cache_round_trips_rows(shared):
+    key = ("thoughts", "slug", "a", None)
+    entry = ({"id": 1, "tags": ["x"], "created_at": datetime(2025, 1, 2, 3, 4, 5, 6), "day": date(2025, 1, 2)}, '"etag"', datetime(2025, 1, 2))
+    assert shared.get(key) is None
+    shared.set(key, entry)
+    row, etag, last_modified = shared.get(key)
+    assert row == entry[0]
+    assert (etag, last_modified) == entry[1:]
+
+
+def test_shared_cache_is_shared_between_instances(tmp_path, shared):
+    other = SharedTTLCache(str(tmp_path / "cache"), 8, 60, 1 << 16)
+    shared.set(("works", "list", 0), ["page"])
+    assert other.get(("works", "list", 0)) == ["page"]
+    other.invalidate("works")
+    assert shared.get(("works", "list", 0)) is None
+
+
+def test_shared_cache_invalidation_is_per_resource(shared):
+    shared.set(("works", "list", 0), "works")
+    shared.set(("thoughts", "list", 0), "thoughts")
+    shared.invalidate("thoughts")
+    assert shared.get(("thoughts", "list", 0)) is None
+    assert shared.get(("works", "list", 0)) == "works"
+    shared.clear()
+    assert shared.get(("works", "list", 0)) is None
+
+
+def test_shared_cache_drops_set_after_racing_invalidation(shared):
+    key = ("thoughts", "list", 0)
+    assert shared.get(key) is None
+    # another worker commits a write while this one loads the page
+    shared.invalidate("thoughts")
+    shared.set(key, "old page")
+    assert shared.get(key) is None
+    shared.set(key, "new page")
+    assert shared.get(key) == "new page"
+
+
+def test_shared_cache_refuses_file_readable_by_others(tmp_path, shared):
+    os.chmod(shared.path, 0o644)
+    with pytest.raises(OSError):
+        SharedTTLCache(str(tmp_path / "cache"), 8, 60, 1 << 16)
+
+
+def test_shared_cache_refuses_other_layout(tmp_path, shared):
+    with open(shared.path, "r+b") as f:
+        f.write(b"NOTMAGIC")
+    with pytest.raises(OSError):
+        SharedTTLCache(str(tmp_path / "cache"), 8, 60, 1 << 16)
+
+
+def test_shared_cache_set_skips_when_another_writer_holds_the_lock(shared):
+    key = ("works", "list", 0)
+    # flock conflicts between open file descriptions, as with another worker
+    fd = os.open(shared.path, os.O_RDWR)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        shared.set(key, "page")
+        assert shared.get(key) is None
+        assert shared.contended == 1
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        shared.set(key, "page")
+        assert shared.get(key) == "page"
+    finally:
+        os.close(fd)
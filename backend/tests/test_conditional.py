@@ -0,0 +1,62 @@
+from datetime import datetime
+
+from starlette.requests import Request
+
+from app.conditional import detail_validators, http_date, list_validators, not_modified
+
+
+def _request(**headers):
+    raw = [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+
+def test_detail_etag_changes_with_version_and_fields():
+    updated_at = datetime(2025, 1, 1, 12, 0, 0)
+    etag, last_modified = detail_validators("thoughts", 1, 3, updated_at)
+    assert last_modified == updated_at
+    # two edits within one second share updated_at but not the version
+    assert detail_validators("thoughts", 1, 4, updated_at)[0] != etag
+    assert detail_validators("thoughts", 1, 3, updated_at, "title")[0] != etag
+    assert detail_validators("works", 1, 3, updated_at)[0] != etag
+    assert detail_validators("thoughts", 1, 3, updated_at)[0] == etag
+
+
+def test_list_validators_follow_content_version():
+    changed_at = datetime(2025, 1, 1, 12, 0, 0, 500000)
+    key = ("thoughts", "list", 0, 10)
+    etag, last_modified = list_validators("thoughts", key, {"version": 7, "changed_at": changed_at})
+    assert last_modified == changed_at
+    assert list_validators("thoughts", key, {"version": 8, "changed_at": changed_at})[0] != etag
+    assert list_validators("thoughts", ("thoughts", "list", 10, 10), {"version": 7, "changed_at": changed_at})[0] != etag
+    # no content_versions row before the first write
+    assert list_validators("thoughts", key, None) == list_validators("thoughts", key, {"version": 0})
+
+
+def test_not_modified_by_etag():
+    etag = '"abc"'
+    assert not_modified(_request(if_none_match='"x", "abc"'), etag, None)
+    assert not_modified(_request(if_none_match='W/"abc"'), etag, None)
+    assert not_modified(_request(if_none_match="*"), etag, None)
+    assert not not_modified(_request(if_none_match='"x"'), etag, None)
+    assert not not_modified(_request(), etag, None)
+
+
+def test_not_modified_by_date():
+    last_modified = datetime(2025, 1, 1, 12, 0, 0)
+    assert not_modified(_request(if_modified_since=http_date(last_modified)), '"abc"', last_modified)
+    assert not not_modified(_request(if_modified_since=http_date(datetime(2024, 12, 31))), '"abc"', last_modified)
+    assert not not_modified(_request(if_modified_since="garbage"), '"abc"', last_modified)
+
+
+def test_etag_takes_precedence_over_date():
+    last_modified = datetime(2025, 1, 1, 12, 0, 0)
+    request = _request(if_none_match='"other"', if_modified_since=http_date(last_modified))
+    assert not not_modified(request, '"abc"', last_modified)
+
+
+def test_detail_ignores_date():
+    # a second edit within the same second keeps updated_at, so the date can't tell
+    last_modified = datetime(2025, 1, 1, 12, 0, 0)
+    request = _request(if_modified_since=http_date(last_modified))
+    assert not not_modified(request, '"abc"', last_modified, by_date=False)
+    assert not_modified(_request(if_none_match='"abc"'), '"abc"', last_modified, by_date=False)
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from app import db
+
+
+class SlowPool:
+    """Hands out a connection only after ``delay`` seconds, like a busy aiomysql pool."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.released = []
+
+    async def acquire(self):
+        await asyncio.sleep(self.delay)
+        return "conn"
+
+    def release(self, conn):
+        self.released.append(conn)
+
+
+def test_acquire_returns_connection():
+    pool = SlowPool(0)
+    assert asyncio.run(db._acquire(pool, 1)) == "conn"
+    assert pool.released == []
+
+
+def test_acquire_timeout_releases_late_connection():
+    pool = SlowPool(0.05)
+
+    async def run():
+        with pytest.raises(db.PoolTimeout):
+            await db._acquire(pool, 0.01)
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    # the acquire was cancelled before it finished: nothing to give back
+    assert pool.released == []
+
+
+def test_acquire_done_as_timeout_fires_goes_back_to_pool():
+    pool = SlowPool(0)
+
+    async def run():
+        fut = asyncio.ensure_future(pool.acquire())
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        assert fut.done()
+        db._release_when_acquired(pool, fut)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert pool.released == ["conn"]
@@ -0,0 +1,32 @@
+import pytest
+from PIL import Image
+
+from app import imaging
+from app.cache import file_meta_cache
+
+
+def test_remove_variants_evicts_only_that_upload(tmp_path):
+    path = tmp_path / "thoughts" / "1700000000-1.jpg"
+    (tmp_path / "thoughts" / imaging.VARIANTS_DIR / "1700000000-1").mkdir(parents=True)
+    removed = ("images", "thoughts", "1700000000-1.jpg", None, None, (), True)
+    kept = ("images", "thoughts", "1700000000-2.jpg", None, None, (), True)
+    file_meta_cache.set(removed, "meta")
+    file_meta_cache.set(kept, "meta")
+    imaging.remove_variants(str(path))
+    assert file_meta_cache.get(removed) is None
+    assert file_meta_cache.get(kept) == "meta"
+    assert not (tmp_path / "thoughts" / imaging.VARIANTS_DIR / "1700000000-1").exists()
+
+
+def test_save_original_rejects_undecodable_bytes(tmp_path):
+    with pytest.raises(imaging.InvalidImage):
+        imaging.save_original(b"not an image", str(tmp_path / "out.jpg"))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_save_original_write_errors_are_not_invalid_images(tmp_path):
+    source = tmp_path / "in.png"
+    Image.new("RGB", (4, 4)).save(source)
+    # the decode succeeds; failing to write the JPEG is not a bad upload
+    with pytest.raises(FileNotFoundError):
+        imaging.save_original(str(source), str(tmp_path / "missing" / "out.jpg"))
@@ -0,0 +1,96 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from app import compression, notebooks, orphans, repository, snapshots, transfer
+from app.fastjson import dumps
+from app.orphans import _UPLOAD_NAME_RE
+
+DIGEST = "0" * 64
+
+
+@pytest.mark.parametrize("name", [
+    f"{DIGEST}.jpg",
+    f"{DIGEST}.jpg.1234.tmp",
+    "1700000000-42.png",
+    ".upload-abc123.part",
+    ".upload-abc123.part.99.link",
+])
+def test_upload_names_are_collected(name):
+    assert _UPLOAD_NAME_RE.match(name)
+
+
+@pytest.mark.parametrize("name", [".gitkeep", ".htaccess", "README.md", "logo.png", f"{DIGEST}.jpg.bak", "x.part"])
+def test_other_files_are_left_alone(name):
+    assert not _UPLOAD_NAME_RE.match(name)
+
+
+NOW = datetime(2025, 6, 1, 12, 0, 0)
+LEGACY = "1600000000-1.ipynb"
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    base = tmp_path / "uploads"
+    (base / "analytics").mkdir(parents=True)
+    monkeypatch.setattr(orphans, "UPLOADS_BASE", str(base))
+    monkeypatch.setattr(orphans, "STATE_DIR", str(tmp_path / "state"))
+    monkeypatch.setattr(compression, "COMPRESS_CACHE_DIR", str(tmp_path / "compressed"))
+    monkeypatch.setattr(notebooks, "ASSET_DIR", str(tmp_path / "assets"))
+    monkeypatch.setattr(snapshots, "mark_stale", lambda resource: None)
+    (tmp_path / "state").mkdir()
+    return base
+
+
+def _old_file(path):
+    path.write_text("{}")
+    os.utime(path, (0, 0))
+
+
+def _database(fake_db):
+    """An analytics table with no rows, enough for import_batch and the collector."""
+    names = [c for c in repository.analytics.columns if c != "id"]
+    rows = []
+
+    def handler(query, args):
+        if query.startswith("SELECT NOW()"):
+            return [{"db_now": NOW}]
+        if query.startswith("INSERT INTO analytics"):
+            rows.append(dict(zip(names, args), id=len(rows) + 1))
+        elif query.startswith("SELECT id, slug FROM analytics"):
+            return [r for r in rows if r["slug"] in args]
+        elif query.startswith("SELECT id FROM analytics"):
+            return [{"id": r["id"]} for r in rows]
+        elif query.startswith("SELECT id, file_url FROM analytics"):
+            if "updated_at >=" in query:
+                return [r for r in rows if str(r["updated_at"]) >= args[0]]
+            if "id IN" in query:
+                return [r for r in rows if r["id"] in args]
+            return list(rows)
+        return []
+
+    fake_db.handler = handler
+    return rows
+
+
+def test_imported_row_with_old_dates_protects_its_legacy_file(fake_db, uploads):
+    rows = _database(fake_db)
+    # an earlier pass set the index cursor; then the uploads are restored and
+    # their rows imported
+    orphans._collect(fake_db.cursor(), dry_run=False, grace=3600)
+    _old_file(uploads / "analytics" / LEGACY)
+    _old_file(uploads / "analytics" / "1600000000-2.ipynb")
+
+    line = dumps({
+        "slug": "old", "title": "Old", "file_url": f"/static/uploads/analytics/{LEGACY}", "published": True,
+        "created_at": "2020-01-01T00:00:00", "updated_at": "2020-01-01T00:00:00",
+    })
+    report = transfer.ImportReport("analytics")
+    transfer.import_batch("analytics", [(1, line)], report)
+    assert report.inserted == 1 and rows[0]["updated_at"] == datetime(2020, 1, 1)
+
+    result = orphans._collect(fake_db.cursor(), dry_run=False, grace=3600)
+    assert result["rows_reindexed"] == 1
+    assert (uploads / "analytics" / LEGACY).exists()
+    assert not (uploads / "analytics" / "1600000000-2.ipynb").exists()
@@ -0,0 +1,165 @@
+from datetime import datetime
+
+import pymysql
+import pytest
+
+from app import blobs, repository
+
+NOW = datetime(2025, 1, 1, 12, 0, 0)
+BLOB = "a" * 64 + ".jpg"
+
+
+def _thought(**values):
+    row = {
+        "id": 1, "slug": "t-1", "title": "T", "excerpt": None, "featured_img": None, "content": "body",
+        "published": 1, "published_at": NOW, "tags": '["a"]', "created_at": NOW, "updated_at": NOW,
+    }
+    row.update(values)
+    return row
+
+
+@pytest.fixture
+def deleted(fake_db, monkeypatch):
+    """Names passed to blobs.delete_blob, with whether the write had committed by then."""
+    calls = []
+    monkeypatch.setattr(blobs, "delete_blob", lambda name: calls.append((name, ("COMMIT", None) in fake_db.log)))
+    return calls
+
+
+def _handler(old_row=None, registered=()):
+    def handler(query, args):
+        if query.startswith("SELECT id, slug") and "FOR UPDATE" in query:
+            return [dict(old_row)]
+        if query.startswith("SELECT id, created_at, updated_at"):
+            return [{"id": 7, "created_at": NOW, "updated_at": NOW, "published_at": NOW}]
+        if query.startswith("SELECT updated_at"):
+            return [{"updated_at": NOW, "published_at": NOW}]
+        if query.startswith("SELECT name FROM upload_blobs WHERE name IN"):
+            return [{"name": name} for name in args]
+        if query.startswith("SELECT name FROM upload_blobs WHERE name = %s FOR UPDATE"):
+            return [{"name": args[0]}] if args[0] in registered else []
+        return []
+    return handler
+
+
+def test_after_commit_runs_after_commit(fake_db):
+    ran = []
+    with repository.transaction() as cur:
+        repository.after_commit(cur, lambda: ran.append(fake_db.statements()[-1]))
+        assert ran == []
+    assert ran == ["COMMIT"]
+
+
+def test_after_commit_skipped_on_rollback(fake_db):
+    ran = []
+    with pytest.raises(RuntimeError):
+        with repository.transaction() as cur:
+            repository.after_commit(cur, lambda: ran.append(True))
+            raise RuntimeError
+    assert ran == []
+    assert "ROLLBACK" in fake_db.statements()
+    assert "COMMIT" not in fake_db.statements()
+
+
+def test_after_commit_errors_do_not_undo_the_write(fake_db):
+    ran = []
+    with repository.transaction() as cur:
+        repository.after_commit(cur, lambda: 1 / 0)
+        repository.after_commit(cur, lambda: ran.append(True))
+    assert ran == [True]
+
+
+def test_after_commit_outside_transaction_runs_now():
+    ran = []
+    repository.after_commit(object(), lambda: ran.append(True))
+    assert ran == [True]
+
+
+def test_create_is_one_round_trip(fake_db, deleted):
+    fake_db.handler = _handler()
+    with repository.transaction() as cur:
+        row = repository.thoughts.create(cur, {"slug": "t-7", "title": "T", "content": "body", "published": 1, "tags": '["a"]'})
+    assert fake_db.round_trips == 1
+    assert (row["id"], row["created_at"], row["published_at"]) == (7, NOW, NOW)
+    statements = fake_db.statements()
+    assert statements[0] == "START TRANSACTION" and statements[-1] == "COMMIT"
+    insert = next(q for q in statements if q.startswith("INSERT INTO thoughts"))
+    assert "IF(%s, NOW(), NULL)" in insert and "SELECT NOW()" not in statements
+    assert any("LAST_INSERT_ID()" in q for q in statements if q.startswith("INSERT IGNORE INTO content_tags"))
+
+
+def test_update_is_two_round_trips_and_bumps_versions(fake_db, deleted):
+    fake_db.handler = _handler(_thought())
+    with repository.transaction() as cur:
+        old, new = repository.thoughts.update(cur, "t-1", {"title": "New", "published": 0})
+    assert fake_db.round_trips == 2
+    assert (old["title"], new["title"], new["updated_at"]) == ("T", "New", NOW)
+    statements = fake_db.statements()
+    assert statements[:2] == ["START TRANSACTION", statements[1]] and "FOR UPDATE" in statements[1]
+    update = next(q for q in statements if q.startswith("UPDATE thoughts"))
+    assert "version = version + 1" in update and "updated_at = NOW()" in update
+    touch = statements.index(repository.TOUCH_SQL)
+    assert statements.index(update) < touch < statements.index("COMMIT")
+    assert deleted == []
+
+
+def test_delete_is_two_round_trips(fake_db, deleted):
+    fake_db.handler = _handler(_thought())
+    with repository.transaction() as cur:
+        repository.thoughts.delete(cur, "t-1")
+    assert fake_db.round_trips == 2
+    assert "BEGIN" not in fake_db.statements()
+
+
+def test_missing_row_is_not_found_and_rolled_back(fake_db):
+    with pytest.raises(repository.NotFound):
+        with repository.transaction() as cur:
+            repository.thoughts.update(cur, "nope", {"title": "New"})
+    assert fake_db.statements()[-1] == "ROLLBACK"
+
+
+def test_duplicate_key_on_commit_is_conflict(fake_db):
+    def handler(query, args):
+        if query.startswith("INSERT INTO thoughts"):
+            raise pymysql.err.IntegrityError(1062, "Duplicate entry")
+        return []
+
+    fake_db.handler = handler
+    with pytest.raises(repository.Conflict):
+        with repository.transaction() as cur:
+            repository.thoughts.create(cur, {"slug": "t-1", "title": "T", "content": "body"})
+    assert fake_db.statements()[-1] == "ROLLBACK"
+
+
+def test_released_blob_is_deleted_after_commit(fake_db, deleted):
+    fake_db.handler = _handler(_thought(featured_img=f"/api/images/blobs/{BLOB}"))
+    with repository.transaction() as cur:
+        repository.thoughts.update(cur, "t-1", {"featured_img": None})
+        assert deleted == []
+    assert deleted == [(BLOB, True)]
+
+
+def test_released_blob_is_kept_on_rollback(fake_db, deleted):
+    fake_db.handler = _handler(_thought(featured_img=f"/api/images/blobs/{BLOB}"))
+    with pytest.raises(RuntimeError):
+        with repository.transaction() as cur:
+            repository.thoughts.update(cur, "t-1", {"featured_img": None})
+            raise RuntimeError
+    assert deleted == []
+
+
+def test_released_blob_uploaded_again_is_kept(fake_db, deleted):
+    fake_db.handler = _handler(_thought(featured_img=f"/api/images/blobs/{BLOB}"), registered={BLOB})
+    with repository.transaction() as cur:
+        repository.thoughts.update(cur, "t-1", {"featured_img": None})
+    assert deleted == []
+
+
+def test_delete_releases_every_reference(fake_db, deleted):
+    other = "b" * 64 + ".png"
+    content = f'<img src="/static/uploads/blobs/{other}">'
+    fake_db.handler = _handler(_thought(featured_img=f"/api/images/blobs/{BLOB}", content=content))
+    with repository.transaction() as cur:
+        repository.thoughts.delete(cur, "t-1")
+    assert sorted(name for name, _ in deleted) == sorted([BLOB, other])
+    assert all(committed for _, committed in deleted)
@@ -0,0 +1,54 @@
+from datetime import datetime
+
+import pymysql
+import pytest
+
+from app import repository, snapshots, transfer
+from app.fastjson import dumps
+
+
+@pytest.fixture
+def table(fake_db, monkeypatch):
+    """An analytics table whose INSERTs raise ``failures[slug]`` for the given slugs."""
+    monkeypatch.setattr(snapshots, "mark_stale", lambda resource: None)
+    names = [c for c in repository.analytics.columns if c != "id"]
+    # by slug: the fake executemany runs the rows of a failed batch again
+    rows, failures = {}, {}
+
+    def handler(query, args):
+        if query.startswith("SELECT NOW()"):
+            return [{"db_now": datetime(2025, 6, 1)}]
+        if query.startswith("INSERT INTO analytics"):
+            row = dict(zip(names, args))
+            if row["slug"] in failures:
+                raise failures[row["slug"]]
+            rows.setdefault(row["slug"], dict(row, id=len(rows) + 1))
+        elif query.startswith("SELECT id, slug FROM analytics"):
+            return [r for r in rows.values() if r["slug"] in args]
+        return []
+
+    fake_db.handler = handler
+    return rows, failures
+
+
+def _lines(*slugs):
+    return [(n, dumps({"slug": slug, "title": slug.title(), "file_url": f"/static/uploads/analytics/{slug}.pdf"})) for n, slug in enumerate(slugs, 1)]
+
+
+def test_rejected_rows_are_reported_the_rest_inserted(table):
+    rows, failures = table
+    failures["b"] = pymysql.err.DataError(1406, "Data too long for column 'title'")
+    report = transfer.ImportReport("analytics")
+    transfer.import_batch("analytics", _lines("a", "b", "c"), report)
+    assert sorted(rows) == ["a", "c"]
+    assert report.inserted == 2
+    assert report.errors == [{"line": 2, "slug": "b", "error": "Data too long for column 'title'"}]
+
+
+def test_lost_connection_fails_the_import(table):
+    _, failures = table
+    failures["b"] = pymysql.err.OperationalError(2013, "Lost connection to MySQL server during query")
+    report = transfer.ImportReport("analytics")
+    with pytest.raises(pymysql.err.OperationalError):
+        transfer.import_batch("analytics", _lines("a", "b", "c"), report)
+    assert report.failed == 0
@@ -99,7 +99,9 @@ export default function AnalyticSlugPage({
     let mounted = true;
     async function loadNotebook() {
       try {
-        const res = await fetch(fileUrl);
+        // slimmed notebook: large outputs are loaded as separate assets
+        let res = await fetch(`${API_BASE}/api/analytics/${slug}/notebook`);
+        if (!res.ok) res = await fetch(fileUrl);
         if (!res.ok) {
           setNotebookError(
             `Failed to fetch notebook: ${res.status} ${res.statusText}`
@@ -129,7 +131,7 @@ export default function AnalyticSlugPage({
     return () => {
       mounted = false;
     };
-  }, [item, fileUrl]);
+  }, [item, fileUrl, slug]);
 
   // helper for react-pdf
   function onDocumentLoadSuccess({ numPages: np }: { numPages: number }) {
@@ -16,7 +16,7 @@ export default function AnalyticsPage() {
 
   async function fetchPage() {
     setLoading(true);
-    const res = await listAnalytic(skip, limit);
+    const res = await listAnalytic(skip, limit, true);
     if (res.ok) setItems((res as any).data || []);
     setLoading(false);
   }
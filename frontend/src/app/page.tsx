@@ -35,8 +35,8 @@ export default async function Home() {
   }
 
   const [works, thoughts] = await Promise.all([
-    fetchJson(`${BASE}/api/works/?limit=3`),
-    fetchJson(`${BASE}/api/thoughts/?limit=3`),
+    fetchJson(`${BASE}/api/works/?limit=3&published=true`),
+    fetchJson(`${BASE}/api/thoughts/?limit=3&published=true`),
   ]);
 
   return (
@@ -16,7 +16,7 @@ export default function Thoughts() {
     let mounted = true;
     setLoading(true);
     api
-      .listThoughts(page * pageSize, pageSize)
+      .listThoughts(page * pageSize, pageSize, true)
       .then((res) => {
         if (!mounted) return;
         if (res.ok) {
@@ -25,7 +25,7 @@ export default function WorksPage() {
 
   useEffect(() => {
     const base = process.env.NEXT_PUBLIC_API_BASE || "http://localhost:6363";
-    fetch(`${base}/api/works/`)
+    fetch(`${base}/api/works/?published=true`)
       .then((r) => {
         if (!r.ok) throw new Error("Failed to load");
         return r.json();
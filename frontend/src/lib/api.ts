@@ -145,8 +145,9 @@ export function authLogout() {
   setAuthToken(undefined);
 }
 
-export async function listThoughts(skip = 0, limit = 10) {
-  return call(`/api/thoughts/?skip=${skip}&limit=${limit}`);
+export async function listThoughts(skip = 0, limit = 10, publishedOnly = false) {
+  const published = publishedOnly ? "&published=true" : "";
+  return call(`/api/thoughts/?skip=${skip}&limit=${limit}${published}`);
 }
 
 export async function getThought(slug: string) {
@@ -216,8 +217,9 @@ export async function deleteThought(slug: string) {
   });
 }
 
-export async function listWorks(skip = 0, limit = 10) {
-  return call(`/api/works/?skip=${skip}&limit=${limit}`);
+export async function listWorks(skip = 0, limit = 10, publishedOnly = false) {
+  const published = publishedOnly ? "&published=true" : "";
+  return call(`/api/works/?skip=${skip}&limit=${limit}${published}`);
 }
 
 export async function getWork(slug: string) {
@@ -239,8 +241,9 @@ export async function deleteWork(slug: string) {
   return call(`/api/works/${encodeURIComponent(slug)}`, { method: "delete" });
 }
 
-export async function listAnalytic(skip = 0, limit = 10) {
-  return call(`/api/analytics/?skip=${skip}&limit=${limit}`);
+export async function listAnalytic(skip = 0, limit = 10, publishedOnly = false) {
+  const published = publishedOnly ? "&published=true" : "";
+  return call(`/api/analytics/?skip=${skip}&limit=${limit}${published}`);
 }
 
 export async function getAnalytic(slug: string) {